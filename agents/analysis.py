@@ -2,6 +2,7 @@ import logging
 from typing import Any, AsyncIterator, Dict
 
 from config.language_styles import LANGUAGE_STYLES
+from core.context import context_builder
 from core.models import AnalysisResult, PipelineState
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
@@ -18,7 +19,7 @@ class InitialAnalysisAgent(BaseAgent):
         language = state.get("language", "中文")
         understanding = state.get("understanding")
         web_results = state.get("web_search_results")
-        conversation_history = state.get("conversation_history", "")
+        conversation_history = context_builder.for_stage(state, "analysis")
 
         try:
             context_parts = [f"User Query: {query}"]
@@ -68,7 +69,7 @@ class InitialAnalysisAgent(BaseAgent):
         language = state.get("language", "中文")
         understanding = state.get("understanding")
         web_results = state.get("web_search_results")
-        conversation_history = state.get("conversation_history", "")
+        conversation_history = context_builder.for_stage(state, "analysis")
 
         try:
             context_parts = [f"User Query: {query}"]
@@ -132,7 +133,7 @@ class DetailedAnalysisAgent(BaseAgent):
         query = state["query"]
         language = state.get("language", "中文")
         initial = state.get("initial_analysis", "")
-        conversation_history = state.get("conversation_history", "")
+        conversation_history = context_builder.for_stage(state, "detailed")
 
         try:
             context = f"Query: {query}\n\nInitial Analysis: {initial}"
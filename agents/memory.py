@@ -0,0 +1,50 @@
+import logging
+from typing import Any, Dict, List
+
+from config.settings import MEMORY_MESSAGE_TOKENS, MEMORY_SUMMARY_TOKENS
+from core.context import ROLE_LABELS, condense
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from agents.base import BaseAgent
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryAgent(BaseAgent):
+    """将新移出窗口的消息合并进已有摘要（增量更新，不重新读取全部历史）"""
+
+    def fold(
+        self, previous: str, messages: List[Dict[str, Any]], language: str = "中文"
+    ) -> str:
+        # 每条消息先压缩，合并请求的输入长度与会话长度无关
+        transcript = "\n".join(
+            f"{ROLE_LABELS.get(m['role'], m['role'])}: "
+            + condense(m["content"] or "", MEMORY_MESSAGE_TOKENS)
+            for m in messages
+        )
+
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                (
+                    "system",
+                    f"""You maintain the running memory of a long conversation.
+Update the existing summary with the new turns below and output ONLY the updated summary, written in {language}.
+
+Rules:
+1. Keep facts, decisions, constraints, user preferences and open questions; drop greetings and filler
+2. Keep names, versions, numbers and identifiers exactly as written
+3. When a new turn changes an earlier decision, record the latest state instead of both
+4. Stay under about {MEMORY_SUMMARY_TOKENS} tokens; compress older details first""",
+                ),
+                (
+                    "human",
+                    "Existing summary:\n{previous}\n\nNew turns:\n{transcript}",
+                ),
+            ]
+        )
+
+        chain = prompt | self.llm | StrOutputParser()
+        return chain.invoke(
+            {"previous": previous or "(empty)", "transcript": transcript}
+        ).strip()
@@ -1,64 +1,240 @@
+import asyncio
+import hashlib
 import logging
+import re
+import time
+from functools import partial
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
 
-from config.settings import tavily_config
-from core.models import PipelineState, WebSearchResult
+from config.settings import (
+    SEARCH_FANOUT_GRACE,
+    SEARCH_FANOUT_MAX,
+    SEARCH_LATENCY_BUDGET,
+    SEARCH_MERGED_RESULTS,
+)
+from core.models import PipelineState, ProcessingMode, WebSearchResult
+from core.passages import format_passages, passage_capacity, select_passages
+from core.search_policy import SearchPlan, search_policy
+from database.search_cache import normalize_query, search_cache
+from utils.search_providers import search_provider
 
 logger = logging.getLogger(__name__)
 
-try:
-    from tavily import TavilyClient
+# 倒数排名融合的平滑常数（常用取值 60）
+RRF_K = 60
 
-    tavily_client = (
-        TavilyClient(api_key=tavily_config.api_key)
-        if tavily_config.is_configured
-        else None
+# 正文规范化后短于该长度时不参与按内容去重（空正文或片段会把不同结果误判为重复）
+MIN_CONTENT_KEY_CHARS = 80
+
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|fbclid|gclid|ref|spm)$", re.I)
+
+
+def derive_queries(query: str, key_concepts: Sequence[str]) -> List[str]:
+    """原问题 + 由关键概念派生的子查询（每个子查询两个概念），按规范化结果去重"""
+    queries = [query]
+    seen = {normalize_query(query)}
+    concepts = [c.strip() for c in key_concepts if c and c.strip()]
+    for i in range(0, len(concepts), 2):
+        if len(queries) >= SEARCH_FANOUT_MAX:
+            break
+        sub_query = " ".join(concepts[i : i + 2])
+        if normalize_query(sub_query) not in seen:
+            seen.add(normalize_query(sub_query))
+            queries.append(sub_query)
+    return queries
+
+
+def _url_key(url: str) -> str:
+    """忽略协议、www、结尾斜杠、锚点与跟踪参数"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    query = urlencode(
+        sorted(
+            (k, v)
+            for k, v in parse_qsl(parts.query)
+            if not _TRACKING_PARAMS.match(k)
+        )
     )
-except ImportError:
-    tavily_client = None
+    return f"{host}{parts.path.rstrip('/')}?{query}"
+
+
+def _content_key(content: Optional[str]) -> Optional[str]:
+    text = re.sub(r"\s+", " ", content or "").strip().lower()
+    if len(text) < MIN_CONTENT_KEY_CHARS:
+        return None
+    return hashlib.blake2b(text[:300].encode("utf-8"), digest_size=8).hexdigest()
+
+
+def fuse_results(
+    ranked_lists: Sequence[List[Dict[str, Any]]], limit: int = SEARCH_MERGED_RESULTS
+) -> List[Dict[str, Any]]:
+    """倒数排名融合：同一 URL（或相同正文）在多个子查询中出现时累加 1 / (k + rank)"""
+    fused: Dict[str, Dict[str, Any]] = {}
+    scores: Dict[str, float] = {}
+    aliases: Dict[str, str] = {}
+    for list_no, results in enumerate(ranked_lists):
+        for rank, result in enumerate(results, 1):
+            keys = [
+                k
+                for k in (
+                    _url_key(result["url"]) if result.get("url") else None,
+                    _content_key(result.get("content")),
+                )
+                if k
+            ]
+            if not keys:
+                # 既无 URL 也无足够长的正文：无法判断是否重复，单独保留
+                keys = [f"#{list_no}:{rank}"]
+            key = next((aliases[k] for k in keys if k in aliases), keys[0])
+            for k in keys:
+                aliases.setdefault(k, key)
+            fused.setdefault(key, result)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+
+    ordered = sorted(fused, key=lambda k: -scores[k])[:limit]
+    return [{**fused[k], "rrf_score": round(scores[k], 6)} for k in ordered]
 
 
 class WebSearchAgent:
     def search(self, state: PipelineState) -> PipelineState:
-        understanding = state.get("understanding")
+        """同步版本（LangGraph 节点）：搜索客户端有自己的事件循环，这里只需临时驱动协程"""
+        return asyncio.run(self.search_async(state))
 
-        if not understanding or not understanding.requires_web_search:
-            logger.info("Web search skipped")
+    async def search_async(self, state: PipelineState) -> PipelineState:
+        """异步版本（流式管线）：原问题与子查询并行搜索，等待时不阻塞事件循环"""
+        if not self._should_search(state):
             return state
+        try:
+            query = state["query"]
+            understanding = state["understanding"]
+            queries = derive_queries(query, understanding.key_concepts)
+            elapsed = time.monotonic() - state.get("started_at", time.monotonic())
+            await search_policy.refresh()
+            plan = search_policy.choose(
+                state.get("domain"),
+                state.get("processing_mode", ProcessingMode.BASIC),
+                SEARCH_LATENCY_BUDGET - elapsed,
+            )
+            logger.info(f"Searching: {queries} ({plan.depth}, {plan.max_results}, {plan.reason})")
+            outcomes = await self._fan_out(queries, state.get("domain"), plan)
 
-        if not tavily_client:
-            logger.warning("Tavily not configured")
-            state["web_search_results"] = WebSearchResult(
-                query=state["query"], results=[], summary="Web search unavailable"
+            ranked = [response.get("results", []) for response, _ in outcomes if response]
+            primary = outcomes[0]
+            if primary[0] is None and not any(ranked):
+                raise primary[1]
+            self._apply(
+                state,
+                query,
+                fuse_results(ranked),
+                primary[1] if isinstance(primary[1], str) else None,
+                understanding.key_concepts,
+                plan,
             )
-            return state
+        except Exception as e:
+            self._fail(state, e)
+        return state
 
-        try:
-            query = state["query"]
-            logger.info(f"Searching: {query}")
+    async def _fan_out(
+        self, queries: List[str], domain: Optional[str], plan: SearchPlan
+    ) -> List[Tuple[Optional[Dict[str, Any]], Any]]:
+        """返回与 queries 一一对应的 (响应, 缓存状态)；失败或超时的为 (None, 异常)
 
-            search_results = tavily_client.search(
-                query=query, search_depth="advanced", max_results=5
+        额外的子查询不增加整体耗时：原问题返回后最多再等 SEARCH_FANOUT_GRACE 秒。
+        """
+        deadline = time.monotonic() + plan.deadline
+        tasks = [asyncio.create_task(self._fetch(q, domain, plan.params)) for q in queries]
+        await asyncio.wait(tasks[:1], timeout=plan.deadline)
+        if len(tasks) > 1:
+            await asyncio.wait(
+                tasks[1:],
+                timeout=max(0.0, min(SEARCH_FANOUT_GRACE, deadline - time.monotonic())),
             )
 
-            results = search_results.get("results", [])
-            summary_parts = []
-            for i, result in enumerate(results, 1):
-                summary_parts.append(
-                    f"{i}. {result.get('title', 'Untitled')}: {result.get('content', '')[:200]}..."
+        outcomes = []
+        for q, task in zip(queries, tasks):
+            if not task.done():
+                task.cancel()
+                outcomes.append((None, asyncio.TimeoutError(f"Search timed out: {q}")))
+            elif task.exception() is not None:
+                outcomes.append((None, task.exception()))
+            else:
+                outcomes.append(task.result())
+        return outcomes
+
+    async def _fetch(
+        self, query: str, domain: Optional[str], params: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
+        """单个查询：先查缓存（过期结果照常返回并后台刷新），未命中时搜索并写入缓存"""
+        if not search_provider.cacheable:
+            return await search_provider.search(query, **params), None
+
+        # 缓存键包含后端名称与搜索参数，切换后端或策略后不会返回另一组参数的结果
+        cache_params = {**params, "provider": search_provider.name}
+        cached = await asyncio.to_thread(search_cache.lookup, query, cache_params)
+        if cached is not None:
+            if cached.stale:
+                search_cache.revalidate(
+                    query,
+                    cache_params,
+                    domain,
+                    partial(search_provider.search_sync, query, **params),
                 )
+            return cached.response, "stale" if cached.stale else "hit"
+        response = await search_provider.search(query, **params)
+        await asyncio.to_thread(search_cache.store, query, cache_params, domain, response)
+        return response, "miss"
 
-            state["web_search_results"] = WebSearchResult(
-                query=query,
-                results=results,
-                summary="\n".join(summary_parts) if summary_parts else "No results",
-            )
+    def _should_search(self, state: PipelineState) -> bool:
+        understanding = state.get("understanding")
 
-            logger.info(f"Found {len(results)} results")
+        if not understanding or not understanding.requires_web_search:
+            logger.info("Web search skipped")
+            return False
 
-        except Exception as e:
-            logger.error(f"Web search failed: {e}", exc_info=True)
+        if not search_provider:
+            logger.warning("Search provider not configured")
             state["web_search_results"] = WebSearchResult(
-                query=state["query"], results=[], summary=f"Search error: {str(e)}"
+                query=state["query"], results=[], summary="Web search unavailable"
             )
+            return False
+        return True
 
-        return state
+    def _apply(
+        self,
+        state: PipelineState,
+        query: str,
+        results: List[Dict[str, Any]],
+        cache: Optional[str] = None,
+        key_concepts: Sequence[str] = (),
+        plan: Optional[SearchPlan] = None,
+    ):
+        """摘要只保留与问题最相关的段落（BM25），总量受 SEARCH_CONTEXT_TOKENS 限制"""
+        passages = select_passages(results, query, key_concepts)
+        # 预算内最多能覆盖的结果数：结果多于预算容量时，未被选入的结果不计为无用，
+        # 有用率才不会随 max_results 增大而机械下降
+        slots = min(len(results), passage_capacity(results))
+
+        state["web_search_results"] = WebSearchResult(
+            query=query,
+            results=results,
+            summary=format_passages(results, passages) if passages else "No results",
+            cache=cache,
+            depth=plan.depth if plan else None,
+            max_results=plan.max_results if plan else None,
+            policy=plan.reason if plan else None,
+            # 有用率：有相关段落被选入上下文的结果数 / 预算内可覆盖的结果数，供搜索策略参考
+            useful=(
+                len({p.source for p in passages if p.score > 0}) / slots
+                if slots
+                else None
+            ),
+        )
+
+        logger.info(f"Found {len(results)} results, kept {len(passages)} passages")
+
+    def _fail(self, state: PipelineState, e: Exception):
+        logger.error(f"Web search failed: {e}", exc_info=True)
+        state["web_search_results"] = WebSearchResult(
+            query=state["query"], results=[], summary=f"Search error: {str(e)}"
+        )
@@ -1,6 +1,8 @@
 import logging
 
 from config.language_styles import LANGUAGE_STYLES
+from config.settings import DIGEST_TOKENS
+from core.context import condense, strip_code_blocks
 from core.models import PipelineState
 
 logger = logging.getLogger(__name__)
@@ -111,4 +113,24 @@ class SynthesisAgent:
             response_parts.append(disclaimers["legal_disclaimer"])
 
         state["final_answer"] = "\n".join(response_parts)
+        state["digest"] = self.digest(state)
         return state
+
+    def digest(self, state: PipelineState) -> str:
+        """本轮的精简摘要：只保留核心回答，不含需求理解、搜索列表、反思要点与代码正文"""
+        reflection = state.get("reflection")
+        final_analysis = state.get("final_analysis")
+        artifacts = state.get("artifacts", [])
+
+        core = (
+            reflection.refined_answer if reflection else state.get("initial_analysis")
+        ) or ""
+        parts = [condense(strip_code_blocks(core), DIGEST_TOKENS)]
+        if final_analysis and final_analysis.tech_stack:
+            parts.append(f"技术栈: {', '.join(final_analysis.tech_stack)}")
+        if artifacts:
+            parts.append(
+                "代码文件: "
+                + ", ".join(f"{a.title} ({a.language})" for a in artifacts)
+            )
+        return "\n".join(part for part in parts if part)
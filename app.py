@@ -4,11 +4,15 @@ from datetime import datetime
 
 import streamlit as st
 from core.pipeline import pipeline
+from database.backfill import start_backfill
 from database.session import session_mgr
 from utils.logger import setup_logging
 
 setup_logging()
 
+# 后台为旧格式数据加上显式格式头、为历史消息补建检索索引（每个进程只启动一次）
+start_backfill()
+
 # 页面配置
 st.set_page_config(
     page_title="AgenticAI v1.0",
@@ -466,8 +470,14 @@ with st.sidebar:
         st.session_state.messages = []
         st.rerun()
     
-    sessions = session_mgr.list_sessions()
-    
+    search_query = st.text_input(
+        "搜索会话",
+        placeholder="🔍 搜索历史会话...",
+        key="session_search",
+        label_visibility="collapsed"
+    )
+    sessions = session_mgr.search(search_query) if search_query.strip() else session_mgr.list_sessions()
+
     if sessions:
         session_options = {}
         for s in sessions:
@@ -475,9 +485,9 @@ with st.sidebar:
             summary = s.get("summary", "").strip()
             
             if not summary:
-                messages = session_mgr.get_messages(session_id, limit=1)
-                if messages and messages[0]["role"] == "user":
-                    first_msg = messages[0]["content"]
+                first = session_mgr.get_first_message(session_id)
+                if first and first["role"] == "user":
+                    first_msg = first["content"]
                     summary = first_msg[:40] + "..." if len(first_msg) > 40 else first_msg
                 else:
                     summary = "(New Chat)"
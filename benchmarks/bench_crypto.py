@@ -0,0 +1,71 @@
+"""加密吞吐基准：旧版 encrypt/decrypt（Fernet + base64 文本）与 BLOB 格式的 V2（Fernet）、
+V3（会话数据密钥 + AEAD）对比
+
+用法: python -m benchmarks.bench_crypto [--count 5000] [--size 2000] [--compress]
+"""
+
+import argparse
+import os
+import time
+
+import utils.crypto as crypto
+from utils.crypto import CIPHERS, ContentEncryptor, cipher_id_for
+
+
+class _MemoryKeyStore:
+    def __init__(self):
+        self._keys = {}
+
+    def load(self, session_id):
+        return self._keys.get(session_id)
+
+    def save(self, session_id, wrapped_key):
+        return self._keys.setdefault(session_id, wrapped_key)
+
+
+def _run(label, texts, encrypt, decrypt):
+    start = time.perf_counter()
+    values = [encrypt(t) for t in texts]
+    enc_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for value in values:
+        decrypt(value)
+    dec_elapsed = time.perf_counter() - start
+
+    mb = sum(len(t.encode("utf-8")) for t in texts) / 1024 / 1024
+    print(
+        f"{label:<22} encrypt={mb / enc_elapsed:>8.1f} MB/s  "
+        f"decrypt={mb / dec_elapsed:>8.1f} MB/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=2000, help="每条文本字节数")
+    parser.add_argument("--compress", action="store_true", help="包含压缩开销")
+    args = parser.parse_args()
+
+    if not args.compress:
+        # 默认只衡量加解密本身
+        crypto.STORAGE_COMPRESSION_THRESHOLD = float("inf")
+    texts = [os.urandom(args.size // 2).hex() for _ in range(args.count)]
+
+    encryptor = ContentEncryptor()
+    _run("legacy (fernet+b64)", texts, encryptor.encrypt, encryptor.decrypt)
+    _run("v2 (fernet blob)", texts, encryptor.encrypt_bytes, encryptor.decrypt_value)
+
+    encryptor.set_key_store(_MemoryKeyStore())
+    for cipher_id, (name, _) in CIPHERS.items():
+        encryptor.cipher_id = cipher_id_for(name)
+        _run(
+            f"v3 ({name})",
+            texts,
+            lambda t: encryptor.encrypt_bytes(t, "bench"),
+            lambda v: encryptor.decrypt_value(v, "bench"),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""搜索客户端基准：本地桩服务器模拟 Tavily，对比连接池复用与每次新建会话的延迟 / 吞吐
+
+桩服务器按 --latency 延迟响应，--error-rate 比例返回 503（验证重试），不访问外网。
+
+用法: python -m benchmarks.bench_search [--requests 200] [--concurrency 16] [--latency 0.05]
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+
+from utils.tavily import TavilyClient
+
+
+def _stub_app(latency: float, error_rate: float) -> web.Application:
+    async def search(request: web.Request) -> web.Response:
+        payload = await request.json()
+        await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return web.Response(status=503, text="stub overloaded")
+        return web.json_response(
+            {
+                "query": payload["query"],
+                "results": [
+                    {
+                        "title": f"Result {i}",
+                        "url": f"https://example.com/{i}",
+                        "content": "stub " * 40,
+                    }
+                    for i in range(payload.get("max_results", 5))
+                ],
+            }
+        )
+
+    app = web.Application()
+    app.router.add_post("/search", search)
+    return app
+
+
+def _report(label: str, latencies, elapsed: float):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:<18} p50={statistics.median(latencies) * 1000:>7.1f} ms  "
+        f"p95={p95 * 1000:>7.1f} ms  throughput={len(latencies) / elapsed:>7.1f} req/s"
+    )
+
+
+async def _bench_client(client: TavilyClient, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await client.search(f"query {i}", max_results=5)
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, time.perf_counter() - start
+
+
+async def _bench_unpooled(url: str, requests: int, concurrency: int):
+    """对照组：每次请求新建会话与连接（与原同步客户端的连接行为一致）"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    f"{url}/search", json={"query": f"query {i}", "max_results": 5}
+                ) as response:
+                    await response.json()
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, time.perf_counter() - start
+
+
+async def main_async(args):
+    runner = web.AppRunner(_stub_app(args.latency, args.error_rate))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f"http://{host}:{port}"
+
+    client = TavilyClient(
+        "stub-key", base_url=url, max_concurrency=args.concurrency, timeout=10
+    )
+    try:
+        _report("pooled client", *await _bench_client(client, args.requests, args.concurrency))
+        if args.error_rate == 0:
+            _report(
+                "new session/call",
+                *await _bench_unpooled(url, args.requests, args.concurrency),
+            )
+    finally:
+        await asyncio.to_thread(client.close)
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务器响应延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的比例")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""存储格式基准：旧格式（TEXT + 双重 base64）与 BLOB 格式的库文件大小和解密吞吐
+
+用法: python -m benchmarks.bench_storage [--rows 2000] [--size 1200]
+"""
+
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from utils.crypto import encryptor
+
+from database.manager import DatabaseManager
+
+
+def _sample_text(size: int) -> str:
+    words = ["".join(random.choices(string.ascii_lowercase, k=6)) for _ in range(200)]
+    words += ["会话", "加密", "存储", "分析", "架构", "代码"]
+    text = []
+    while sum(len(w) + 1 for w in text) < size:
+        text.append(random.choice(words))
+    return " ".join(text)[:size]
+
+
+def _bench(label: str, path: Path, texts, encode, decode):
+    manager = DatabaseManager(path)
+    with manager.get_connection() as conn:
+        conn.execute(
+            "INSERT INTO sessions (session_id, title, domain, created_at, updated_at) "
+            "VALUES ('bench', 'bench', 'general', 0, 0)"
+        )
+        conn.executemany(
+            "INSERT INTO messages (session_id, role, content, created_at) "
+            "VALUES ('bench', 'assistant', ?, 0)",
+            [(encode(t),) for t in texts],
+        )
+    with manager.get_connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    with manager.get_connection() as conn:
+        rows = conn.execute("SELECT content FROM messages").fetchall()
+        payload = conn.execute("SELECT SUM(length(content)) FROM messages").fetchone()[0]
+    start = time.perf_counter()
+    for row in rows:
+        decode(row["content"])
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{label:<8} payload={payload / 1024:>10.1f} KiB  "
+        f"db={os.path.getsize(path) / 1024:>10.1f} KiB  "
+        f"decrypt={len(rows) / elapsed:>10.0f} rows/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=1200, help="每条消息字符数")
+    args = parser.parse_args()
+
+    texts = [_sample_text(args.size) for _ in range(args.rows)]
+    print(f"rows={args.rows} plaintext={args.rows * args.size / 1024:.1f} KiB")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _bench("legacy", Path(tmp) / "legacy.db", texts, encryptor.encrypt, encryptor.decrypt)
+        _bench("blob", Path(tmp) / "blob.db", texts, encryptor.encrypt_bytes, encryptor.decrypt_value)
+
+
+if __name__ == "__main__":
+    main()
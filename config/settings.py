@@ -12,10 +12,128 @@ DATABASE_DIR = PROJECT_ROOT / "database" / "db"
 DATABASE_DIR.mkdir(parents=True, exist_ok=True)
 DATABASE_PATH = DATABASE_DIR / "agent_system.db"
 
+# 存储后端: single（单文件，默认）或 sharded（按 session_id 哈希分布到多个文件）
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "single")
+STORAGE_SHARDS = int(os.getenv("STORAGE_SHARDS", "8"))
+SHARD_DIR = DATABASE_DIR / "shards"
+
+# 归档库与保留期（天）：已删除会话 / 长期未更新的会话移入归档库，0 表示不归档
+ARCHIVE_PATH = DATABASE_DIR / "archive.db"
+RETENTION_DELETED_DAYS = float(os.getenv("RETENTION_DELETED_DAYS", "30"))
+RETENTION_STALE_DAYS = float(os.getenv("RETENTION_STALE_DAYS", "0"))
+
 LOGS_DIR = PROJECT_ROOT / "logs"
 LOGS_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE = LOGS_DIR / "agent_system.log"
 
+# 超过该字节数的明文在加密前压缩
+STORAGE_COMPRESSION_THRESHOLD = int(os.getenv("STORAGE_COMPRESSION_THRESHOLD", "1024"))
+
+# 会话数据的 AEAD 算法（aes-gcm / chacha20-poly1305）与解包后数据密钥的缓存数量
+STORAGE_CIPHER = os.getenv("STORAGE_CIPHER", "aes-gcm")
+DATA_KEY_CACHE_SIZE = int(os.getenv("DATA_KEY_CACHE_SIZE", "256"))
+
+# 批量解密：每批行数与线程池大小
+DECRYPT_BATCH_SIZE = int(os.getenv("DECRYPT_BATCH_SIZE", "64"))
+DECRYPT_WORKERS = int(os.getenv("DECRYPT_WORKERS", "4"))
+
+# 异步数据库访问的专用线程数（流式管道中的读写不在事件循环线程上执行）
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "4"))
+
+# SessionManager 进程内缓存的会话数量（0 表示禁用）
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "64"))
+
+# 对话上下文：读取的最近消息数、各阶段的 token 预算、打包结果缓存条数
+CONTEXT_HISTORY_LIMIT = int(os.getenv("CONTEXT_HISTORY_LIMIT", "40"))
+CONTEXT_BUDGETS = {
+    "analysis": int(os.getenv("CONTEXT_BUDGET_ANALYSIS", "1500")),
+    "detailed": int(os.getenv("CONTEXT_BUDGET_DETAILED", "800")),
+}
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "256"))
+
+# 会话滚动摘要：最近 MEMORY_TAIL_MESSAGES 条消息原样保留，更早的消息累计到
+# MEMORY_FOLD_MIN 条后由后台合并进摘要，每次最多合并 MEMORY_FOLD_BATCH 条
+MEMORY_TAIL_MESSAGES = int(os.getenv("MEMORY_TAIL_MESSAGES", "10"))
+MEMORY_FOLD_MIN = int(os.getenv("MEMORY_FOLD_MIN", "4"))
+MEMORY_FOLD_BATCH = int(os.getenv("MEMORY_FOLD_BATCH", "20"))
+# 摘要在上下文中最多占用的 token 数 / 合并时每条消息压缩到的 token 数
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "400"))
+MEMORY_MESSAGE_TOKENS = int(os.getenv("MEMORY_MESSAGE_TOKENS", "300"))
+# 助手消息摘要（去掉需求理解、搜索列表与代码正文后的核心回答）的 token 上限
+DIGEST_TOKENS = int(os.getenv("DIGEST_TOKENS", "300"))
+
+# 长期向量记忆：消息分块嵌入后按会话写入数据库文件旁的 *.vectors 目录（memmap）
+# 向量未加密，开启前需确认该目录与数据库文件受到同等保护
+VECTOR_MEMORY_ENABLED = os.getenv("VECTOR_MEMORY_ENABLED", "false").lower() == "true"
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "256"))
+VECTOR_CHUNK_CHARS = int(os.getenv("VECTOR_CHUNK_CHARS", "1500"))
+# 嵌入请求按批发送：攒满 VECTOR_BATCH_SIZE 个分块或等待 VECTOR_BATCH_DELAY 秒
+VECTOR_BATCH_SIZE = int(os.getenv("VECTOR_BATCH_SIZE", "64"))
+VECTOR_BATCH_DELAY = float(os.getenv("VECTOR_BATCH_DELAY", "0.5"))
+VECTOR_TOP_K = int(os.getenv("VECTOR_TOP_K", "4"))
+VECTOR_MIN_SCORE = float(os.getenv("VECTOR_MIN_SCORE", "0.3"))
+# 召回的历史消息在上下文中最多占用的 token 数
+VECTOR_MEMORY_TOKENS = int(os.getenv("VECTOR_MEMORY_TOKENS", "400"))
+
+# 会话全文检索：每条消息最多索引的不同 token 数（按词频保留）
+SEARCH_INDEX_MAX_TOKENS = int(os.getenv("SEARCH_INDEX_MAX_TOKENS", "1000"))
+
+# Tavily 搜索客户端：连接池复用、单次请求超时、失败重试与全局并发上限
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com")
+TAVILY_SEARCH_DEPTH = os.getenv("TAVILY_SEARCH_DEPTH", "advanced")
+TAVILY_TIMEOUT = float(os.getenv("TAVILY_TIMEOUT", "15"))
+TAVILY_CONNECT_TIMEOUT = float(os.getenv("TAVILY_CONNECT_TIMEOUT", "5"))
+TAVILY_MAX_RETRIES = int(os.getenv("TAVILY_MAX_RETRIES", "2"))
+TAVILY_MAX_CONCURRENCY = int(os.getenv("TAVILY_MAX_CONCURRENCY", "4"))
+
+# 搜索结果缓存：按类别设置新鲜期（秒）；过期后 SEARCH_CACHE_STALE_FACTOR 倍新鲜期内
+# 仍直接返回旧结果并在后台刷新（stale-while-revalidate），超出后同步重新搜索
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_TTL = {
+    "news": int(os.getenv("SEARCH_CACHE_TTL_NEWS", "1800")),
+    "general": int(os.getenv("SEARCH_CACHE_TTL_GENERAL", "86400")),
+    "Arch/DEV": int(os.getenv("SEARCH_CACHE_TTL_DEV", "259200")),
+    "medical": int(os.getenv("SEARCH_CACHE_TTL_MEDICAL", "604800")),
+    "legal": int(os.getenv("SEARCH_CACHE_TTL_LEGAL", "604800")),
+}
+SEARCH_CACHE_STALE_FACTOR = float(os.getenv("SEARCH_CACHE_STALE_FACTOR", "2"))
+
+# 多查询并行搜索：原问题加上由关键概念派生的子查询，最多 SEARCH_FANOUT_MAX 个；
+# 原问题返回后其余子查询最多再等 SEARCH_FANOUT_GRACE 秒，整体不超过 SEARCH_DEADLINE 秒
+SEARCH_FANOUT_MAX = int(os.getenv("SEARCH_FANOUT_MAX", "4"))
+SEARCH_FANOUT_GRACE = float(os.getenv("SEARCH_FANOUT_GRACE", "0.5"))
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", "20"))
+# 合并（URL / 内容去重 + 倒数排名融合）后保留的结果数
+SEARCH_MERGED_RESULTS = int(os.getenv("SEARCH_MERGED_RESULTS", "8"))
+# 搜索结果按与问题的相关度（BM25）选取段落，放入提示词的 token 上限
+SEARCH_CONTEXT_TOKENS = int(os.getenv("SEARCH_CONTEXT_TOKENS", "1200"))
+
+# 搜索后端: tavily（默认）或 local（本地文档库倒排索引，离线环境使用）；其他值在启动时报错
+SEARCH_PROVIDER = os.getenv("SEARCH_PROVIDER", "tavily")
+# 本地文档库索引目录（python -m utils.corpus build 生成）与分块大小（字符）
+LOCAL_CORPUS_INDEX = Path(os.getenv("LOCAL_CORPUS_INDEX", str(DATABASE_DIR / "corpus")))
+LOCAL_CORPUS_CHUNK_CHARS = int(os.getenv("LOCAL_CORPUS_CHUNK_CHARS", "1200"))
+
+# 搜索策略：各领域默认的 (搜索深度, 结果数)；深度思考模式升级为 advanced 并多取结果
+SEARCH_POLICY_DEFAULTS = {
+    "general": ("basic", 3),
+    "Arch/DEV": ("basic", 5),
+    "medical": ("advanced", 5),
+    "legal": ("advanced", 5),
+}
+SEARCH_MAX_RESULTS_LIMIT = int(os.getenv("SEARCH_MAX_RESULTS_LIMIT", "10"))
+# 从本轮开始到搜索结束的延迟预算（秒）；预计耗时超出剩余预算时降级为 basic。
+# 预算只影响深度选择与截止时长的上限，截止时长不短于所选深度预计耗时的两倍
+SEARCH_LATENCY_BUDGET = float(os.getenv("SEARCH_LATENCY_BUDGET", "12"))
+# 历史统计（runs 表）的时间窗口（天）、刷新间隔（秒）与生效所需的最少样本数
+SEARCH_POLICY_WINDOW_DAYS = float(os.getenv("SEARCH_POLICY_WINDOW_DAYS", "14"))
+SEARCH_POLICY_REFRESH = float(os.getenv("SEARCH_POLICY_REFRESH", "600"))
+SEARCH_POLICY_MIN_SAMPLES = int(os.getenv("SEARCH_POLICY_MIN_SAMPLES", "20"))
+# advanced 的有用率（有段落被选入上下文的结果占预算可覆盖结果数的比例）比 basic 高出不到该值时改用 basic
+SEARCH_POLICY_MIN_GAIN = float(os.getenv("SEARCH_POLICY_MIN_GAIN", "0.1"))
+# 因无收益改用 basic 时仍按该概率使用 advanced，使 advanced 的历史数据持续更新
+SEARCH_POLICY_EXPLORE = float(os.getenv("SEARCH_POLICY_EXPLORE", "0.05"))
+
 
 class AzureConfig(BaseModel):
     api_key: str = Field(..., env="AZURE_OPENAI_API_KEY")
@@ -1,4 +1,12 @@
 from .models import *
-from .pipeline import pipeline
 
 __all__ = ['pipeline']
+
+
+def __getattr__(name):
+    # 按需加载：导入 core 的子模块（如段落选取）不会创建流水线、打开数据库
+    if name == 'pipeline':
+        from .pipeline import pipeline
+
+        return pipeline
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
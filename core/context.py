@@ -0,0 +1,245 @@
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from config.settings import (
+    CONTEXT_BUDGETS,
+    CONTEXT_CACHE_SIZE,
+    MEMORY_SUMMARY_TOKENS,
+    VECTOR_MEMORY_TOKENS,
+)
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # 未安装或无法加载词表时使用估算
+    _encoding = None
+
+# CJK 字符约 1 token / 字，其他文字约 4 字符 / token
+_CJK_RE = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]")
+
+_CODE_BLOCK_RE = re.compile(r"```.*?(?:```|$)", re.S)
+_CONCLUSION_RE = re.compile(
+    r"^\W*(总结|结论|综上|总之|因此|建议|まとめ|結論|in summary|summary|conclusion|tl;dr)",
+    re.I,
+)
+
+# 剩余预算不足以放下有意义的片段时停止
+MIN_FRAGMENT_TOKENS = 24
+
+ELLIPSIS = "…"
+
+ROLE_LABELS = {"user": "用户", "assistant": "助手"}
+
+SUMMARY_LABEL = "更早对话摘要"
+RECALL_LABEL = "相关的更早对话"
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """按 token 预算截断（保留开头）"""
+    if budget <= 0:
+        return ""
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    # 按比例估算字符数，再逐步收缩到预算以内
+    end = max(1, len(text) * budget // tokens)
+    while end > 1 and estimate_tokens(text[:end]) + 1 > budget:
+        end = end * 9 // 10
+    return text[:end] + ELLIPSIS
+
+
+def _blocks(text: str) -> List[Tuple[int, str]]:
+    """切分为 (优先级, 片段)：代码块 > 结论段落与首段 > 其他"""
+    pieces: List[Tuple[bool, str]] = []
+    last = 0
+    for match in _CODE_BLOCK_RE.finditer(text):
+        pieces.append((False, text[last : match.start()]))
+        pieces.append((True, match.group()))
+        last = match.end()
+    pieces.append((False, text[last:]))
+
+    blocks: List[Tuple[int, str]] = []
+    for is_code, piece in pieces:
+        if is_code:
+            blocks.append((3, piece))
+            continue
+        for paragraph in re.split(r"\n\s*\n", piece):
+            if paragraph.strip():
+                priority = 2 if _CONCLUSION_RE.match(paragraph.strip()) else 0
+                blocks.append((priority, paragraph.strip()))
+
+    # 首段通常直接回答问题，末段通常是结论
+    prose = [i for i, (p, _) in enumerate(blocks) if p < 3]
+    for i in prose[:1] + prose[-1:]:
+        blocks[i] = (max(blocks[i][0], 1), blocks[i][1])
+    return blocks
+
+
+def strip_code_blocks(text: str) -> str:
+    """代码块替换为一行占位（保留语言名）"""
+
+    def placeholder(match) -> str:
+        language = match.group().split("\n", 1)[0].strip("`").strip()
+        return f"[代码: {language}]" if language else "[代码]"
+
+    return _CODE_BLOCK_RE.sub(placeholder, text)
+
+
+def condense(text: str, budget: int) -> str:
+    """在预算内保留代码块与结论，省略铺垫性内容（保持原有顺序）"""
+    blocks = _blocks(text)
+    # 每个片段额外计入换行与可能的省略号
+    costs = [estimate_tokens(block) + 2 for _, block in blocks]
+    order = sorted(range(len(blocks)), key=lambda i: (-blocks[i][0], -i))
+
+    chosen, remaining = set(), budget
+    for i in order:
+        if costs[i] <= remaining:
+            chosen.add(i)
+            remaining -= costs[i]
+    if not chosen:
+        return truncate_to_tokens(blocks[order[0]][1], budget) if blocks else ""
+
+    parts, skipped = [], False
+    for i, (_, block) in enumerate(blocks):
+        if i in chosen:
+            if skipped:
+                parts.append(ELLIPSIS)
+            parts.append(block)
+            skipped = False
+        else:
+            skipped = True
+    if skipped:
+        parts.append(ELLIPSIS)
+    return "\n".join(parts)
+
+
+class ContextBuilder:
+    """按 token 预算打包对话历史：滚动摘要、向量召回的更早消息在前，
+    其后从最新的消息开始放入，放不下的消息压缩后截止
+
+    结果按 (会话, 最后一条消息 id, 预算, 摘要版本, 召回消息) 缓存，
+    同一轮中各阶段与重复请求不会重复打包。
+    """
+
+    def __init__(self, capacity: int = CONTEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(
+        self,
+        session_id: str,
+        messages: Sequence[Dict[str, Any]],
+        budget: int,
+        memory: Optional[Dict[str, Any]] = None,
+        recalled: Sequence[Dict[str, Any]] = (),
+    ) -> str:
+        if not (messages or memory) or budget <= 0:
+            return ""
+        newest = messages[-1].get("id") if messages else None
+        key = (
+            session_id,
+            newest,
+            budget,
+            memory["version"] if memory else 0,
+            tuple(m["id"] for m in recalled),
+        )
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        context = ""
+        if memory:
+            # 摘要已覆盖 upto_id 及之前的消息，近期部分只放其后的消息
+            summary = truncate_to_tokens(
+                memory["summary"], min(MEMORY_SUMMARY_TOKENS, budget // 2)
+            )
+            context = f"{SUMMARY_LABEL}: {summary}"
+            budget -= estimate_tokens(context) + 1
+            messages = [m for m in messages if m.get("id", 0) > memory["upto_id"]]
+
+        # 召回部分预留固定份额，近期消息优先
+        reserve = min(VECTOR_MEMORY_TOKENS, budget // 3) if recalled else 0
+        tail, included = self._pack(messages, budget - reserve)
+        recall = self._recall_block(
+            [
+                m
+                for m in recalled
+                if m["id"] not in included and newest is not None and m["id"] <= newest
+            ],
+            reserve,
+        )
+        context = "\n".join(part for part in (context, recall, tail) if part)
+        with self._lock:
+            self._cache[key] = context
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+        return context
+
+    def _pack(
+        self, messages: Sequence[Dict[str, Any]], budget: int
+    ) -> Tuple[str, Set[Any]]:
+        """返回 (上下文, 已放入的消息 id)"""
+        parts: List[str] = []
+        included: Set[Any] = set()
+        remaining = budget
+        for msg in reversed(messages):
+            prefix = f"{ROLE_LABELS.get(msg['role'], msg['role'])}: "
+            content = msg["content"] or ""
+            cost = estimate_tokens(prefix + content) + 1
+            if cost <= remaining:
+                parts.append(prefix + content)
+                included.add(msg.get("id"))
+                remaining -= cost
+                continue
+            if remaining >= MIN_FRAGMENT_TOKENS:
+                condensed = condense(content, remaining - estimate_tokens(prefix) - 1)
+                if condensed:
+                    parts.append(prefix + condensed)
+                    included.add(msg.get("id"))
+            break
+        return "\n".join(reversed(parts)), included
+
+    def _recall_block(self, recalled: Sequence[Dict[str, Any]], budget: int) -> str:
+        """召回的消息按时间顺序排列，平分预算后各自压缩"""
+        if not recalled or budget < MIN_FRAGMENT_TOKENS:
+            return ""
+        share = (budget - estimate_tokens(RECALL_LABEL) - 1) // len(recalled)
+        parts = [f"{RECALL_LABEL}:"]
+        for msg in sorted(recalled, key=lambda m: m["id"]):
+            prefix = f"{ROLE_LABELS.get(msg['role'], msg['role'])}: "
+            condensed = condense(msg["content"] or "", share - estimate_tokens(prefix) - 1)
+            if condensed:
+                parts.append(prefix + condensed)
+        return "\n".join(parts) if len(parts) > 1 else ""
+
+    def for_stage(self, state: Dict[str, Any], stage: str) -> str:
+        """按阶段预算生成上下文；状态中没有原始历史时退回 conversation_history"""
+        history: Optional[List[Dict[str, Any]]] = state.get("history")
+        if history is None:
+            return state.get("conversation_history", "")
+        return self.build(
+            state["session_id"],
+            history,
+            CONTEXT_BUDGETS[stage],
+            state.get("memory"),
+            state.get("recalled") or (),
+        )
+
+
+context_builder = ContextBuilder()
@@ -0,0 +1,80 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+
+from config.settings import MEMORY_FOLD_BATCH, MEMORY_FOLD_MIN, MEMORY_TAIL_MESSAGES
+from database.memory import memory_store
+
+logger = logging.getLogger(__name__)
+
+
+class MemorySummarizer:
+    """后台维护会话滚动摘要
+
+    每轮回答写入后调度一次：把移出最近窗口的消息与旧摘要一起交给 LLM 生成新摘要。
+    合并在独立的单线程池中执行，不占用数据库线程池，也不阻塞下一轮对话；
+    同一会话已有任务在执行时跳过，未合并的消息由下一次调度继续处理。
+    """
+
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._running: Set[str] = set()
+        self._agent = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="memory"
+                )
+            return self._executor
+
+    def schedule(self, session_id: str, language: str = "中文"):
+        with self._lock:
+            if session_id in self._running:
+                return
+            self._running.add(session_id)
+        self._pool().submit(self._run, session_id, language)
+
+    def _run(self, session_id: str, language: str):
+        try:
+            self.fold_once(session_id, language)
+        except Exception as e:
+            logger.error(f"Memory fold failed: session={session_id}: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._running.discard(session_id)
+
+    def fold_once(self, session_id: str, language: str = "中文") -> bool:
+        """合并一批移出窗口的消息；待合并的消息不足 MEMORY_FOLD_MIN 条时不调用 LLM"""
+        memory = memory_store.get(session_id) or {
+            "summary": "",
+            "upto_id": 0,
+            "version": 0,
+        }
+        messages = memory_store.pending(
+            session_id, memory["upto_id"], MEMORY_TAIL_MESSAGES, MEMORY_FOLD_BATCH
+        )
+        if len(messages) < MEMORY_FOLD_MIN:
+            return False
+
+        if self._agent is None:
+            from agents.memory import MemoryAgent
+
+            self._agent = MemoryAgent()
+        summary = self._agent.fold(memory["summary"], messages, language)
+        if not summary:
+            return False
+        saved = memory_store.save(
+            session_id, summary, messages[-1]["id"], memory["version"]
+        )
+        if saved:
+            logger.info(
+                f"Memory folded: session={session_id}, messages={len(messages)}"
+            )
+        return saved
+
+
+memory_summarizer = MemorySummarizer()
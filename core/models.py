@@ -23,6 +23,11 @@ class WebSearchResult(BaseModel):
     query: str
     results: List[Dict[str, Any]]
     summary: str
+    cache: Optional[str] = None  # 搜索缓存状态：hit / stale / miss
+    depth: Optional[str] = None  # 搜索策略选用的深度：basic / advanced
+    max_results: Optional[int] = None
+    policy: Optional[str] = None  # 策略的决策依据
+    useful: Optional[float] = None  # 有段落被选入上下文的结果数 / 预算内可覆盖的结果数
 
 
 class ReflectionResult(BaseModel):
@@ -51,9 +56,13 @@ class CodeArtifact(BaseModel):
 
 class PipelineState(TypedDict):
     session_id: str
+    started_at: float  # 本轮开始时间（time.monotonic），用于计算剩余延迟预算
     domain: str
     language: str
     query: str
+    history: List[Dict[str, Any]]  # 最近消息，由 core.context 按各阶段 token 预算打包
+    memory: Optional[Dict[str, Any]]  # 会话滚动摘要（summary / upto_id / version）
+    recalled: List[Dict[str, Any]]  # 向量召回的更早消息（附 score）
     conversation_history: str  # 新增：对话历史上下文
     processing_mode: ProcessingMode
     understanding: Optional[UnderstandingResult]
@@ -63,4 +72,5 @@ class PipelineState(TypedDict):
     final_analysis: Optional[AnalysisResult]
     artifacts: List[CodeArtifact]
     final_answer: Optional[str]
+    digest: Optional[str]  # 最终答案的精简摘要，随助手消息保存，用于组装上下文
     error: Optional[str]
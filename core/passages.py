@@ -0,0 +1,148 @@
+import re
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+import numpy as np
+
+from config.settings import SEARCH_CONTEXT_TOKENS
+from core.context import estimate_tokens
+from utils.text import tokenize
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+
+# 关键概念相对原问题的权重
+CONCEPT_WEIGHT = 0.5
+
+# 段落长度上限（字符），由相邻句子合并而成
+PASSAGE_CHARS = 400
+
+_SENTENCE_RE = re.compile(r"(?<=[。！？!?；;])|(?<=\.)\s+|\n+")
+
+
+class Passage(NamedTuple):
+    source: int  # 所属结果在结果列表中的下标
+    position: int  # 在该结果中的顺序
+    text: str
+    score: float
+
+
+def split_passages(text: str, max_chars: int = PASSAGE_CHARS) -> List[str]:
+    """按句切分后合并相邻句子，每段不超过 max_chars（超长句子单独成段）"""
+    passages: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_RE.split(text or ""):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        passages.append(current)
+    return [p[:max_chars] for p in passages]
+
+
+def bm25_scores(
+    passages: Sequence[str], query: str, concepts: Sequence[str] = ()
+) -> np.ndarray:
+    """各段落对 (问题 + 关键概念) 的 BM25 得分；词表只取查询中出现的词"""
+    weights: Dict[str, float] = {term: 1.0 for term in tokenize(query, query=True)}
+    for concept in concepts:
+        for term in tokenize(concept, query=True):
+            weights.setdefault(term, CONCEPT_WEIGHT)
+    if not passages or not weights:
+        return np.zeros(len(passages))
+
+    vocab = {term: i for i, term in enumerate(weights)}
+    tf = np.zeros((len(passages), len(vocab)), dtype=np.float32)
+    lengths = np.zeros(len(passages), dtype=np.float32)
+    for row, passage in enumerate(passages):
+        counts = tokenize(passage)
+        lengths[row] = sum(counts.values())
+        for term, count in counts.items():
+            col = vocab.get(term)
+            if col is not None:
+                tf[row, col] = count
+
+    n = len(passages)
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((n - df + 0.5) / (df + 0.5))
+    norm = K1 * (1 - B + B * lengths / max(lengths.mean(), 1.0))
+    saturated = tf * (K1 + 1) / (tf + norm[:, None])
+    return saturated @ (idf * np.array(list(weights.values()), dtype=np.float32))
+
+
+def select_passages(
+    results: Sequence[Dict[str, Any]],
+    query: str,
+    concepts: Sequence[str] = (),
+    budget: int = SEARCH_CONTEXT_TOKENS,
+) -> List[Passage]:
+    """按相关度贪心放入预算内的段落（返回顺序：按结果、再按段落原顺序）
+
+    没有任何段落与问题重合时，退回每个结果的第一段。
+    """
+    candidates = [
+        (source, position, text)
+        for source, result in enumerate(results)
+        for position, text in enumerate(split_passages(result.get("content", "")))
+    ]
+    if not candidates:
+        return []
+    scores = bm25_scores([text for _, _, text in candidates], query, concepts)
+
+    if scores.max() <= 0:
+        order = [i for i, (_, position, _) in enumerate(candidates) if position == 0]
+    else:
+        # 同分时排名靠前的结果优先
+        order = sorted(
+            (i for i in range(len(candidates)) if scores[i] > 0),
+            key=lambda i: (-scores[i], candidates[i][0], candidates[i][1]),
+        )
+
+    chosen: List[Passage] = []
+    seen = set()
+    remaining = budget
+    for i in order:
+        source, position, text = candidates[i]
+        key = re.sub(r"\W+", "", text.lower())
+        cost = estimate_tokens(text) + 2
+        if key in seen or cost > remaining:
+            continue
+        seen.add(key)
+        chosen.append(Passage(source, position, text, float(scores[i])))
+        remaining -= cost
+    return sorted(chosen, key=lambda p: (p.source, p.position))
+
+
+def passage_capacity(
+    results: Sequence[Dict[str, Any]], budget: int = SEARCH_CONTEXT_TOKENS
+) -> int:
+    """预算内按平均段落长度能放入的段落数（至少 1）"""
+    costs = [
+        estimate_tokens(text) + 2
+        for result in results
+        for text in split_passages(result.get("content", ""))
+    ]
+    if not costs:
+        return 0
+    return max(1, int(budget * len(costs) / sum(costs)))
+
+
+def format_passages(
+    results: Sequence[Dict[str, Any]], passages: Sequence[Passage]
+) -> str:
+    """按来源分组输出，编号与结果列表一致"""
+    lines: List[str] = []
+    last_source = None
+    for passage in passages:
+        if passage.source != last_source:
+            result = results[passage.source]
+            lines.append(
+                f"[{passage.source + 1}] {result.get('title', 'Untitled')} ({result.get('url', '')})"
+            )
+            last_source = passage.source
+        lines.append(f"- {passage.text}")
+    return "\n".join(lines)
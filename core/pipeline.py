@@ -1,12 +1,19 @@
+import asyncio
 import logging
 import time
 import uuid
-from typing import Any, AsyncIterator, Dict
+from typing import Any, AsyncIterator, Dict, Optional, Sequence
 
+from database.async_session import DeferredWriteError, async_session_mgr
 from database.session import session_mgr
 from workflows.builder import create_workflow
 
-from core.models import PipelineState, ProcessingMode
+from config.settings import CONTEXT_HISTORY_LIMIT
+
+from core.context import context_builder
+from core.memory import memory_summarizer
+from core.models import CodeArtifact, PipelineState, ProcessingMode
+from core.telemetry import RunTrace
 
 logger = logging.getLogger(__name__)
 
@@ -35,18 +42,27 @@ class AgentPipeline:
             mode = ProcessingMode.BASIC
 
         logger.info(f"Pipeline started: trace_id={trace_id}, mode={mode}")
+        trace = RunTrace(trace_id, session_id, mode.value)
 
-        session_mgr.add_message(session_id, "user", query)
-
-        # 获取上下文记忆（最近 5 轮对话）
-        conversation_history = self._get_conversation_context(session_id, limit=10)
+        # 先读取历史：本轮问题单独放入提示词，不计入历史
+        history = session_mgr.get_context_messages(
+            session_id, limit=CONTEXT_HISTORY_LIMIT
+        )
+        memory = session_mgr.get_memory(session_id)
+        recalled = session_mgr.recall(session_id, query)
+        with trace.stage("persist"):
+            session_mgr.add_message(session_id, "user", query)
 
         initial_state: PipelineState = {
             "session_id": session_id,
+            "started_at": time.monotonic(),
             "domain": "general",
             "language": language,
             "query": query,
-            "conversation_history": conversation_history,  # 新增：上下文记忆
+            "history": history,
+            "memory": memory,
+            "recalled": recalled,
+            "conversation_history": "",
             "processing_mode": mode,
             "understanding": None,
             "web_search_results": None,
@@ -55,22 +71,33 @@ class AgentPipeline:
             "final_analysis": None,
             "artifacts": [],
             "final_answer": None,
+            "digest": None,
             "error": None,
         }
+        # 兼容直接读取 conversation_history 的调用方（按分析阶段预算打包）
+        initial_state["conversation_history"] = context_builder.for_stage(
+            initial_state, "analysis"
+        )
 
         try:
             final_state = self.workflow.invoke(initial_state)
-
-            for artifact in final_state.get("artifacts", []):
-                session_mgr.save_artifact(session_id, artifact)
+            trace.domain = final_state.get("domain")
+            if final_state.get("web_search_results"):
+                trace.record_search(final_state["web_search_results"])
 
             answer = final_state.get("final_answer", "No response generated.")
-            session_mgr.add_message(
-                session_id,
-                "assistant",
-                answer,
-                {"trace_id": trace_id, "mode": mode.value},
-            )
+            with trace.stage("persist"):
+                for artifact in final_state.get("artifacts", []):
+                    session_mgr.save_artifact(session_id, artifact)
+
+                session_mgr.add_message(
+                    session_id,
+                    "assistant",
+                    answer,
+                    {"trace_id": trace_id, "mode": mode.value},
+                    final_state.get("digest"),
+                )
+            memory_summarizer.schedule(session_id, language)
 
             elapsed = time.time() - start_time
             logger.info(f"Pipeline completed: {elapsed:.2f}s")
@@ -89,9 +116,12 @@ class AgentPipeline:
 
         except Exception as e:
             logger.error(f"Pipeline failed: {e}", exc_info=True)
+            trace.fail(e)
             error_msg = f"Error: {str(e)}"
             session_mgr.add_message(session_id, "assistant", error_msg)
             return {"trace_id": trace_id, "answer": error_msg, "error": str(e)}
+        finally:
+            trace.finish()
 
     async def run_streaming(
         self,
@@ -113,11 +143,7 @@ class AgentPipeline:
             mode = ProcessingMode.BASIC
 
         logger.info(f"Pipeline streaming started: trace_id={trace_id}, mode={mode}")
-
-        session_mgr.add_message(session_id, "user", query)
-
-        # 获取上下文记忆
-        conversation_history = self._get_conversation_context(session_id, limit=10)
+        trace = RunTrace(trace_id, session_id, mode.value)
 
         # 发送初始状态
         yield {
@@ -126,12 +152,23 @@ class AgentPipeline:
             "step": "understanding",
         }
 
+        # 上一轮延后的写入先落盘，本轮读到的历史才完整；上一轮的消息写入失败已在该轮报告，
+        # 这里只剩答案发出之后的任务（摘要调度、遥测），失败不影响本轮
+        try:
+            await async_session_mgr.flush(session_id)
+        except DeferredWriteError as e:
+            logger.warning(f"Previous turn background task failed: {e}")
+
         initial_state: PipelineState = {
             "session_id": session_id,
+            "started_at": time.monotonic(),
             "domain": "general",
             "language": language,
             "query": query,
-            "conversation_history": conversation_history,
+            "history": [],
+            "memory": None,
+            "recalled": [],
+            "conversation_history": "",
             "processing_mode": mode,
             "understanding": None,
             "web_search_results": None,
@@ -140,6 +177,7 @@ class AgentPipeline:
             "final_analysis": None,
             "artifacts": [],
             "final_answer": None,
+            "digest": None,
             "error": None,
         }
 
@@ -147,13 +185,35 @@ class AgentPipeline:
             # 逐步执行 workflow 并发送进度
             current_state = initial_state
 
+            # 向量召回需要一次嵌入请求，与问题理解并行
+            recalled = asyncio.create_task(async_session_mgr.recall(session_id, query))
+            # 历史在用户消息写入之前读取（稳定状态下命中会话缓存）；本轮问题单独放入提示词，
+            # 不计入历史。用户消息的写入与问题理解的 LLM 调用重叠
+            current_state["history"], current_state["memory"] = await asyncio.gather(
+                async_session_mgr.get_context_messages(session_id, CONTEXT_HISTORY_LIMIT),
+                async_session_mgr.get_memory(session_id),
+            )
+            async_session_mgr.defer(
+                session_id, self._persist, trace, session_id, "user", query
+            )
+
             # Understanding
             from agents.understanding import UnderstandingAgent
 
             understanding_agent = UnderstandingAgent()
-            current_state = understanding_agent.understand(current_state)
+            with trace.stage("understanding"):
+                current_state = await asyncio.to_thread(
+                    understanding_agent.understand, current_state
+                )
+            trace.domain = current_state.get("domain")
+
+            current_state["recalled"] = await recalled
+            current_state["conversation_history"] = context_builder.for_stage(
+                current_state, "analysis"
+            )
 
             if current_state.get("error"):
+                trace.fail(current_state["error"])
                 yield {"type": "error", "content": current_state["error"]}
                 return
 
@@ -175,9 +235,12 @@ class AgentPipeline:
                 from agents.search import WebSearchAgent
 
                 search_agent = WebSearchAgent()
-                current_state = search_agent.search(current_state)
+                with trace.stage("search"):
+                    current_state = await search_agent.search_async(current_state)
 
                 web_results = current_state.get("web_search_results")
+                if web_results:
+                    trace.record_search(web_results)
                 if web_results and web_results.results:
                     yield {
                         "type": "status",
@@ -194,7 +257,8 @@ class AgentPipeline:
 
             analysis_agent = InitialAnalysisAgent()
 
-            # 使用流式分析
+            # 使用流式分析（耗时包含向调用方逐段输出的时间）
+            analysis_start = time.perf_counter()
             async for event in analysis_agent.analyze_streaming(current_state):
                 event_type = event.get("type")
 
@@ -206,8 +270,10 @@ class AgentPipeline:
                     current_state = event["state"]
                 elif event_type == "error":
                     # 传递错误
+                    trace.fail(event["content"])
                     yield event
                     return
+            trace.stages["analysis"] = (time.perf_counter() - analysis_start) * 1000
 
             # Deep Thinking (如果启用)
             if mode == ProcessingMode.DEEP_THINKING:
@@ -220,7 +286,8 @@ class AgentPipeline:
                 from agents.reflection import ReflectionAgent
 
                 reflection_agent = ReflectionAgent()
-                current_state = reflection_agent.reflect(current_state)
+                with trace.stage("reflection"):
+                    current_state = reflection_agent.reflect(current_state)
 
                 if current_state.get("reflection"):
                     yield {
@@ -240,7 +307,8 @@ class AgentPipeline:
                 from agents.analysis import DetailedAnalysisAgent
 
                 detailed_agent = DetailedAnalysisAgent()
-                current_state = detailed_agent.analyze(current_state)
+                with trace.stage("detailed"):
+                    current_state = detailed_agent.analyze(current_state)
 
                 if (
                     current_state.get("final_analysis")
@@ -249,7 +317,8 @@ class AgentPipeline:
                     from agents.code_generator import CodeGenerationAgent
 
                     code_agent = CodeGenerationAgent()
-                    current_state = code_agent.generate(current_state)
+                    with trace.stage("code"):
+                        current_state = code_agent.generate(current_state)
 
                     if current_state.get("artifacts"):
                         yield {
@@ -268,19 +337,22 @@ class AgentPipeline:
             from agents.synthesis import SynthesisAgent
 
             synthesis_agent = SynthesisAgent()
-            current_state = synthesis_agent.synthesize(current_state)
-
-            # 保存 artifacts
-            for artifact in current_state.get("artifacts", []):
-                session_mgr.save_artifact(session_id, artifact)
+            with trace.stage("synthesis"):
+                current_state = synthesis_agent.synthesize(current_state)
 
             # 发送最终答案
             answer = current_state.get("final_answer", "No response generated.")
-            session_mgr.add_message(
+            # 回答与 artifacts 在数据库线程池中写入，不等待写入完成就发送最终答案
+            async_session_mgr.defer(
+                session_id,
+                self._persist,
+                trace,
                 session_id,
                 "assistant",
                 answer,
                 {"trace_id": trace_id, "mode": mode.value},
+                current_state.get("artifacts", []),
+                current_state.get("digest"),
             )
 
             elapsed = time.time() - start_time
@@ -296,25 +368,43 @@ class AgentPipeline:
                 },
             }
 
+            # 答案发出后确认本轮的问题与回答都已保存；写入失败时在最终答案之后报告错误
+            try:
+                await async_session_mgr.flush(session_id)
+            except DeferredWriteError as e:
+                logger.error(f"Failed to save turn: {e}")
+                trace.fail(e)
+                yield {"type": "error", "content": f"回答未能保存: {str(e)}"}
+                return
+            # 排在回答写入之后调度摘要合并，合并本身在独立线程中执行
+            async_session_mgr.defer(
+                session_id, memory_summarizer.schedule, session_id, language
+            )
+
         except Exception as e:
             logger.error(f"Pipeline streaming failed: {e}", exc_info=True)
+            trace.fail(e)
             yield {"type": "error", "content": f"处理出错: {str(e)}"}
+        finally:
+            # 排在本轮写入之后，persist 阶段耗时才完整
+            trace.detach()
+            async_session_mgr.defer(session_id, trace.finish)
 
-    def _get_conversation_context(self, session_id: str, limit: int = 10) -> str:
-        """获取对话上下文（最近 N 条消息）"""
-        messages = session_mgr.get_messages(session_id, limit=limit)
-
-        if not messages:
-            return ""
-
-        # 格式化为对话历史
-        context_parts = []
-        for msg in messages[-limit:]:  # 只取最后 limit 条
-            role = "用户" if msg["role"] == "user" else "助手"
-            content = msg["content"][:200]  # 每条限制 200 字符
-            context_parts.append(f"{role}: {content}")
-
-        return "\n".join(context_parts)
+    def _persist(
+        self,
+        trace: RunTrace,
+        session_id: str,
+        role: str,
+        content: str,
+        metadata: Optional[Dict] = None,
+        artifacts: Sequence[CodeArtifact] = (),
+        digest: Optional[str] = None,
+    ):
+        """延后写入（在数据库线程池中执行）"""
+        with trace.stage("persist"):
+            for artifact in artifacts:
+                session_mgr.save_artifact(session_id, artifact)
+            session_mgr.add_message(session_id, role, content, metadata, digest)
 
 
 pipeline = AgentPipeline()
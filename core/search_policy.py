@@ -0,0 +1,154 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from config.settings import (
+    SEARCH_DEADLINE,
+    SEARCH_LATENCY_BUDGET,
+    SEARCH_MAX_RESULTS_LIMIT,
+    SEARCH_POLICY_DEFAULTS,
+    SEARCH_POLICY_EXPLORE,
+    SEARCH_POLICY_MIN_GAIN,
+    SEARCH_POLICY_MIN_SAMPLES,
+    SEARCH_POLICY_REFRESH,
+    SEARCH_POLICY_WINDOW_DAYS,
+)
+from core.models import ProcessingMode
+from database.async_session import async_session_mgr
+from database.runs import run_store
+
+logger = logging.getLogger(__name__)
+
+# 没有足够历史数据时的预计搜索耗时（秒）
+DEFAULT_LATENCY = {"basic": 2.0, "advanced": 6.0}
+
+# 有用率低于 / 高于该值时减少 / 增加结果数
+LOW_USEFULNESS = 0.4
+HIGH_USEFULNESS = 0.8
+RESULTS_STEP = 2
+MIN_RESULTS = 3
+
+# 截止时长不短于所选深度预计耗时的倍数（预计耗时是平均值，需留出波动余量）
+DEADLINE_MARGIN = 2.0
+
+
+def policy_domain(domain: Optional[str]) -> Optional[str]:
+    """策略使用的领域：未知领域归入 general；runs 表记录同一取值，历史统计才能对应"""
+    if domain is None:
+        return None
+    return domain if domain in SEARCH_POLICY_DEFAULTS else "general"
+
+
+class SearchPlan(NamedTuple):
+    depth: str
+    max_results: int
+    # 本次搜索（含子查询）的截止时长（秒），不短于所选深度的一次调用
+    deadline: float
+    # 决策依据，逗号分隔，如 "domain:medical,deep,budget"
+    reason: str
+
+    @property
+    def params(self) -> Dict[str, object]:
+        return {"search_depth": self.depth, "max_results": self.max_results}
+
+
+class SearchPolicy:
+    """按领域、处理模式、剩余延迟预算与历史有用率选择搜索深度和结果数
+
+    历史数据来自 runs 表（search_useful：有段落被选入上下文的结果占预算可覆盖结果数的比例），
+    按 (领域, 深度) 聚合后在进程内缓存 SEARCH_POLICY_REFRESH 秒。搜索前 await refresh()
+    在数据库线程池中更新统计，choose 只读取缓存，不在事件循环中查询数据库。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._loaded_at = 0.0
+
+    async def refresh(self):
+        """统计过期时重新读取 runs 表（数据库线程池中执行）"""
+        with self._lock:
+            if time.monotonic() - self._loaded_at < SEARCH_POLICY_REFRESH:
+                return
+            # 先更新时间戳：查询失败时不在每次搜索时重试
+            self._loaded_at = time.monotonic()
+        try:
+            rows = await async_session_mgr.call(
+                run_store.search_stats, time.time() - SEARCH_POLICY_WINDOW_DAYS * 86400
+            )
+        except Exception as e:
+            logger.warning(f"Search policy history unavailable: {e}")
+            return
+        stats = {
+            (row["domain"], row["search_depth"]): row
+            for row in rows
+            if row["n"] >= SEARCH_POLICY_MIN_SAMPLES
+        }
+        with self._lock:
+            self._stats = stats
+
+    def _history(self) -> Dict[Tuple[str, str], Dict[str, float]]:
+        with self._lock:
+            return self._stats
+
+    def _latency(self, domain: str, depth: str) -> float:
+        row = self._history().get((domain, depth))
+        if row and row["miss_ms"] is not None:
+            return row["miss_ms"] / 1000
+        return DEFAULT_LATENCY[depth]
+
+    def choose(
+        self,
+        domain: Optional[str],
+        mode: ProcessingMode,
+        remaining: float = SEARCH_LATENCY_BUDGET,
+    ) -> SearchPlan:
+        """remaining：本轮延迟预算中剩余的秒数
+
+        剩余预算只用于选择深度：理解阶段的 LLM 调用可能已经耗尽预算，此时仍按所选深度
+        预计耗时的 DEADLINE_MARGIN 倍给出截止时长，不会在一次调用完成前取消原问题的搜索。
+        """
+        domain = policy_domain(domain) or "general"
+        depth, max_results = SEARCH_POLICY_DEFAULTS[domain]
+        reasons: List[str] = [f"domain:{domain}"]
+
+        if mode == ProcessingMode.DEEP_THINKING:
+            depth, max_results = "advanced", max_results + RESULTS_STEP
+            reasons.append("deep")
+
+        history = self._history()
+        if depth == "advanced":
+            advanced = history.get((domain, "advanced"))
+            basic = history.get((domain, "basic"))
+            if advanced and basic and advanced["useful"] - basic["useful"] < SEARCH_POLICY_MIN_GAIN:
+                # 偶尔仍用 advanced：否则 advanced 不再产生新数据，直到旧数据移出统计窗口
+                if random.random() < SEARCH_POLICY_EXPLORE:
+                    reasons.append("explore")
+                else:
+                    depth = "basic"
+                    reasons.append("no-gain")
+            if depth == "advanced" and self._latency(domain, "advanced") > remaining:
+                depth = "basic"
+                reasons.append("budget")
+
+        row = history.get((domain, depth))
+        if row:
+            if row["useful"] < LOW_USEFULNESS:
+                max_results -= RESULTS_STEP
+                reasons.append("low-useful")
+            elif row["useful"] > HIGH_USEFULNESS:
+                max_results += RESULTS_STEP
+                reasons.append("high-useful")
+
+        floor = DEADLINE_MARGIN * self._latency(domain, depth)
+        return SearchPlan(
+            depth=depth,
+            max_results=max(MIN_RESULTS, min(SEARCH_MAX_RESULTS_LIMIT, max_results)),
+            deadline=min(SEARCH_DEADLINE, max(floor, remaining)),
+            reason=",".join(reasons),
+        )
+
+
+search_policy = SearchPolicy()
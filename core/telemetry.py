@@ -0,0 +1,133 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from core.search_policy import policy_domain
+from database.runs import run_store
+from database.session import session_mgr
+
+try:
+    from langchain_core.callbacks import UsageMetadataCallbackHandler
+    from langchain_core.tracers.context import register_configure_hook
+except ImportError:  # 旧版 langchain-core 不提供 usage_metadata 回调，token 数记为空
+    UsageMetadataCallbackHandler = None
+
+logger = logging.getLogger(__name__)
+
+# 当前轮次的 token 统计回调；注册后本上下文内的所有 LLM 调用都会自动带上
+_usage_callback: ContextVar[Optional[Any]] = ContextVar(
+    "run_usage_callback", default=None
+)
+if UsageMetadataCallbackHandler is not None:
+    register_configure_hook(_usage_callback, inheritable=True)
+
+
+class RunTrace:
+    """单轮运行的遥测：阶段耗时、token 数、缓存命中，结束时写入 runs 表
+
+    缓存命中数取进程内会话缓存计数的差值，并发轮次之间会互相计入。
+    """
+
+    def __init__(self, trace_id: str, session_id: str, mode: str):
+        self.trace_id = trace_id
+        self.session_id = session_id
+        self.mode = mode
+        self.domain: Optional[str] = None
+        self.error_class: Optional[str] = None
+        # 网络搜索缓存状态（hit / stale / miss），本轮未搜索时为 None
+        self.search_cache: Optional[str] = None
+        # 本轮选用的搜索策略与结果有用率
+        self.search: Dict[str, Any] = {}
+        self.started_at = time.time()
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+        self._cache_before = session_mgr.cache_stats()
+
+        self._usage = None
+        self._usage_token = None
+        if UsageMetadataCallbackHandler is not None:
+            self._usage = UsageMetadataCallbackHandler()
+            self._usage_token = _usage_callback.set(self._usage)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (
+                self.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+            )
+
+    def record_search(self, result):
+        """记录网络搜索的缓存状态与策略（WebSearchResult）"""
+        self.search_cache = result.cache
+        self.search = {
+            "search_depth": result.depth,
+            "search_max_results": result.max_results,
+            "search_policy": result.policy,
+            "search_useful": result.useful,
+        }
+
+    def fail(self, error):
+        """记录错误类型（异常或状态中的错误信息），不记录错误内容"""
+        self.error_class = (
+            type(error).__name__ if isinstance(error, BaseException) else "StateError"
+        )
+
+    def _token_counts(self):
+        if self._usage is None:
+            return None, None
+        usage = list(self._usage.usage_metadata.values())
+        return (
+            sum(u.get("input_tokens", 0) for u in usage),
+            sum(u.get("output_tokens", 0) for u in usage),
+        )
+
+    def detach(self):
+        """取消注册 token 统计回调；必须在创建 trace 的同一上下文中调用
+
+        finish 交给其他线程执行时（如数据库线程池），先在当前上下文中调用本方法。
+        """
+        if self._usage_token is None:
+            return
+        try:
+            _usage_callback.reset(self._usage_token)
+        except ValueError:
+            logger.warning("Usage callback detached from a different context")
+        self._usage_token = None
+
+    def finish(self):
+        """写入 runs 表；遥测失败不影响主流程"""
+        self.detach()
+        input_tokens, output_tokens = self._token_counts()
+        cache = session_mgr.cache_stats()
+        try:
+            run_store.record(
+                {
+                    "trace_id": self.trace_id,
+                    "session_id": self.session_id,
+                    "mode": self.mode,
+                    # 与搜索策略使用相同的领域取值
+                    "domain": policy_domain(self.domain),
+                    "status": "error" if self.error_class else "ok",
+                    "error_class": self.error_class,
+                    "started_at": self.started_at,
+                    "total_ms": self.elapsed * 1000,
+                    **{f"{name}_ms": ms for name, ms in self.stages.items()},
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                    "cache_hits": cache["hits"] - self._cache_before["hits"],
+                    "cache_misses": cache["misses"] - self._cache_before["misses"],
+                    "search_cache": self.search_cache,
+                    **self.search,
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Run telemetry not recorded: {e}")
@@ -1,4 +1,6 @@
+from .async_session import async_session_mgr
 from .manager import db
 from .session import session_mgr
+from .storage import storage
 
-__all__ = ['db', 'session_mgr']
+__all__ = ['db', 'session_mgr', 'async_session_mgr', 'storage']
@@ -0,0 +1,189 @@
+import json
+import sqlite3
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from utils.crypto import encryptor
+
+from database.manager import DatabaseManager
+from database.storage import storage
+
+# 列表接口返回的产物头字段（不含正文与说明）
+HEADER_COLUMNS = (
+    "id",
+    "session_id",
+    "artifact_type",
+    "title",
+    "language",
+    "created_at",
+)
+
+
+class PreparedArtifact(NamedTuple):
+    """在写事务之外完成摘要与加密；content 为 None 表示正文已存在，无需重复写入"""
+
+    digest: bytes
+    content: Optional[bytes]
+    size: int
+    explanation: Optional[bytes]
+    dependencies: Optional[bytes]
+
+
+class ArtifactStore:
+    """内容寻址的产物存储
+
+    正文以带密钥摘要为主键存入 artifact_blobs，同一库内相同代码只保存一份；正文由多个会话
+    共享，因此使用主密钥加密（V2），说明与依赖等会话相关字段仍使用会话数据密钥加密。
+    引用表 session_artifacts 与正文位于会话所在的同一分片，写入与清理都在单个事务内完成。
+    """
+
+    def __init__(self):
+        self.storage = storage
+
+    def _blob_exists(self, manager: DatabaseManager, digest: bytes) -> bool:
+        with manager.get_connection() as conn:
+            return (
+                conn.execute(
+                    "SELECT 1 FROM artifact_blobs WHERE digest = ?", (digest,)
+                ).fetchone()
+                is not None
+            )
+
+    def prepare(
+        self,
+        session_id: str,
+        code: str,
+        explanation: str = "",
+        dependencies: Optional[List[str]] = None,
+    ) -> PreparedArtifact:
+        digest = encryptor.content_digest(code)
+        exists = self._blob_exists(self.storage.shard_for(session_id), digest)
+        return PreparedArtifact(
+            digest=digest,
+            content=None if exists else encryptor.encrypt_bytes(code),
+            size=len(code.encode("utf-8")),
+            explanation=encryptor.encrypt_bytes(explanation, session_id) or None,
+            dependencies=(
+                encryptor.encrypt_bytes(json.dumps(dependencies), session_id)
+                if dependencies
+                else None
+            ),
+        )
+
+    def write(
+        self,
+        conn: sqlite3.Connection,
+        session_id: str,
+        prepared: PreparedArtifact,
+        title: Optional[str],
+        language: Optional[str],
+        artifact_type: str = "code",
+        created_at: Optional[float] = None,
+    ) -> int:
+        now = created_at or time.time()
+        if prepared.content is not None:
+            # 并发写入相同内容时只保留先到的一份
+            conn.execute(
+                "INSERT OR IGNORE INTO artifact_blobs (digest, content, size, created_at) VALUES (?, ?, ?, ?)",
+                (prepared.digest, prepared.content, prepared.size, now),
+            )
+        elif not conn.execute(
+            "SELECT 1 FROM artifact_blobs WHERE digest = ?", (prepared.digest,)
+        ).fetchone():
+            raise LookupError("Artifact blob disappeared before write; prepare again")
+        cursor = conn.execute(
+            "INSERT INTO session_artifacts (session_id, digest, artifact_type, title, language, explanation, dependencies, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                session_id,
+                prepared.digest,
+                artifact_type,
+                title,
+                language,
+                prepared.explanation,
+                prepared.dependencies,
+                now,
+            ),
+        )
+        return cursor.lastrowid
+
+    def save(
+        self,
+        session_id: str,
+        title: Optional[str],
+        language: Optional[str],
+        code: str,
+        explanation: str = "",
+        dependencies: Optional[List[str]] = None,
+        artifact_type: str = "code",
+        created_at: Optional[float] = None,
+    ) -> int:
+        prepared = self.prepare(session_id, code, explanation, dependencies)
+        with self.storage.shard_for(session_id).get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                return self.write(
+                    conn, session_id, prepared, title, language, artifact_type, created_at
+                )
+            except LookupError:
+                # 正文在检查之后被清理（会话归档），改为随引用一起写入
+                conn.rollback()
+                prepared = prepared._replace(content=encryptor.encrypt_bytes(code))
+                conn.execute("BEGIN IMMEDIATE")
+                return self.write(
+                    conn, session_id, prepared, title, language, artifact_type, created_at
+                )
+
+    def list_headers(self, session_id: str) -> List[Dict[str, Any]]:
+        """产物头列表（按创建时间），不读取也不解密正文"""
+        with self.storage.shard_for(session_id).get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join('a.' + c for c in HEADER_COLUMNS)}, b.size "
+                "FROM session_artifacts a JOIN artifact_blobs b ON b.digest = a.digest "
+                "WHERE a.session_id = ? ORDER BY a.created_at",
+                (session_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, session_id: str, artifact_id: int) -> Optional[Dict[str, Any]]:
+        """读取单个产物的完整内容（code / explanation / dependencies 均已解密）"""
+        with self.storage.shard_for(session_id).get_connection() as conn:
+            row = conn.execute(
+                "SELECT a.*, b.content, b.size FROM session_artifacts a "
+                "JOIN artifact_blobs b ON b.digest = a.digest "
+                "WHERE a.session_id = ? AND a.id = ?",
+                (session_id, artifact_id),
+            ).fetchone()
+        if row is None:
+            return None
+        artifact = {c: row[c] for c in HEADER_COLUMNS}
+        dependencies = encryptor.decrypt_value(row["dependencies"], session_id)
+        artifact.update(
+            size=row["size"],
+            code=encryptor.decrypt_value(row["content"]),
+            explanation=encryptor.decrypt_value(row["explanation"], session_id),
+            dependencies=json.loads(dependencies) if dependencies else None,
+        )
+        return artifact
+
+    def purge(self, conn: sqlite3.Connection, session_ids: Sequence[str]):
+        """删除会话的产物引用，并清理不再被任何会话引用的正文"""
+        placeholders = ", ".join("?" * len(session_ids))
+        digests = [
+            row[0]
+            for row in conn.execute(
+                f"SELECT DISTINCT digest FROM main.session_artifacts WHERE session_id IN ({placeholders})",
+                session_ids,
+            ).fetchall()
+        ]
+        conn.execute(
+            f"DELETE FROM main.session_artifacts WHERE session_id IN ({placeholders})",
+            session_ids,
+        )
+        conn.executemany(
+            "DELETE FROM main.artifact_blobs WHERE digest = ? AND NOT EXISTS "
+            "(SELECT 1 FROM main.session_artifacts WHERE digest = ?)",
+            [(digest, digest) for digest in digests],
+        )
+
+
+artifact_store = ArtifactStore()
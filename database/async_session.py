@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, TypeVar
+
+from config.settings import DB_EXECUTOR_WORKERS
+
+from database.session import SessionManager, session_mgr
+
+if TYPE_CHECKING:
+    from core.models import CodeArtifact
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class DeferredWriteError(RuntimeError):
+    """会话的延后任务执行失败（由 flush 抛出，原始异常见 __cause__）"""
+
+
+class AsyncSessionManager:
+    """SessionManager 的异步外观：接口与同步版本一致，调用在专用线程池中执行
+
+    SQLite 的 fsync、锁等待与批量解密都不会阻塞事件循环，一个会话的写入不会拖慢
+    其他会话的流式输出。线程池独立于默认执行器，不与 to_thread 的其他任务争用。
+    """
+
+    def __init__(self, manager: SessionManager, max_workers: int = DB_EXECUTOR_WORKERS):
+        self.manager = manager
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # 每个会话最后一个延后任务（之前的任务由链式等待保证已完成）
+        self._pending: Dict[str, Future] = {}
+        # 每个会话尚未被 flush 取走的第一个失败
+        self._failures: Dict[str, BaseException] = {}
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="db"
+                )
+            return self._executor
+
+    async def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """在数据库线程池中执行任意同步调用（如遥测写入）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool(), partial(fn, *args, **kwargs))
+
+    def defer(self, session_id: str, fn: Callable[..., T], *args, **kwargs) -> "Future[T]":
+        """提交后立即返回，不等待执行完成
+
+        同一会话的延后任务按提交顺序依次执行。返回的是线程池 Future 而不是 asyncio 任务：
+        事件循环结束（如每轮一次的 asyncio.run）不会取消尚未完成的写入，进程退出时线程池
+        也会等待已提交的任务执行完毕。
+        """
+        pool = self._pool()
+        with self._lock:
+            prior = self._pending.get(session_id)
+            future = pool.submit(self._run_after, session_id, prior, fn, args, kwargs)
+            self._pending[session_id] = future
+        future.add_done_callback(partial(self._on_done, session_id))
+        return future
+
+    def _run_after(self, session_id: str, prior: Optional[Future], fn, args, kwargs):
+        if prior is not None:
+            # 前一个任务提交得更早，线程池按先进先出调度，已在执行或已完成
+            wait([prior])
+        try:
+            return fn(*args, **kwargs)
+        except BaseException as e:
+            # 在任务内记录失败：Future 完成时回调可能还没执行，后一个任务已经结束、
+            # flush 已经返回
+            with self._lock:
+                self._failures.setdefault(session_id, e)
+            raise
+
+    def _on_done(self, session_id: str, future: Future):
+        error = None if future.cancelled() else future.exception()
+        with self._lock:
+            if self._pending.get(session_id) is future:
+                del self._pending[session_id]
+        if error is not None:
+            logger.error(f"Deferred write failed: session={session_id}", exc_info=error)
+
+    async def flush(self, session_id: str):
+        """等待该会话所有延后任务完成；其中有任务失败时抛出 DeferredWriteError
+
+        失败只报告一次：抛出后即清除，之后的 flush 不再重复抛出。
+        """
+        with self._lock:
+            tail = self._pending.get(session_id)
+        if tail is not None:
+            await asyncio.wait([asyncio.wrap_future(tail)])
+        with self._lock:
+            error = self._failures.pop(session_id, None)
+        if error is not None:
+            raise DeferredWriteError(
+                f"Deferred write failed for session {session_id}: {error}"
+            ) from error
+
+    async def create_session(self, title: str, domain: str, language: str = "中文") -> str:
+        return await self.call(self.manager.create_session, title, domain, language)
+
+    async def list_sessions(
+        self, domain: Optional[str] = None, status: str = "active"
+    ) -> List[Dict[str, Any]]:
+        return await self.call(self.manager.list_sessions, domain, status)
+
+    async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self.call(self.manager.get_session, session_id)
+
+    async def add_message(
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        metadata: Optional[Dict] = None,
+        digest: Optional[str] = None,
+    ):
+        return await self.call(
+            self.manager.add_message, session_id, role, content, metadata, digest
+        )
+
+    async def get_messages(
+        self, session_id: str, limit: int = 50, lazy: bool = False
+    ) -> List[Dict[str, Any]]:
+        return await self.call(self.manager.get_messages, session_id, limit, lazy)
+
+    async def get_context_messages(
+        self, session_id: str, limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        return await self.call(self.manager.get_context_messages, session_id, limit)
+
+    async def get_first_message(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self.call(self.manager.get_first_message, session_id)
+
+    async def get_messages_by_ids(
+        self, session_id: str, message_ids: List[int]
+    ) -> List[Dict[str, Any]]:
+        return await self.call(self.manager.get_messages_by_ids, session_id, message_ids)
+
+    async def recall(self, session_id: str, query: str) -> List[Dict[str, Any]]:
+        # 主要耗时是嵌入请求（网络等待），在默认执行器中运行，不占用数据库线程
+        return await asyncio.to_thread(self.manager.recall, session_id, query)
+
+    async def get_memory(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self.call(self.manager.get_memory, session_id)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """只读取内存中的计数，直接返回"""
+        return self.manager.cache_stats()
+
+    async def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        return await self.call(self.manager.search, query, limit)
+
+    async def save_artifact(self, session_id: str, artifact: "CodeArtifact") -> int:
+        return await self.call(self.manager.save_artifact, session_id, artifact)
+
+    async def list_artifacts(self, session_id: str) -> List[Dict[str, Any]]:
+        return await self.call(self.manager.list_artifacts, session_id)
+
+    async def get_artifact(
+        self, session_id: str, artifact_id: int
+    ) -> Optional[Dict[str, Any]]:
+        return await self.call(self.manager.get_artifact, session_id, artifact_id)
+
+    async def update_session_summary(
+        self, session_id: str, first_user_message: str = None
+    ):
+        return await self.call(
+            self.manager.update_session_summary, session_id, first_user_message
+        )
+
+    async def delete_session(self, session_id: str):
+        return await self.call(self.manager.delete_session, session_id)
+
+
+async_session_mgr = AsyncSessionManager(session_mgr)
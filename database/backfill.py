@@ -0,0 +1,221 @@
+"""后台数据回填：为旧格式（未标记的 TEXT）加密字段加上显式格式头
+
+旧 Fernet 密文原地标记为 V2（不重新加密），历史明文使用会话数据密钥加密。
+旧 artifacts 表中的产物迁移到内容寻址存储（见 database.artifacts），
+最后为建立检索索引之前的消息补建索引（见 database.search_index）。
+
+旧格式改写与产物迁移完成后在各分片的 storage_meta 中记录 legacy_backfill_done，
+之后启动时不再扫描；检索索引回填的进度本身记录在 search_backfill_upto 中。
+
+用法: python -m database.backfill [--force]（--force 忽略完成标记重新扫描）
+"""
+
+import argparse
+
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from utils.crypto import encryptor
+
+from database.artifacts import artifact_store
+from database.manager import DatabaseManager
+from database.search_index import backfill_all as backfill_search_index
+from database.storage import storage
+
+logger = logging.getLogger(__name__)
+
+# 需要改写的加密列（旧 artifacts 表整体迁移到内容寻址存储，不再原地改写）
+ENCRYPTED_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "messages": ("content", "metadata"),
+}
+
+# storage_meta 中的完成标记
+DONE_KEY = "legacy_backfill_done"
+
+
+def is_done(manager: DatabaseManager) -> bool:
+    with manager.get_connection() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM storage_meta WHERE key = ?", (DONE_KEY,)
+        ).fetchone()
+    return row is not None
+
+
+def mark_done(manager: DatabaseManager):
+    with manager.get_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO storage_meta (key, value) VALUES (?, ?)",
+            (DONE_KEY, str(time.time())),
+        )
+
+
+class LegacyRowRewriter:
+    """按主键分批标记旧格式行，每批一个短事务，避免长时间持有写锁"""
+
+    def __init__(
+        self,
+        manager: DatabaseManager,
+        batch_size: int = 200,
+        pause: float = 0.05,
+    ):
+        self.manager = manager
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def rewrite_batch(self, table: str, after_id: int) -> Tuple[Optional[int], int]:
+        """标记 id > after_id 的一批旧格式行，返回 (本批最大 id, 改写行数)"""
+        columns = ENCRYPTED_COLUMNS[table]
+        legacy_filter = " OR ".join(f"typeof({c}) = 'text'" for c in columns)
+
+        with self.manager.get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT id, session_id, {', '.join(columns)} FROM {table} "
+                f"WHERE id > ? AND ({legacy_filter}) ORDER BY id LIMIT ?",
+                (after_id, self.batch_size),
+            ).fetchall()
+            if not rows:
+                return None, 0
+
+            # 先完成全部转换再写入：首次写入会话数据密钥需要另一个连接获取写锁
+            updates = [
+                (
+                    *(
+                        encryptor.tag_legacy(row[c], row["session_id"])
+                        if isinstance(row[c], str)
+                        else row[c]
+                        for c in columns
+                    ),
+                    row["id"],
+                )
+                for row in rows
+            ]
+            assignments = ", ".join(f"{c} = ?" for c in columns)
+            conn.executemany(
+                f"UPDATE {table} SET {assignments} WHERE id = ?", updates
+            )
+
+        return rows[-1]["id"], len(rows)
+
+    def run(self) -> int:
+        total = 0
+        for table in ENCRYPTED_COLUMNS:
+            last_id = 0
+            while True:
+                last_id, count = self.rewrite_batch(table, last_id)
+                if last_id is None:
+                    break
+                total += count
+                time.sleep(self.pause)
+
+        if total:
+            logger.info(f"Legacy rows rewritten: {total}")
+        return total
+
+
+class LegacyArtifactMover:
+    """将旧 artifacts 表的行分批迁移到 artifact_blobs / session_artifacts，相同代码只保留一份"""
+
+    def __init__(
+        self,
+        manager: DatabaseManager,
+        batch_size: int = 50,
+        pause: float = 0.05,
+    ):
+        self.manager = manager
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def move_batch(self) -> int:
+        with self.manager.get_connection() as conn:
+            rows = conn.execute(
+                "SELECT * FROM artifacts ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+        if not rows:
+            return 0
+
+        # 解密与摘要在写事务之外完成
+        prepared = [
+            artifact_store.prepare(
+                row["session_id"],
+                encryptor.decrypt_value(row["content"], row["session_id"]),
+            )
+            for row in rows
+        ]
+        with self.manager.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for row, artifact in zip(rows, prepared):
+                artifact_store.write(
+                    conn,
+                    row["session_id"],
+                    artifact,
+                    row["title"],
+                    row["language"],
+                    row["artifact_type"],
+                    row["created_at"],
+                )
+            conn.executemany(
+                "DELETE FROM artifacts WHERE id = ?", [(row["id"],) for row in rows]
+            )
+        return len(rows)
+
+    def run(self) -> int:
+        total = 0
+        while True:
+            count = self.move_batch()
+            if not count:
+                break
+            total += count
+            time.sleep(self.pause)
+
+        if total:
+            logger.info(f"Legacy artifacts moved: {total}")
+        return total
+
+
+def _rewrite_shard(manager: DatabaseManager, pause: float, force: bool) -> int:
+    if not force and is_done(manager):
+        return 0
+    total = (
+        LegacyRowRewriter(manager, pause=pause).run()
+        + LegacyArtifactMover(manager, pause=pause).run()
+    )
+    # 迁移之后的写入都带格式头，扫描一遍即可
+    mark_done(manager)
+    return total
+
+
+def rewrite_all(pause: float = 0.05, force: bool = False) -> int:
+    """在所有分片上并行回填；已完成的分片跳过（force 时重新扫描）"""
+    return sum(storage.fan_out(lambda m: _rewrite_shard(m, pause, force)))
+
+
+_backfill_thread: Optional[threading.Thread] = None
+
+
+def start_backfill() -> threading.Thread:
+    """在后台守护线程中执行回填（同一进程内只启动一次）"""
+    global _backfill_thread
+    if _backfill_thread is None:
+
+        def _run():
+            try:
+                rewrite_all()
+                backfill_search_index()
+            except Exception as e:
+                logger.error(f"Data backfill failed: {e}", exc_info=True)
+
+        _backfill_thread = threading.Thread(
+            target=_run, name="data-backfill", daemon=True
+        )
+        _backfill_thread.start()
+    return _backfill_thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="旧格式数据回填")
+    parser.add_argument("--force", action="store_true", help="忽略完成标记重新扫描")
+    args = parser.parse_args()
+    print(f"✓ 已改写 {rewrite_all(pause=0, force=args.force)} 行")
+    print(f"✓ 已建立索引 {backfill_search_index(pause=0)} 条消息")
@@ -0,0 +1,171 @@
+import copy
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import SESSION_CACHE_SIZE
+
+
+def read_change_counter(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT value FROM change_counter WHERE id = 1").fetchone()[0]
+
+
+def _copy_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """消息副本：metadata 是嵌套结构，深拷贝后调用方修改不会影响缓存"""
+    copied = dict(message)
+    if copied.get("metadata") is not None:
+        copied["metadata"] = copy.deepcopy(copied["metadata"])
+    return copied
+
+
+class _Entry:
+    __slots__ = ("session", "messages", "complete")
+
+    def __init__(self):
+        self.session: Optional[Dict[str, Any]] = None
+        # 按 created_at 升序的已解密消息（最近若干条的连续尾部）
+        self.messages: Optional[List[Dict[str, Any]]] = None
+        # messages 是否为该会话的全部消息（是才能追加写入）
+        self.complete = False
+
+
+class SessionCache:
+    """SessionManager 的进程内读穿缓存
+
+    本进程的写入直接更新缓存（write-through）。其他进程（或绕过 SessionManager 的写入）
+    通过 change_counter 表感知：触发器在每次写入时递增计数，读取前比较计数，不一致则清空。
+    分片存储下每个库文件各有一个计数，任一库出现外部写入都会清空整个缓存。
+    """
+
+    def __init__(self, capacity: int = SESSION_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lists: Dict[Tuple[Optional[str], str], List[Dict[str, Any]]] = {}
+        # 每个数据库文件（单文件或目录库 / 各分片）各自的变更计数
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    # ---- 版本同步 ----
+
+    def validate(self, scope: str, version: int):
+        """读取前调用：计数变化说明该库有未经本缓存的写入"""
+        with self._lock:
+            known = self._versions.get(scope)
+            if version != known:
+                if known is not None:
+                    self._clear()
+                self._versions[scope] = version
+
+    def after_write(self, scope: str, before: int, after: int):
+        """本进程写事务提交后调用，before/after 为事务内写入前后的计数"""
+        with self._lock:
+            known = self._versions.get(scope)
+            if known is not None and before != known:
+                self._clear()
+            self._versions[scope] = after
+            # 会话排序（updated_at）已变化
+            self._lists.clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._lists.clear()
+        self.invalidations += 1
+
+    # ---- 读取 ----
+
+    def get_session(self, session_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.session is not None:
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return True, dict(entry.session)
+            self.misses += 1
+            return False, None
+
+    def get_messages(
+        self, session_id: str, limit: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if (
+                entry is not None
+                and entry.messages is not None
+                and (entry.complete or len(entry.messages) >= limit)
+            ):
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return [_copy_message(m) for m in entry.messages[-limit:]]
+            self.misses += 1
+            return None
+
+    def get_list(self, key: Tuple[Optional[str], str]) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            rows = self._lists.get(key)
+            if rows is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [dict(r) for r in rows]
+
+    # ---- 填充与写穿 ----
+
+    def put_session(self, session_id: str, session: Dict[str, Any]):
+        with self._lock:
+            self._entry(session_id).session = dict(session)
+
+    def put_messages(
+        self, session_id: str, messages: List[Dict[str, Any]], complete: bool
+    ):
+        """messages 为最近的若干条（按时间顺序）；complete 表示已包含会话的全部消息"""
+        with self._lock:
+            entry = self._entry(session_id)
+            entry.messages = [_copy_message(m) for m in messages]
+            entry.complete = complete
+
+    def put_list(self, key: Tuple[Optional[str], str], rows: List[Dict[str, Any]]):
+        with self._lock:
+            self._lists[key] = [dict(r) for r in rows]
+
+    def append_message(self, session_id: str, message: Dict[str, Any]):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            # 缓存的是最近消息的连续尾部，新消息总能直接追加
+            if entry.messages is not None:
+                entry.messages.append(_copy_message(message))
+
+    def update_session(self, session_id: str, **fields):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.session is not None:
+                entry.session.update(fields)
+
+    def _entry(self, session_id: str) -> _Entry:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            entry = self._entries[session_id] = _Entry()
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+                "sessions": len(self._entries),
+            }
@@ -0,0 +1,29 @@
+import time
+from typing import Optional
+
+
+class SessionKeyStore:
+    """会话数据密钥存储（仅保存主密钥包装后的密文，与会话消息位于同一分片）"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def load(self, session_id: str) -> Optional[bytes]:
+        with self.storage.shard_for(session_id).get_connection() as conn:
+            row = conn.execute(
+                "SELECT wrapped_key FROM session_keys WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        return bytes(row["wrapped_key"]) if row else None
+
+    def save(self, session_id: str, wrapped_key: bytes) -> bytes:
+        with self.storage.shard_for(session_id).get_connection() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO session_keys (session_id, wrapped_key, created_at) VALUES (?, ?, ?)",
+                (session_id, wrapped_key, time.time()),
+            )
+            row = conn.execute(
+                "SELECT wrapped_key FROM session_keys WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        return bytes(row["wrapped_key"])
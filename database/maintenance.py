@@ -0,0 +1,223 @@
+"""维护任务：按保留期将已删除 / 长期未更新的会话移入冷归档库，并压缩在线库
+
+归档库与在线库使用相同的表结构，数据保持加密状态原样复制（包括会话数据密钥），
+因此归档数据仍可用主密钥解密。
+
+用法: python -m database.maintenance [--dry-run] [--batch-size 50] [--vacuum-full]
+"""
+
+import argparse
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, List
+
+from config.settings import (
+    ARCHIVE_PATH,
+    RETENTION_DELETED_DAYS,
+    RETENTION_STALE_DAYS,
+)
+
+from database.artifacts import artifact_store
+from database.manager import DatabaseManager
+from database.memory import memory_store
+from database.search_cache import search_cache
+from database.search_index import search_index
+from database.storage import storage
+from database.vector_memory import vector_memory
+
+logger = logging.getLogger(__name__)
+
+# 分片库中按 session_id 归属的表（随会话一起归档）；产物正文随引用一并复制
+SHARD_TABLES = ("messages", "artifacts", "session_artifacts", "session_keys")
+
+DAY = 86400
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> str:
+    """复制用的列清单：不含自增主键，各分片的 id 在归档库中会冲突"""
+    return ", ".join(
+        row[1]
+        for row in conn.execute(f"PRAGMA main.table_info({table})").fetchall()
+        if not (row[5] and row[2].upper() == "INTEGER")
+    )
+
+
+class RetentionJob:
+    """小批量归档：每批先把数据复制到归档库并提交，再从在线库删除。
+
+    WAL 模式下跨附加库的事务不保证整体原子，因此分两步提交；复制前先清除归档库中
+    这些会话的行，任务中断后重跑是幂等的。会话行最后从目录库删除，保证未完成的会话仍可见。
+    """
+
+    def __init__(
+        self,
+        deleted_days: float = RETENTION_DELETED_DAYS,
+        stale_days: float = RETENTION_STALE_DAYS,
+        batch_size: int = 50,
+        pause: float = 0.05,
+    ):
+        self.deleted_days = deleted_days
+        self.stale_days = stale_days
+        self.batch_size = batch_size
+        self.pause = pause
+        self.archive = DatabaseManager(ARCHIVE_PATH, foreign_keys=False)
+
+    def find_expired(self, limit: int) -> List[str]:
+        now = time.time()
+        conditions, params = [], []
+        if self.deleted_days > 0:
+            conditions.append("(status = 'deleted' AND updated_at < ?)")
+            params.append(now - self.deleted_days * DAY)
+        if self.stale_days > 0:
+            conditions.append("(status = 'active' AND updated_at < ?)")
+            params.append(now - self.stale_days * DAY)
+        if not conditions:
+            return []
+
+        with storage.catalog.get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT session_id FROM sessions WHERE {' OR '.join(conditions)} LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [row["session_id"] for row in rows]
+
+    def _move(
+        self,
+        manager: DatabaseManager,
+        tables,
+        session_ids: List[str],
+        shard_data: bool = False,
+    ):
+        placeholders = ", ".join("?" * len(session_ids))
+        with manager.get_connection() as conn:
+            # 单库布局下消息先于会话行归档，归档库不做外键校验
+            conn.execute("PRAGMA foreign_keys=OFF")
+            conn.execute("ATTACH DATABASE ? AS archive", (str(self.archive.db_path),))
+            conn.execute("BEGIN IMMEDIATE")
+            if shard_data:
+                conn.execute(
+                    "INSERT OR IGNORE INTO archive.artifact_blobs "
+                    "SELECT * FROM main.artifact_blobs WHERE digest IN "
+                    f"(SELECT digest FROM main.session_artifacts WHERE session_id IN ({placeholders}))",
+                    session_ids,
+                )
+            for table in tables:
+                columns = _columns(conn, table)
+                conn.execute(
+                    f"DELETE FROM archive.{table} WHERE session_id IN ({placeholders})",
+                    session_ids,
+                )
+                conn.execute(
+                    f"INSERT INTO archive.{table} ({columns}) "
+                    f"SELECT {columns} FROM main.{table} WHERE session_id IN ({placeholders})",
+                    session_ids,
+                )
+            conn.commit()
+
+            conn.execute("BEGIN IMMEDIATE")
+            if shard_data:
+                # 产物正文可能仍被其他会话引用，只删除无引用的部分
+                artifact_store.purge(conn, session_ids)
+                # 检索索引引用的是在线库的消息 id，不归档
+                search_index.purge(conn, session_ids)
+                # 滚动摘要同样由消息派生
+                memory_store.purge(conn, session_ids)
+            for table in tables:
+                conn.execute(
+                    f"DELETE FROM main.{table} WHERE session_id IN ({placeholders})",
+                    session_ids,
+                )
+            conn.commit()
+            conn.execute("DETACH DATABASE archive")
+        if shard_data:
+            vector_memory.delete(session_ids)
+
+    def archive_batch(self, session_ids: List[str]):
+        by_shard: Dict[int, List[str]] = {}
+        for session_id in session_ids:
+            by_shard.setdefault(
+                storage.shards.index(storage.shard_for(session_id)), []
+            ).append(session_id)
+        for index, ids in by_shard.items():
+            self._move(storage.shards[index], SHARD_TABLES, ids, shard_data=True)
+        self._move(storage.catalog, ("sessions",), session_ids)
+
+    def run(self, dry_run: bool = False) -> int:
+        archived = 0
+        while True:
+            session_ids = self.find_expired(self.batch_size)
+            if not session_ids:
+                break
+            if dry_run:
+                # find_expired 不会前进，只统计一批
+                return len(session_ids)
+            self.archive_batch(session_ids)
+            archived += len(session_ids)
+            time.sleep(self.pause)
+        if archived:
+            logger.info(f"Archived sessions: {archived}")
+        return archived
+
+
+def compact(manager: DatabaseManager, vacuum_full: bool = False) -> Dict[str, Any]:
+    """回收空闲页并更新统计信息"""
+    conn = sqlite3.connect(manager.db_path, timeout=10.0)
+    try:
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if auto_vacuum != 2 and vacuum_full:
+            # 旧库需一次全量 VACUUM 才能切换为增量模式（期间独占数据库）
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            auto_vacuum = 2
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if auto_vacuum == 2:
+            conn.execute("PRAGMA incremental_vacuum")
+        # 限制 ANALYZE 的采样行数，避免大库上长时间持锁
+        conn.execute("PRAGMA analysis_limit=1000")
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {
+            "db": manager.db_path.name,
+            "incremental": auto_vacuum == 2,
+            "freed_pages": free_before
+            - conn.execute("PRAGMA freelist_count").fetchone()[0],
+        }
+    finally:
+        conn.close()
+
+
+def run_maintenance(dry_run: bool = False, vacuum_full: bool = False, **kwargs):
+    archived = RetentionJob(**kwargs).run(dry_run=dry_run)
+    if dry_run:
+        return archived, []
+    search_cache.prune()
+    managers = [storage.catalog] + [m for m in storage.shards if m is not storage.catalog]
+    return archived, [compact(m, vacuum_full) for m in managers]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话归档与数据库压缩")
+    parser.add_argument("--dry-run", action="store_true", help="只统计一批待归档会话")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument(
+        "--vacuum-full",
+        action="store_true",
+        help="旧库执行一次全量 VACUUM 并切换为增量模式",
+    )
+    args = parser.parse_args()
+
+    archived, stats = run_maintenance(
+        dry_run=args.dry_run, vacuum_full=args.vacuum_full, batch_size=args.batch_size
+    )
+    print(f"✓ {'待' if args.dry_run else '已'}归档会话: {archived}")
+    for item in stats:
+        print(
+            f"  {item['db']}: 回收 {item['freed_pages']} 页"
+            + ("" if item["incremental"] else "（非增量模式，可使用 --vacuum-full 转换）")
+        )
+
+
+if __name__ == "__main__":
+    main()
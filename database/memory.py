@@ -0,0 +1,80 @@
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from utils.crypto import encryptor
+
+from database.storage import storage
+
+
+class MemoryStore:
+    """会话滚动摘要：与消息位于同一分片，摘要使用会话数据密钥加密
+
+    摘要只由后台任务增量更新（旧摘要 + 新移出窗口的消息），写入时校验版本号，
+    并发的合并任务中只有先提交的生效。摘要由消息派生，归档时直接删除，不进入归档库。
+    """
+
+    def __init__(self):
+        self.storage = storage
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self.storage.shard_for(session_id).get_connection() as conn:
+            row = conn.execute(
+                "SELECT summary, upto_id, version FROM session_memory WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "summary": encryptor.decrypt_value(row["summary"], session_id),
+            "upto_id": row["upto_id"],
+            "version": row["version"],
+        }
+
+    def pending(
+        self, session_id: str, upto_id: int, tail: int, limit: int
+    ) -> List[Dict[str, Any]]:
+        """已移出最近 tail 条窗口、尚未合并的消息（按时间顺序，最多 limit 条）；有摘要时只解密摘要"""
+        with self.storage.shard_for(session_id).get_connection() as conn:
+            rows = conn.execute(
+                "SELECT id, role, COALESCE(digest, content) AS content FROM messages "
+                "WHERE session_id = ? AND id > ? AND id NOT IN "
+                "(SELECT id FROM messages WHERE session_id = ? ORDER BY created_at DESC LIMIT ?) "
+                "ORDER BY id LIMIT ?",
+                (session_id, upto_id, session_id, tail, limit),
+            ).fetchall()
+        contents = encryptor.decrypt_many([row["content"] for row in rows], session_id)
+        return [
+            {"id": row["id"], "role": row["role"], "content": content}
+            for row, content in zip(rows, contents)
+        ]
+
+    def save(
+        self, session_id: str, summary: str, upto_id: int, expected_version: int
+    ) -> bool:
+        """写入新摘要；版本号与读取时不一致（已被其他任务更新）时放弃并返回 False"""
+        encrypted = encryptor.encrypt_bytes(summary, session_id)
+        now = time.time()
+        with self.storage.shard_for(session_id).get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if expected_version == 0:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO session_memory (session_id, summary, upto_id, version, updated_at) VALUES (?, ?, ?, 1, ?)",
+                    (session_id, encrypted, upto_id, now),
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE session_memory SET summary = ?, upto_id = ?, version = version + 1, updated_at = ? "
+                    "WHERE session_id = ? AND version = ?",
+                    (encrypted, upto_id, now, session_id, expected_version),
+                )
+            return cursor.rowcount == 1
+
+    def purge(self, conn: sqlite3.Connection, session_ids: Sequence[str]):
+        conn.execute(
+            f"DELETE FROM session_memory WHERE session_id IN ({', '.join('?' * len(session_ids))})",
+            session_ids,
+        )
+
+
+memory_store = MemoryStore()
@@ -0,0 +1,341 @@
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _column_names(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _m001_baseline(conn: sqlite3.Connection):
+    """初始表结构（兼容 user_version 机制之前创建的数据库）"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            domain TEXT NOT NULL,
+            language TEXT DEFAULT '中文',
+            status TEXT DEFAULT 'active',
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            summary TEXT
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            metadata TEXT,
+            created_at REAL NOT NULL,
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS artifacts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            artifact_type TEXT NOT NULL,
+            title TEXT,
+            content TEXT NOT NULL,
+            language TEXT,
+            created_at REAL NOT NULL,
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+        )
+    """)
+
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_artifacts_session ON artifacts(session_id)"
+    )
+
+    # 早期数据库没有 summary 列
+    if "summary" not in _column_names(conn, "sessions"):
+        conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT")
+
+
+def _m002_history_indexes(conn: sqlite3.Connection):
+    """按会话读取历史 / 按状态列出会话的复合索引"""
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_messages_session_created "
+        "ON messages(session_id, created_at)"
+    )
+    # 复合索引已覆盖 session_id 前缀，旧索引只会增加写入开销
+    conn.execute("DROP INDEX IF EXISTS idx_messages_session")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sessions_status_updated "
+        "ON sessions(status, updated_at)"
+    )
+
+
+def _m003_session_keys(conn: sqlite3.Connection):
+    """会话数据密钥（由主密钥包装）"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_keys (
+            session_id TEXT PRIMARY KEY,
+            wrapped_key BLOB NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+
+
+def _m004_change_counter(conn: sqlite3.Connection):
+    """全局变更计数器：任何进程对会话数据的写入都会递增，用于缓存失效"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_counter (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO change_counter (id, value) VALUES (1, 0)")
+    for table in ("sessions", "messages", "artifacts"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_counter
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE change_counter SET value = value + 1 WHERE id = 1;
+                END
+            """)
+
+
+def _m005_storage_meta(conn: sqlite3.Connection):
+    """存储布局元数据（如分片数量）"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS storage_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+
+def _m006_active_partial_indexes(conn: sqlite3.Connection):
+    """只索引活跃会话：已删除 / 待归档的行不再占用热索引"""
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sessions_active_updated "
+        "ON sessions(updated_at) WHERE status = 'active'"
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_sessions_status_updated")
+
+
+def _m007_runs(conn: sqlite3.Connection):
+    """每轮运行的明文遥测（不含会话内容），供 SQL 直接统计延迟与吞吐"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS runs (
+            trace_id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            domain TEXT,
+            status TEXT NOT NULL,
+            error_class TEXT,
+            started_at REAL NOT NULL,
+            total_ms REAL NOT NULL,
+            understanding_ms REAL,
+            search_ms REAL,
+            analysis_ms REAL,
+            reflection_ms REAL,
+            code_ms REAL,
+            synthesis_ms REAL,
+            persist_ms REAL,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            cache_hits INTEGER,
+            cache_misses INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_started ON runs(started_at)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_runs_mode_started ON runs(mode, started_at)"
+    )
+
+
+def _m008_search_tokens(conn: sqlite3.Connection):
+    """盲化检索索引：HMAC(token) -> 消息，索引中不含明文"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS search_tokens (
+            token BLOB NOT NULL,
+            message_id INTEGER NOT NULL,
+            session_id TEXT NOT NULL,
+            tf INTEGER NOT NULL,
+            PRIMARY KEY (token, message_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_search_tokens_session ON search_tokens(session_id)"
+    )
+    # 此后写入的消息在写入时建立索引，之前的由后台回填
+    conn.execute(
+        "INSERT OR IGNORE INTO storage_meta (key, value) "
+        "SELECT 'search_backfill_upto', COALESCE(MAX(id), 0) FROM messages"
+    )
+
+
+def _m009_artifact_store(conn: sqlite3.Connection):
+    """内容寻址产物存储：正文按摘要去重存储一次，会话中只保存引用与元数据
+
+    旧 artifacts 表中的数据由后台回填迁移（需要解密，无法在 SQL 中完成）。
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS artifact_blobs (
+            digest BLOB PRIMARY KEY,
+            content BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_artifacts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            digest BLOB NOT NULL REFERENCES artifact_blobs(digest),
+            artifact_type TEXT NOT NULL,
+            title TEXT,
+            language TEXT,
+            explanation BLOB,
+            dependencies BLOB,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_session_artifacts_session "
+        "ON session_artifacts(session_id, created_at)"
+    )
+    # 清理无引用的正文时按摘要反查
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_session_artifacts_digest ON session_artifacts(digest)"
+    )
+
+
+def _m010_session_memory(conn: sqlite3.Connection):
+    """会话滚动摘要：移出近期窗口的消息逐步合并进摘要，upto_id 为已合并的最后一条消息"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_memory (
+            session_id TEXT PRIMARY KEY,
+            summary BLOB NOT NULL,
+            upto_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+
+
+def _m011_message_digest(conn: sqlite3.Connection):
+    """助手消息的精简摘要（加密），组装上下文时代替全文；旧消息为 NULL，回退到全文"""
+    if "digest" not in _column_names(conn, "messages"):
+        conn.execute("ALTER TABLE messages ADD COLUMN digest BLOB")
+
+
+def _m012_search_cache(conn: sqlite3.Connection):
+    """网络搜索结果缓存（键为规范化查询的带密钥摘要，结果加密），runs 记录每轮的缓存状态"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS search_cache (
+            key BLOB PRIMARY KEY,
+            domain TEXT NOT NULL,
+            response BLOB NOT NULL,
+            fetched_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            stale_until REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_search_cache_stale ON search_cache(stale_until)"
+    )
+    if "search_cache" not in _column_names(conn, "runs"):
+        conn.execute("ALTER TABLE runs ADD COLUMN search_cache TEXT")
+
+
+def _m013_search_policy(conn: sqlite3.Connection):
+    """runs 记录每轮选用的搜索策略及结果的有用率，供策略按历史数据调整"""
+    existing = _column_names(conn, "runs")
+    for column, kind in (
+        ("search_depth", "TEXT"),
+        ("search_max_results", "INTEGER"),
+        ("search_policy", "TEXT"),
+        ("search_useful", "REAL"),
+    ):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE runs ADD COLUMN {column} {kind}")
+
+
+def _m014_search_tokens_cjk_unigrams(conn: sqlite3.Connection):
+    """检索索引加入 CJK 单字 token：已有消息交给后台回填重新分词（重复写入是幂等的）"""
+    conn.execute(
+        "INSERT OR REPLACE INTO storage_meta (key, value) "
+        "SELECT 'search_backfill_upto', COALESCE(MAX(id), 0) FROM messages"
+    )
+
+
+def _m015_runs_detailed_stage(conn: sqlite3.Connection):
+    """详细分析单独计时（此前计入 code_ms，代码生成的分位数因此失真）"""
+    if "detailed_ms" not in _column_names(conn, "runs"):
+        conn.execute("ALTER TABLE runs ADD COLUMN detailed_ms REAL")
+
+
+# 按顺序追加，版本号即列表下标 + 1；已发布的迁移不得修改
+MIGRATIONS: List[Tuple[str, Callable[[sqlite3.Connection], None]]] = [
+    ("baseline", _m001_baseline),
+    ("history_indexes", _m002_history_indexes),
+    ("session_keys", _m003_session_keys),
+    ("change_counter", _m004_change_counter),
+    ("storage_meta", _m005_storage_meta),
+    ("active_partial_indexes", _m006_active_partial_indexes),
+    ("runs", _m007_runs),
+    ("search_tokens", _m008_search_tokens),
+    ("artifact_store", _m009_artifact_store),
+    ("session_memory", _m010_session_memory),
+    ("message_digest", _m011_message_digest),
+    ("search_cache", _m012_search_cache),
+    ("search_policy", _m013_search_policy),
+    ("search_tokens_cjk_unigrams", _m014_search_tokens_cjk_unigrams),
+    ("runs_detailed_stage", _m015_runs_detailed_stage),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """将数据库升级到最新版本，返回执行的迁移数量
+
+    调用方需使用未开启事务的连接；每个迁移在独立的 IMMEDIATE 事务中执行，
+    多进程同时启动时只有一个进程会真正执行迁移。
+    """
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return 0
+
+    # 新建的空库启用增量 VACUUM（必须在建表前设置），供维护任务回收空间
+    if conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+
+    # WAL 模式持久化在数据库文件中，只需设置一次
+    conn.execute("PRAGMA journal_mode=WAL")
+
+    applied = 0
+    for version, (name, step) in enumerate(MIGRATIONS, start=1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 获取写锁后重新读取，其他进程可能已完成该迁移
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied += 1
+        logger.info(f"Schema migration applied: {version:03d}_{name}")
+
+    return applied
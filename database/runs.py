@@ -0,0 +1,204 @@
+"""运行遥测：runs 表读写与统计
+
+runs 表只保存非敏感的运行指标（trace_id、模式、各阶段耗时、token 数等），
+位于目录库，统计完全在 SQL 中完成，无需解密任何消息。
+
+用法: python -m database.runs [--since 7d] [--mode deep_thinking] [--by mode]
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List, Optional
+
+from database.storage import storage
+
+# 与 runs 表中的 <stage>_ms 列一一对应
+RUN_STAGES = (
+    "understanding",
+    "search",
+    "analysis",
+    "reflection",
+    "detailed",
+    "code",
+    "synthesis",
+    "persist",
+)
+
+RUN_COLUMNS = (
+    "trace_id",
+    "session_id",
+    "mode",
+    "domain",
+    "status",
+    "error_class",
+    "started_at",
+    "total_ms",
+    *(f"{stage}_ms" for stage in RUN_STAGES),
+    "input_tokens",
+    "output_tokens",
+    "cache_hits",
+    "cache_misses",
+    "search_cache",
+    "search_depth",
+    "search_max_results",
+    "search_policy",
+    "search_useful",
+)
+
+GROUP_COLUMNS = ("mode", "domain", "status", "search_depth")
+
+PERCENTILES = (50, 95, 99)
+
+_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+class RunStore:
+    """runs 表的写入与聚合查询"""
+
+    def __init__(self):
+        self.storage = storage
+
+    def record(self, run: Dict[str, Any]):
+        columns = [c for c in RUN_COLUMNS if c in run]
+        with self.storage.catalog.get_connection() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO runs ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                [run[c] for c in columns],
+            )
+
+    def _filter(self, since: float, mode: Optional[str]):
+        clause, params = "started_at >= ?", [since]
+        if mode:
+            clause += " AND mode = ?"
+            params.append(mode)
+        return clause, params
+
+    def summary(
+        self, since: float, mode: Optional[str] = None, by: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """按分组统计次数、吞吐（次/小时）、错误率与平均 token 数"""
+        group = _group_expr(by)
+        clause, params = self._filter(since, mode)
+        window_hours = max(time.time() - since, 1.0) / 3600
+        with self.storage.catalog.get_connection() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT {group} AS grp,
+                       COUNT(*) AS runs,
+                       COUNT(*) / ? AS per_hour,
+                       AVG(status = 'error') AS error_rate,
+                       AVG(input_tokens) AS input_tokens,
+                       AVG(output_tokens) AS output_tokens,
+                       SUM(cache_hits) * 1.0 / NULLIF(SUM(cache_hits) + SUM(cache_misses), 0) AS cache_hit_rate,
+                       SUM(search_cache IN ('hit', 'stale')) * 1.0 / NULLIF(COUNT(search_cache), 0) AS search_hit_rate,
+                       AVG(search_useful) AS search_useful
+                FROM runs WHERE {clause}
+                GROUP BY grp ORDER BY runs DESC
+                """,
+                [window_hours, *params],
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search_stats(self, since: float) -> List[Dict[str, Any]]:
+        """按 (领域, 搜索深度) 统计结果有用率与实际搜索（缓存未命中）的平均耗时"""
+        with self.storage.catalog.get_connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT domain, search_depth,
+                       COUNT(search_useful) AS n,
+                       AVG(search_useful) AS useful,
+                       AVG(CASE WHEN search_cache = 'miss' THEN search_ms END) AS miss_ms
+                FROM runs
+                WHERE started_at >= ? AND search_depth IS NOT NULL AND status = 'ok'
+                GROUP BY domain, search_depth
+                """,
+                (since,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def percentiles(
+        self,
+        since: float,
+        column: str = "total_ms",
+        mode: Optional[str] = None,
+        by: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """最近秩法分位数：第 p 分位取排序后第 ceil(p/100 * n) 个值"""
+        if column not in RUN_COLUMNS or not column.endswith("_ms"):
+            raise ValueError(f"Not a duration column: {column}")
+        group = _group_expr(by)
+        clause, params = self._filter(since, mode)
+        selects = ", ".join(
+            f"MIN(CASE WHEN rn * 100 >= {p} * n THEN v END) AS p{p}"
+            for p in PERCENTILES
+        )
+        with self.storage.catalog.get_connection() as conn:
+            rows = conn.execute(
+                f"""
+                WITH ranked AS (
+                    SELECT {group} AS grp, {column} AS v,
+                           ROW_NUMBER() OVER (PARTITION BY {group} ORDER BY {column}) AS rn,
+                           COUNT(*) OVER (PARTITION BY {group}) AS n
+                    FROM runs WHERE {clause} AND {column} IS NOT NULL
+                )
+                SELECT grp, MAX(n) AS n, {selects} FROM ranked GROUP BY grp ORDER BY grp
+                """,
+                params,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def _group_expr(by: Optional[str]) -> str:
+    if by is None:
+        return "'all'"
+    if by not in GROUP_COLUMNS:
+        raise ValueError(f"Unsupported group column: {by}")
+    return f"COALESCE({by}, '-')"
+
+
+def parse_since(value: str) -> float:
+    """'30m' / '24h' / '7d' -> 起始时间戳"""
+    unit = value[-1].lower()
+    if unit not in _UNITS:
+        raise argparse.ArgumentTypeError(f"无法解析时间范围: {value}")
+    return time.time() - float(value[:-1]) * _UNITS[unit]
+
+
+run_store = RunStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="运行延迟 / 吞吐统计")
+    parser.add_argument("--since", type=parse_since, default="7d", help="如 24h、7d")
+    parser.add_argument("--mode", help="只统计某种处理模式")
+    parser.add_argument("--by", choices=GROUP_COLUMNS, help="分组列")
+    parser.add_argument(
+        "--stages", action="store_true", help="同时输出各阶段耗时分位数"
+    )
+    args = parser.parse_args()
+
+    for row in run_store.summary(args.since, args.mode, args.by):
+        hit_rate = row["cache_hit_rate"]
+        search_rate = row["search_hit_rate"]
+        useful = row["search_useful"]
+        print(
+            f"[{row['grp']}] runs={row['runs']}  {row['per_hour']:.2f}/h  "
+            f"errors={row['error_rate']:.1%}  "
+            f"tokens={row['input_tokens'] or 0:.0f}/{row['output_tokens'] or 0:.0f}  "
+            f"cache={'-' if hit_rate is None else f'{hit_rate:.1%}'}  "
+            f"search_cache={'-' if search_rate is None else f'{search_rate:.1%}'}  "
+            f"search_useful={'-' if useful is None else f'{useful:.1%}'}"
+        )
+
+    columns = ["total_ms"]
+    if args.stages:
+        columns += [f"{stage}_ms" for stage in RUN_STAGES]
+    for column in columns:
+        for row in run_store.percentiles(args.since, column, args.mode, args.by):
+            values = "  ".join(f"p{p}={row[f'p{p}']:.0f}" for p in PERCENTILES)
+            print(f"  {column:<18} [{row['grp']}] n={row['n']:<6} {values}")
+
+
+if __name__ == "__main__":
+    main()
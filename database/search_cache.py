@@ -0,0 +1,248 @@
+"""网络搜索结果缓存
+
+键为规范化查询（NFKC、忽略大小写 / 多余空白 / 首尾句读）与搜索参数的带密钥摘要，结果用主密钥加密，
+缓存表中不含明文查询。新鲜期按类别区分：时效性查询（新闻、价格、"最新"等）很短，
+医疗 / 法律等参考资料较长。过期但仍在宽限期内的结果直接返回，同时在后台刷新。
+命中次数先在内存中累计，分批在后台写入，读缓存不占用目录库的写锁。
+
+用法:
+    python -m database.search_cache stats
+    python -m database.search_cache prune
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional, Set
+
+from config.settings import (
+    SEARCH_CACHE_ENABLED,
+    SEARCH_CACHE_STALE_FACTOR,
+    SEARCH_CACHE_TTL,
+)
+from utils.crypto import encryptor
+
+from database.storage import storage
+
+logger = logging.getLogger(__name__)
+
+# 累计命中达到该次数或距上次写入超过该秒数时，在后台批量写入 hits
+HIT_FLUSH_COUNT = 100
+HIT_FLUSH_INTERVAL = 60.0
+
+# 时效性查询：无论领域都使用 news 的新鲜期
+_NEWS_RE = re.compile(
+    r"最新|今天|今日|昨天|本周|近期|新闻|实时|股价|汇率|价格|比分|天气|"
+    r"\b(latest|today|yesterday|breaking|news|price|stock|score|weather|this week)\b|"
+    r"(?<!\d)20\d\d(?!\d)",
+    re.I,
+)
+# 只去掉首尾的句读与引号；词内与词尾的符号（C++、C#、3.10、>）和词序都有语义，必须保留
+_EDGE_PUNCT = "\\s.,;:!?…\"'“”‘’。，、；：！？「」『』"
+_EDGE_RE = re.compile(f"^[{_EDGE_PUNCT}]+|[{_EDGE_PUNCT}]+$")
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询：只忽略全半角、大小写、空白以及首尾句读的差异"""
+    text = " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+    return _EDGE_RE.sub("", text)
+
+
+def cache_class(query: str, domain: Optional[str]) -> str:
+    if _NEWS_RE.search(query):
+        return "news"
+    return domain if domain in SEARCH_CACHE_TTL else "general"
+
+
+class CachedSearch(NamedTuple):
+    response: Dict[str, Any]
+    stale: bool
+
+
+class SearchCache:
+    def __init__(self, enabled: bool = SEARCH_CACHE_ENABLED):
+        self.enabled = enabled
+        self.storage = storage
+        self._lock = threading.Lock()
+        self._refreshing: Set[bytes] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0}
+        # 尚未写入的命中次数
+        self._pending_hits: Dict[bytes, int] = {}
+        self._hits_flushed_at = time.monotonic()
+
+    def _key(self, query: str, params: Dict[str, Any]) -> bytes:
+        return encryptor.content_digest(
+            "search:" + normalize_query(query) + json.dumps(params, sort_keys=True)
+        )
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="search-refresh"
+                )
+            return self._executor
+
+    def _record_hit(self, key: bytes):
+        with self._lock:
+            self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+            due = (
+                sum(self._pending_hits.values()) >= HIT_FLUSH_COUNT
+                or time.monotonic() - self._hits_flushed_at >= HIT_FLUSH_INTERVAL
+            )
+        if due:
+            self._pool().submit(self.flush_hits)
+
+    def flush_hits(self) -> int:
+        """将内存中累计的命中次数写入缓存表（一个事务），返回写入的条目数"""
+        with self._lock:
+            pending = [(count, key) for key, count in self._pending_hits.items()]
+            self._pending_hits.clear()
+            self._hits_flushed_at = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            with self.storage.catalog.get_connection() as conn:
+                conn.executemany(
+                    "UPDATE search_cache SET hits = hits + ? WHERE key = ?", pending
+                )
+        except Exception as e:
+            logger.warning(f"Search cache hit counts not saved: {e}")
+            return 0
+        return len(pending)
+
+    def lookup(self, query: str, params: Dict[str, Any]) -> Optional[CachedSearch]:
+        """命中（含宽限期内的过期结果）时返回缓存，否则返回 None"""
+        if not self.enabled:
+            return None
+        key = self._key(query, params)
+        now = time.time()
+        with self.storage.catalog.get_connection() as conn:
+            row = conn.execute(
+                "SELECT response, expires_at FROM search_cache WHERE key = ? AND stale_until > ?",
+                (key, now),
+            ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        self._record_hit(key)
+        stale = row["expires_at"] <= now
+        self._count("stale_hits" if stale else "hits")
+        return CachedSearch(json.loads(encryptor.decrypt_value(row["response"])), stale)
+
+    def store(
+        self,
+        query: str,
+        params: Dict[str, Any],
+        domain: Optional[str],
+        response: Dict[str, Any],
+    ):
+        if not self.enabled:
+            return
+        category = cache_class(query, domain)
+        ttl = SEARCH_CACHE_TTL[category]
+        now = time.time()
+        with self.storage.catalog.get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, domain, response, fetched_at, expires_at, stale_until) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self._key(query, params),
+                    category,
+                    encryptor.encrypt_bytes(json.dumps(response, ensure_ascii=False)),
+                    now,
+                    now + ttl,
+                    now + ttl * SEARCH_CACHE_STALE_FACTOR,
+                ),
+            )
+
+    def revalidate(
+        self,
+        query: str,
+        params: Dict[str, Any],
+        domain: Optional[str],
+        fetch: Callable[[], Dict[str, Any]],
+    ):
+        """后台重新搜索并更新缓存；同一查询同时只刷新一次"""
+        key = self._key(query, params)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._pool().submit(self._refresh, key, query, params, domain, fetch)
+
+    def _refresh(self, key, query, params, domain, fetch):
+        try:
+            self.store(query, params, domain, fetch())
+            self._count("refreshes")
+        except Exception as e:
+            logger.warning(f"Search cache refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """进程内计数（hit_rate 含宽限期内的过期命中）"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["hits"] + stats["stale_hits"]) / lookups if lookups else None
+        )
+        return stats
+
+    def table_stats(self):
+        """按类别统计条目数、有效条目数与累计命中次数"""
+        self.flush_hits()
+        now = time.time()
+        with self.storage.catalog.get_connection() as conn:
+            rows = conn.execute(
+                "SELECT domain, COUNT(*) AS entries, SUM(expires_at > ?) AS fresh, "
+                "SUM(hits) AS hits FROM search_cache GROUP BY domain ORDER BY entries DESC",
+                (now,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune(self) -> int:
+        """删除超出宽限期的条目"""
+        with self.storage.catalog.get_connection() as conn:
+            return conn.execute(
+                "DELETE FROM search_cache WHERE stale_until <= ?", (time.time(),)
+            ).rowcount
+
+
+search_cache = SearchCache()
+# 进程退出前写入尚未落盘的命中次数
+atexit.register(search_cache.flush_hits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网络搜索结果缓存")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats")
+    sub.add_parser("prune")
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        print(f"✓ 已删除 {search_cache.prune()} 条过期缓存")
+        return
+    for row in search_cache.table_stats():
+        print(
+            f"[{row['domain']}] entries={row['entries']}  fresh={row['fresh']}  "
+            f"hits={row['hits']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
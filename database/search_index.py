@@ -0,0 +1,228 @@
+"""会话全文检索：写入时分词，只存储 token 的带密钥 HMAC（盲化索引）
+
+查询时对关键词做同样的分词与 HMAC，在 search_tokens 表中按 idf 加权打分，
+全程不解密任何消息。中文 / 日文 / 韩文按字符二元组切分，其他文字按单词切分。
+
+用法:
+    python -m database.search_index search "关键词"
+    python -m database.search_index backfill
+"""
+
+import argparse
+import logging
+import math
+import sqlite3
+import time
+from collections import Counter
+from typing import Any, Dict, List, Sequence, Tuple
+
+from config.settings import SEARCH_INDEX_MAX_TOKENS
+from utils.crypto import encryptor
+from utils.text import tokenize
+
+from database.manager import DatabaseManager
+from database.storage import storage
+
+logger = logging.getLogger(__name__)
+
+# 出现在超过该比例消息中的 token 区分度太低，有其他 token 时不参与匹配
+COMMON_TOKEN_RATIO = 0.5
+
+# (盲化 token, 词频)
+Tokens = List[Tuple[bytes, int]]
+
+
+class SearchIndex:
+    """search_tokens 位于消息所在分片，与消息在同一事务内写入"""
+
+    def __init__(self, max_tokens: int = SEARCH_INDEX_MAX_TOKENS):
+        self.storage = storage
+        self.max_tokens = max_tokens
+
+    def prepare(self, text: str) -> Tokens:
+        """分词并盲化（在写事务之外调用）；长消息只保留词频最高的 token"""
+        if not text:
+            return []
+        return [
+            (encryptor.blind_token(token), tf)
+            for token, tf in tokenize(text).most_common(self.max_tokens)
+        ]
+
+    def write(
+        self,
+        conn: sqlite3.Connection,
+        session_id: str,
+        message_id: int,
+        tokens: Tokens,
+    ):
+        conn.executemany(
+            "INSERT OR REPLACE INTO search_tokens (token, message_id, session_id, tf) VALUES (?, ?, ?, ?)",
+            [(token, message_id, session_id, tf) for token, tf in tokens],
+        )
+
+    def _stats(self, manager: DatabaseManager, tokens: Sequence[bytes]):
+        placeholders = ", ".join("?" * len(tokens))
+        with manager.get_connection() as conn:
+            df = conn.execute(
+                f"SELECT token, COUNT(*) FROM search_tokens WHERE token IN ({placeholders}) GROUP BY token",
+                tokens,
+            ).fetchall()
+            total = conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM messages"
+            ).fetchone()[0]
+        return {bytes(row[0]): row[1] for row in df}, total
+
+    def _query_shard(
+        self, manager: DatabaseManager, weights: Dict[bytes, float], limit: int
+    ) -> List[Dict[str, Any]]:
+        values = ", ".join("(?, ?)" for _ in weights)
+        params = [item for pair in weights.items() for item in pair]
+        with manager.get_connection() as conn:
+            rows = conn.execute(
+                f"""
+                WITH q(token, weight) AS (VALUES {values})
+                SELECT t.session_id, t.message_id,
+                       COUNT(*) AS matched,
+                       SUM(q.weight * (1 + MIN(t.tf, 5) * 0.2)) AS score
+                FROM q JOIN search_tokens t ON t.token = q.token
+                GROUP BY t.message_id
+                ORDER BY matched DESC, score DESC
+                LIMIT ?
+                """,
+                (*params, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """按匹配的 token 数、idf 加权得分排序，返回 [{session_id, message_id, matched, score}]"""
+        tokens = list({encryptor.blind_token(t) for t in tokenize(query, query=True)})
+        if not tokens:
+            return []
+
+        df: Counter = Counter()
+        total = 0
+        for shard_df, shard_total in self.storage.fan_out(
+            lambda m: self._stats(m, tokens)
+        ):
+            df.update(shard_df)
+            total += shard_total
+        if not df:
+            return []
+
+        weights = {t: math.log(1 + total / n) for t, n in df.items()}
+        selective = {
+            t: w for t, w in weights.items() if df[t] <= total * COMMON_TOKEN_RATIO
+        }
+        weights = selective or weights
+
+        hits = [
+            hit
+            for shard_hits in self.storage.fan_out(
+                lambda m: self._query_shard(m, weights, limit)
+            )
+            for hit in shard_hits
+        ]
+        hits.sort(key=lambda h: (h["matched"], h["score"]), reverse=True)
+        return hits[:limit]
+
+    def purge(self, conn: sqlite3.Connection, session_ids: Sequence[str]):
+        conn.execute(
+            f"DELETE FROM search_tokens WHERE session_id IN ({', '.join('?' * len(session_ids))})",
+            session_ids,
+        )
+
+
+class SearchIndexBackfill:
+    """为建立索引之前的消息补建索引：按 id 从大到小分批，进度记录在 storage_meta"""
+
+    def __init__(
+        self,
+        manager: DatabaseManager,
+        batch_size: int = 200,
+        pause: float = 0.05,
+    ):
+        self.manager = manager
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def _backfill_upto(self, conn) -> int:
+        row = conn.execute(
+            "SELECT value FROM storage_meta WHERE key = 'search_backfill_upto'"
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    def run_batch(self) -> int:
+        with self.manager.get_connection() as conn:
+            upto = self._backfill_upto(conn)
+            if upto <= 0:
+                return 0
+            rows = conn.execute(
+                "SELECT id, session_id, content FROM messages WHERE id <= ? ORDER BY id DESC LIMIT ?",
+                (upto, self.batch_size),
+            ).fetchall()
+
+        # 解密与分词在写事务之外完成
+        prepared = [
+            (
+                row["session_id"],
+                row["id"],
+                search_index.prepare(
+                    encryptor.decrypt_value(row["content"], row["session_id"])
+                ),
+            )
+            for row in rows
+        ]
+        next_upto = rows[-1]["id"] - 1 if rows else 0
+
+        with self.manager.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for session_id, message_id, tokens in prepared:
+                search_index.write(conn, session_id, message_id, tokens)
+            conn.execute(
+                "UPDATE storage_meta SET value = ? WHERE key = 'search_backfill_upto'",
+                (next_upto,),
+            )
+        return len(rows)
+
+    def run(self) -> int:
+        total = 0
+        while True:
+            count = self.run_batch()
+            if not count:
+                break
+            total += count
+            time.sleep(self.pause)
+        if total:
+            logger.info(f"Search index backfilled: {total} messages")
+        return total
+
+
+def backfill_all(pause: float = 0.05) -> int:
+    """在所有分片上并行回填"""
+    return sum(storage.fan_out(lambda m: SearchIndexBackfill(m, pause=pause).run()))
+
+
+search_index = SearchIndex()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话全文检索（盲化索引）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    search_cmd = sub.add_parser("search")
+    search_cmd.add_argument("query")
+    search_cmd.add_argument("--limit", type=int, default=20)
+    sub.add_parser("backfill")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        print(f"✓ 已建立索引 {backfill_all(pause=0)} 条消息")
+        return
+    for hit in search_index.search(args.query, args.limit):
+        print(
+            f"{hit['session_id']}  #{hit['message_id']:<8} "
+            f"matched={hit['matched']}  score={hit['score']:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,110 +1,382 @@
 import json
+import logging
 import time
 import uuid
-from typing import Any, Dict, List, Optional
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
-from core.models import CodeArtifact
 from utils.crypto import encryptor
 
-from database.manager import db
+from database.artifacts import artifact_store
+from database.cache import SessionCache, read_change_counter
+from database.keystore import SessionKeyStore
+from database.manager import DatabaseManager
+from database.memory import memory_store
+from database.search_index import search_index
+from database.storage import storage
+from database.vector_memory import vector_memory
+
+if TYPE_CHECKING:
+    # 仅用于类型标注：运行时导入 core 会经由 core.pipeline 循环导入本模块
+    from core.models import CodeArtifact
+
+logger = logging.getLogger(__name__)
+
+# 会话数据密钥持久化在 session_keys 表中，启用信封加密
+encryptor.set_key_store(SessionKeyStore(storage))
+
+
+def _load_metadata(decrypted: str) -> Optional[Dict]:
+    """无法解析的元数据（如无法解密、按原样返回的旧格式值）记为空，不影响整个会话的读取"""
+    if not decrypted:
+        return None
+    try:
+        return json.loads(decrypted)
+    except ValueError as e:
+        logger.warning(f"Message metadata not decodable: {e}")
+        return None
+
+
+class LazyMessage(dict):
+    """延迟解密的消息记录：首次读取 content / metadata 时才解密
+
+    注意 dict(msg) / {**msg} 会绕过延迟加载，复制前请先读取所需字段。
+    """
+
+    _LAZY_KEYS = ("content", "metadata", "digest")
+
+    def __init__(self, row, session_id: str):
+        data = dict(row)
+        self._encrypted = {key: data.pop(key, None) for key in self._LAZY_KEYS}
+        self._session_id = session_id
+        super().__init__(data)
+
+    def __missing__(self, key):
+        if key not in self._encrypted:
+            raise KeyError(key)
+        decrypted = encryptor.decrypt_value(self._encrypted.pop(key), self._session_id)
+        value = _load_metadata(decrypted) if key == "metadata" else decrypted
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self._encrypted or super().__contains__(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
 
 
 class SessionManager:
+    """会话读写入口：sessions 表位于 storage.catalog，消息与产物位于会话所在分片"""
+
+    def __init__(self):
+        self.storage = storage
+        self.cache = SessionCache()
+
+    @contextmanager
+    def _read(self, manager: DatabaseManager):
+        """读连接：先用变更计数校验缓存，使其他进程的写入可见"""
+        with manager.get_connection() as conn:
+            if self.cache.enabled:
+                self.cache.validate(str(manager.db_path), read_change_counter(conn))
+            yield conn
+
+    @contextmanager
+    def _write(self, manager: DatabaseManager):
+        """写事务：IMMEDIATE 事务内记录写入前后的变更计数，提交后同步给缓存"""
+        with manager.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = read_change_counter(conn)
+            yield conn
+            after = read_change_counter(conn)
+        self.cache.after_write(str(manager.db_path), before, after)
+
+    def _touch_session(self, conn, session_id: str, now: float):
+        conn.execute(
+            "UPDATE sessions SET updated_at = ? WHERE session_id = ?",
+            (now, session_id),
+        )
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
+
     def create_session(self, title: str, domain: str, language: str = "中文") -> str:
         session_id = str(uuid.uuid4())
         now = time.time()
 
-        with db.get_connection() as conn:
+        with self._write(self.storage.catalog) as conn:
             conn.execute(
                 "INSERT INTO sessions (session_id, title, domain, language, created_at, updated_at, summary, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                 (session_id, title, domain, language, now, now, "", "active"),
             )
+        self.cache.put_session(
+            session_id,
+            {
+                "session_id": session_id,
+                "title": title,
+                "domain": domain,
+                "language": language,
+                "status": "active",
+                "created_at": now,
+                "updated_at": now,
+                "summary": "",
+            },
+        )
         return session_id
 
     def list_sessions(
         self, domain: Optional[str] = None, status: str = "active"
     ) -> List[Dict[str, Any]]:
-        with db.get_connection() as conn:
-            if domain and domain != "all":
-                rows = conn.execute(
-                    "SELECT * FROM sessions WHERE domain = ? AND status = ? ORDER BY updated_at DESC",
-                    (domain, status),
-                ).fetchall()
+        key = (domain if domain and domain != "all" else None, status)
+        with self._read(self.storage.catalog) as conn:
+            cached = self.cache.get_list(key)
+            if cached is not None:
+                return cached
+
+            # 活跃会话使用字面量条件，查询规划器才会选用 status = 'active' 的部分索引
+            if status == "active":
+                status_clause, params = "status = 'active'", []
             else:
-                rows = conn.execute(
-                    "SELECT * FROM sessions WHERE status = ? ORDER BY updated_at DESC",
-                    (status,),
-                ).fetchall()
-        return [dict(row) for row in rows]
+                status_clause, params = "status = ?", [status]
+            if key[0]:
+                status_clause += " AND domain = ?"
+                params.append(domain)
+            rows = conn.execute(
+                f"SELECT * FROM sessions WHERE {status_clause} ORDER BY updated_at DESC",
+                params,
+            ).fetchall()
+        sessions = [dict(row) for row in rows]
+        self.cache.put_list(key, sessions)
+        return sessions
 
     def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        with db.get_connection() as conn:
+        with self._read(self.storage.catalog) as conn:
+            hit, session = self.cache.get_session(session_id)
+            if hit:
+                return session
             row = conn.execute(
                 "SELECT * FROM sessions WHERE session_id = ?", (session_id,)
             ).fetchone()
-            return dict(row) if row else None
+        if not row:
+            return None
+        self.cache.put_session(session_id, dict(row))
+        return dict(row)
 
     def add_message(
-        self, session_id: str, role: str, content: str, metadata: Optional[Dict] = None
+        self,
+        session_id: str,
+        role: str,
+        content: str,
+        metadata: Optional[Dict] = None,
+        digest: Optional[str] = None,
     ):
         # 加密消息内容
-        encrypted_content = encryptor.encrypt(content)
+        encrypted_content = encryptor.encrypt_bytes(content, session_id)
         encrypted_metadata = (
-            encryptor.encrypt(json.dumps(metadata)) if metadata else None
+            encryptor.encrypt_bytes(json.dumps(metadata), session_id)
+            if metadata
+            else None
         )
+        encrypted_digest = encryptor.encrypt_bytes(digest, session_id) if digest else None
+        # 检索 token 在写事务之外计算
+        search_tokens = search_index.prepare(content)
 
-        with db.get_connection() as conn:
-            conn.execute(
-                "INSERT INTO messages (session_id, role, content, metadata, created_at) VALUES (?, ?, ?, ?, ?)",
-                (session_id, role, encrypted_content, encrypted_metadata, time.time()),
-            )
-            conn.execute(
-                "UPDATE sessions SET updated_at = ? WHERE session_id = ?",
-                (time.time(), session_id),
+        now = time.time()
+        colocated = self.storage.is_colocated(session_id)
+        with self._write(self.storage.shard_for(session_id)) as conn:
+            cursor = conn.execute(
+                "INSERT INTO messages (session_id, role, content, metadata, digest, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    session_id,
+                    role,
+                    encrypted_content,
+                    encrypted_metadata,
+                    encrypted_digest,
+                    now,
+                ),
             )
+            search_index.write(conn, session_id, cursor.lastrowid, search_tokens)
+            if colocated:
+                self._touch_session(conn, session_id, now)
+        if not colocated:
+            # 分片布局下会话行在目录库，无法与消息写入合并为一个事务
+            with self._write(self.storage.catalog) as conn:
+                self._touch_session(conn, session_id, now)
+        self.cache.append_message(
+            session_id,
+            {
+                "id": cursor.lastrowid,
+                "session_id": session_id,
+                "role": role,
+                "content": content,
+                "metadata": metadata or None,
+                "digest": digest or None,
+                "created_at": now,
+            },
+        )
+        self.cache.update_session(session_id, updated_at=now)
+        vector_memory.enqueue(session_id, cursor.lastrowid, content)
 
         # 自动更新会话摘要（仅在用户消息时，使用明文）
         if role == "user":
             self.update_session_summary(session_id, content)
 
-    def get_messages(self, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        with db.get_connection() as conn:
+    def get_messages(
+        self, session_id: str, limit: int = 50, lazy: bool = False
+    ) -> List[Dict[str, Any]]:
+        """读取会话最近 limit 条消息（按时间顺序）；lazy=True 时返回 LazyMessage，仅在访问内容时解密"""
+        with self._read(self.storage.shard_for(session_id)) as conn:
+            cached = self.cache.get_messages(session_id, limit)
+            if cached is not None:
+                return cached
             rows = conn.execute(
-                "SELECT * FROM messages WHERE session_id = ? ORDER BY created_at ASC LIMIT ?",
+                "SELECT * FROM messages WHERE session_id = ? ORDER BY created_at DESC LIMIT ?",
                 (session_id, limit),
             ).fetchall()
+        rows.reverse()
+
+        if lazy:
+            return [LazyMessage(row, session_id) for row in rows]
+
+        # 批量解密消息内容（行数较多时并行）
+        contents = encryptor.decrypt_many([row["content"] for row in rows], session_id)
+        metadata = encryptor.decrypt_many([row["metadata"] for row in rows], session_id)
+        digests = encryptor.decrypt_many([row["digest"] for row in rows], session_id)
 
-        # 解密消息内容
         messages = []
-        for row in rows:
+        for row, content, meta, digest in zip(rows, contents, metadata, digests):
             msg = dict(row)
-            msg["content"] = encryptor.decrypt(msg["content"])
-            if msg.get("metadata"):
-                try:
-                    msg["metadata"] = json.loads(encryptor.decrypt(msg["metadata"]))
-                except:
-                    msg["metadata"] = None
+            msg["content"] = content
+            msg["metadata"] = _load_metadata(meta)
+            msg["digest"] = digest or None
             messages.append(msg)
 
+        # 返回行数小于 limit 说明已取到全部消息，后续新消息可直接追加到缓存
+        self.cache.put_messages(session_id, messages, complete=len(rows) < limit)
         return messages
 
-    def save_artifact(self, session_id: str, artifact: CodeArtifact):
-        # 加密代码内容
-        encrypted_code = encryptor.encrypt(artifact.code)
-        encrypted_explanation = encryptor.encrypt(artifact.explanation)
+    def get_context_messages(
+        self, session_id: str, limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """组装上下文用的最近消息：有摘要的助手消息以摘要作为 content，只解密摘要不解密全文
 
-        with db.get_connection() as conn:
-            conn.execute(
-                "INSERT INTO artifacts (session_id, artifact_type, title, content, language, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (
-                    session_id,
-                    "code",
-                    artifact.title,
-                    encrypted_code,
-                    artifact.language,
-                    time.time(),
-                ),
+        结果不含 metadata，也不写入消息缓存（内容与 get_messages 不同）。
+        """
+        with self._read(self.storage.shard_for(session_id)) as conn:
+            cached = self.cache.get_messages(session_id, limit)
+            if cached is None:
+                rows = conn.execute(
+                    "SELECT id, session_id, role, COALESCE(digest, content) AS content, created_at "
+                    "FROM messages WHERE session_id = ? ORDER BY created_at DESC LIMIT ?",
+                    (session_id, limit),
+                ).fetchall()
+        if cached is not None:
+            return [
+                {
+                    "id": m["id"],
+                    "session_id": session_id,
+                    "role": m["role"],
+                    "content": m.get("digest") or m["content"],
+                    "created_at": m["created_at"],
+                }
+                for m in cached
+            ]
+        rows.reverse()
+        contents = encryptor.decrypt_many([row["content"] for row in rows], session_id)
+        messages = []
+        for row, content in zip(rows, contents):
+            msg = dict(row)
+            msg["content"] = content
+            messages.append(msg)
+        return messages
+
+    def get_first_message(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """会话的第一条消息（用于生成摘要 / 标题）"""
+        with self._read(self.storage.shard_for(session_id)) as conn:
+            row = conn.execute(
+                "SELECT * FROM messages WHERE session_id = ? ORDER BY created_at ASC LIMIT 1",
+                (session_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        message = dict(row)
+        message["content"] = encryptor.decrypt_value(row["content"], session_id)
+        message["metadata"] = _load_metadata(
+            encryptor.decrypt_value(row["metadata"], session_id)
+        )
+        return message
+
+    def get_messages_by_ids(
+        self, session_id: str, message_ids: List[int]
+    ) -> List[Dict[str, Any]]:
+        """按 id 读取消息（按时间顺序）"""
+        if not message_ids:
+            return []
+        with self._read(self.storage.shard_for(session_id)) as conn:
+            rows = conn.execute(
+                f"SELECT * FROM messages WHERE session_id = ? AND id IN ({', '.join('?' * len(message_ids))}) ORDER BY created_at",
+                (session_id, *message_ids),
+            ).fetchall()
+        contents = encryptor.decrypt_many([row["content"] for row in rows], session_id)
+        messages = []
+        for row, content in zip(rows, contents):
+            msg = dict(row)
+            msg["content"] = content
+            msg["metadata"] = _load_metadata(
+                encryptor.decrypt_value(row["metadata"], session_id)
             )
+            messages.append(msg)
+        return messages
+
+    def recall(self, session_id: str, query: str) -> List[Dict[str, Any]]:
+        """长期向量记忆：与 query 相关的更早消息（附 score），未开启或失败时返回空列表"""
+        try:
+            hits = dict(vector_memory.recall(session_id, query))
+        except Exception as e:
+            logger.warning(f"Vector recall failed: session={session_id}: {e}")
+            return []
+        messages = self.get_messages_by_ids(session_id, list(hits))
+        for msg in messages:
+            msg["score"] = hits[msg["id"]]
+        return messages
+
+    def get_memory(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """会话滚动摘要（summary / upto_id / version），尚未生成时返回 None"""
+        return memory_store.get(session_id)
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """按关键词检索活跃会话（不解密消息），每个会话取得分最高的消息"""
+        sessions: Dict[str, Dict[str, Any]] = {}
+        for hit in search_index.search(query, limit=limit * 3):
+            if hit["session_id"] in sessions:
+                continue
+            session = self.get_session(hit["session_id"])
+            if session and session["status"] == "active":
+                sessions[hit["session_id"]] = {**session, "message_id": hit["message_id"]}
+            if len(sessions) >= limit:
+                break
+        return list(sessions.values())
+
+    def save_artifact(self, session_id: str, artifact: "CodeArtifact") -> int:
+        """保存产物（相同代码只存储一份正文），返回产物 id"""
+        return artifact_store.save(
+            session_id,
+            title=artifact.title,
+            language=artifact.language,
+            code=artifact.code,
+            explanation=artifact.explanation,
+            dependencies=artifact.dependencies,
+        )
+
+    def list_artifacts(self, session_id: str) -> List[Dict[str, Any]]:
+        """会话产物头列表（标题、语言、大小等），正文通过 get_artifact 按需读取"""
+        return artifact_store.list_headers(session_id)
+
+    def get_artifact(self, session_id: str, artifact_id: int) -> Optional[Dict[str, Any]]:
+        return artifact_store.get(session_id, artifact_id)
 
     def update_session_summary(self, session_id: str, first_user_message: str = None):
         """自动生成会话摘要（基于第一条用户消息）"""
@@ -118,30 +390,33 @@ class SessionManager:
                 )
             else:
                 # 从数据库读取（需要解密）
-                messages = self.get_messages(session_id, limit=1)
-                if messages and messages[0]["role"] == "user":
-                    first_msg = messages[0]["content"]
+                first = self.get_first_message(session_id)
+                if first and first["role"] == "user":
+                    first_msg = first["content"]
                     summary = (
                         first_msg[:60] + "..." if len(first_msg) > 60 else first_msg
                     )
                 else:
                     return
 
-            with db.get_connection() as conn:
+            with self._write(self.storage.catalog) as conn:
                 conn.execute(
                     "UPDATE sessions SET summary = ? WHERE session_id = ?",
                     (summary, session_id),
                 )
+            self.cache.update_session(session_id, summary=summary)
         except Exception as e:
-            print(f"更新摘要失败: {e}")
+            logger.warning(f"Failed to update session summary: {e}")
 
     def delete_session(self, session_id: str):
         """逻辑删除会话（不删除数据库记录，仅标记为已删除）"""
-        with db.get_connection() as conn:
+        now = time.time()
+        with self._write(self.storage.catalog) as conn:
             conn.execute(
                 "UPDATE sessions SET status = ?, updated_at = ? WHERE session_id = ?",
-                ("deleted", time.time(), session_id),
+                ("deleted", now, session_id),
             )
+        self.cache.update_session(session_id, status="deleted", updated_at=now)
 
 
 session_mgr = SessionManager()
@@ -0,0 +1,85 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, TypeVar
+
+from config.settings import SHARD_DIR, STORAGE_BACKEND, STORAGE_SHARDS
+
+from database.manager import DatabaseManager, db
+
+T = TypeVar("T")
+
+
+class SingleFileStorage:
+    """默认布局：会话目录与消息数据位于同一个 SQLite 文件"""
+
+    def __init__(self, manager: DatabaseManager = db):
+        self.catalog = manager
+        self.shards: List[DatabaseManager] = [manager]
+
+    def shard_for(self, session_id: str) -> DatabaseManager:
+        return self.catalog
+
+    def is_colocated(self, session_id: str) -> bool:
+        """会话行与消息是否在同一个库（可在同一事务中更新）"""
+        return True
+
+    def fan_out(self, fn: Callable[[DatabaseManager], T]) -> List[T]:
+        return [fn(self.catalog)]
+
+
+class ShardedStorage:
+    """分片布局：sessions 位于目录库（用于跨分片列出会话），
+    messages / artifacts 等按 session_id 哈希分布到 N 个分片库，分散单写者锁竞争"""
+
+    def __init__(self, root: Path = SHARD_DIR, shard_count: int = STORAGE_SHARDS):
+        root.mkdir(parents=True, exist_ok=True)
+        self.catalog = DatabaseManager(root / "catalog.db")
+        self.shard_count = self._check_shard_count(shard_count)
+        self.shards: List[DatabaseManager] = [
+            DatabaseManager(root / f"shard_{i:03d}.db", foreign_keys=False)
+            for i in range(self.shard_count)
+        ]
+        self._pool = ThreadPoolExecutor(
+            max_workers=min(self.shard_count, 8), thread_name_prefix="shard"
+        )
+
+    def _check_shard_count(self, shard_count: int) -> int:
+        """分片数量写入目录库，之后不可更改（否则会话会被路由到错误的分片）"""
+        with self.catalog.get_connection() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO storage_meta (key, value) VALUES ('shard_count', ?)",
+                (str(shard_count),),
+            )
+            stored = int(
+                conn.execute(
+                    "SELECT value FROM storage_meta WHERE key = 'shard_count'"
+                ).fetchone()[0]
+            )
+        if stored != shard_count:
+            raise ValueError(
+                f"分片数量与已有数据不一致: 配置 {shard_count}, 已存储 {stored}"
+            )
+        return stored
+
+    def shard_for(self, session_id: str) -> DatabaseManager:
+        digest = hashlib.blake2b(session_id.encode("utf-8"), digest_size=8).digest()
+        return self.shards[int.from_bytes(digest, "big") % self.shard_count]
+
+    def is_colocated(self, session_id: str) -> bool:
+        return False
+
+    def fan_out(self, fn: Callable[[DatabaseManager], T]) -> List[T]:
+        """在所有分片上并行执行 fn，结果按分片顺序返回"""
+        return list(self._pool.map(fn, self.shards))
+
+
+def create_storage():
+    if STORAGE_BACKEND == "sharded":
+        return ShardedStorage()
+    if STORAGE_BACKEND == "single":
+        return SingleFileStorage()
+    raise ValueError(f"未知的存储后端: {STORAGE_BACKEND}")
+
+
+storage = create_storage()
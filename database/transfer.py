@@ -0,0 +1,368 @@
+"""会话数据的流式 NDJSON 导出 / 导入
+
+每行一个 JSON 对象，按会话分组: session 行之后依次是该会话的 message 行和 artifact 行。
+导出时解密为明文，导入时使用当前进程的密钥重新加密，因此可用于跨主机、跨密钥迁移。
+数据按批次读取和写入，内存占用与会话大小无关；以会话为单位记录检查点，中断后可续传。
+
+用法:
+    python -m database.transfer export sessions.ndjson.gz [--status all] [--resume]
+    python -m database.transfer import sessions.ndjson.gz [--resume]
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.crypto import encryptor
+
+from database.artifacts import artifact_store
+from database.memory import memory_store
+from database.search_index import search_index
+from database.session import _load_metadata, session_mgr
+from database.vector_memory import vector_memory
+
+BATCH_SIZE = 500
+
+SESSION_COLUMNS = (
+    "session_id",
+    "title",
+    "domain",
+    "language",
+    "status",
+    "created_at",
+    "updated_at",
+    "summary",
+)
+
+
+def _checkpoint_path(path: Path, kind: str) -> Path:
+    return path.with_name(path.name + f".{kind}-checkpoint.json")
+
+
+def _load_checkpoint(path: Path) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_checkpoint(path: Path, state: Dict[str, Any]):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def _line(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+class SessionExporter:
+    """按会话流式导出；每个会话写完后记录输出文件偏移量作为检查点"""
+
+    def __init__(self, status: Optional[str] = "active", batch_size: int = BATCH_SIZE):
+        self.status = status
+        self.batch_size = batch_size
+        self.storage = session_mgr.storage
+
+    def iter_sessions(self, after_rowid: int = 0) -> Iterator[Dict[str, Any]]:
+        """按 rowid 分批遍历会话目录"""
+        while True:
+            with self.storage.catalog.get_connection() as conn:
+                if self.status:
+                    rows = conn.execute(
+                        "SELECT rowid, * FROM sessions WHERE rowid > ? AND status = ? ORDER BY rowid LIMIT ?",
+                        (after_rowid, self.status, self.batch_size),
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT rowid, * FROM sessions WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                        (after_rowid, self.batch_size),
+                    ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            after_rowid = rows[-1]["rowid"]
+
+    def iter_session_lines(self, session_id: str) -> Iterator[str]:
+        """单个会话的 message / artifact 行（分批读取，消息按批并行解密）"""
+        shard = self.storage.shard_for(session_id)
+
+        last_id = 0
+        while True:
+            with shard.get_connection() as conn:
+                rows = conn.execute(
+                    "SELECT * FROM messages WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (session_id, last_id, self.batch_size),
+                ).fetchall()
+            if not rows:
+                break
+            contents = encryptor.decrypt_many([r["content"] for r in rows], session_id)
+            metadata = encryptor.decrypt_many([r["metadata"] for r in rows], session_id)
+            digests = encryptor.decrypt_many([r["digest"] for r in rows], session_id)
+            for row, content, meta, digest in zip(rows, contents, metadata, digests):
+                yield _line(
+                    {
+                        "type": "message",
+                        "session_id": session_id,
+                        "role": row["role"],
+                        "content": content,
+                        "metadata": _load_metadata(meta),
+                        "digest": digest or None,
+                        "created_at": row["created_at"],
+                    }
+                )
+            last_id = rows[-1]["id"]
+
+        # 内容寻址存储中的产物，以及尚未被回填迁移的旧 artifacts 表
+        for query in (
+            "SELECT a.*, b.content FROM session_artifacts a "
+            "JOIN artifact_blobs b ON b.digest = a.digest "
+            "WHERE a.session_id = ? AND a.id > ? ORDER BY a.id LIMIT 1",
+            "SELECT * FROM artifacts WHERE session_id = ? AND id > ? ORDER BY id LIMIT 1",
+        ):
+            last_id = 0
+            while True:
+                with shard.get_connection() as conn:
+                    row = conn.execute(query, (session_id, last_id)).fetchone()
+                if row is None:
+                    break
+                yield from self._artifact_line(dict(row))
+                last_id = row["id"]
+
+    def _artifact_line(self, row: Dict[str, Any]) -> Iterator[str]:
+        """产物可能很大：content 流式解压并分段转义，不在内存中展开整行"""
+        session_id = row["session_id"]
+        header = {
+            "type": "artifact",
+            "session_id": session_id,
+            "artifact_type": row["artifact_type"],
+            "title": row["title"],
+            "language": row["language"],
+            "created_at": row["created_at"],
+        }
+        if "explanation" in row:
+            dependencies = encryptor.decrypt_value(row["dependencies"], session_id)
+            header["explanation"] = encryptor.decrypt_value(
+                row["explanation"], session_id
+            )
+            header["dependencies"] = _load_metadata(dependencies)
+        yield json.dumps(header, ensure_ascii=False)[:-1] + ', "content": "'
+        for chunk in encryptor.iter_decrypt_value(row["content"], session_id):
+            yield json.dumps(chunk, ensure_ascii=False)[1:-1]
+        yield '"}\n'
+
+    def export(self, path: Path, compress: bool = False, resume: bool = False) -> int:
+        """导出到 path，返回本次导出的会话数"""
+        checkpoint_file = _checkpoint_path(path, "export")
+        checkpoint = _load_checkpoint(checkpoint_file) if resume else None
+        after_rowid = checkpoint["last_rowid"] if checkpoint else 0
+
+        exported = 0
+        with open(path, "r+b" if checkpoint else "wb") as raw:
+            if checkpoint:
+                # 丢弃检查点之后写入的不完整会话
+                raw.truncate(checkpoint["offset"])
+                raw.seek(checkpoint["offset"])
+
+            for session in self.iter_sessions(after_rowid):
+                rowid = session.pop("rowid")
+                # 每个会话独立写成一个 gzip member，截断后可直接追加
+                stream = gzip.GzipFile(fileobj=raw, mode="wb") if compress else raw
+                out = io.TextIOWrapper(stream, encoding="utf-8", write_through=True)
+                out.write(
+                    _line(
+                        {"type": "session", **{c: session.get(c) for c in SESSION_COLUMNS}}
+                    )
+                )
+                for line in self.iter_session_lines(session["session_id"]):
+                    out.write(line)
+                out.detach()
+                if compress:
+                    stream.close()
+                raw.flush()
+
+                exported += 1
+                _save_checkpoint(
+                    checkpoint_file, {"last_rowid": rowid, "offset": raw.tell()}
+                )
+
+        checkpoint_file.unlink(missing_ok=True)
+        return exported
+
+
+class SessionImporter:
+    """流式导入；消息按批加密、按批写入，以会话为单位记录已消费的行数"""
+
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        self.batch_size = batch_size
+        self.storage = session_mgr.storage
+
+    def import_file(self, path: Path, resume: bool = False) -> int:
+        """从 path 导入，返回本次导入的会话数"""
+        checkpoint_file = _checkpoint_path(path, "import")
+        checkpoint = _load_checkpoint(checkpoint_file) if resume else None
+        skip_lines = checkpoint["line"] if checkpoint else 0
+        if checkpoint and checkpoint.get("in_progress"):
+            # 上次中断的会话可能只写入了部分消息，重新导入前先清除
+            self._purge(checkpoint["in_progress"])
+
+        opener = gzip.open if _is_gzip(path) else open
+        imported = 0
+        current: Optional[str] = None
+        skipping = False
+        messages: List[Dict[str, Any]] = []
+
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                if line_no <= skip_lines or not line.strip():
+                    continue
+                record = json.loads(line)
+                kind = record.pop("type")
+
+                if kind == "session":
+                    if current is not None:
+                        self._flush_messages(current, messages)
+                        imported += 1
+                    current = None
+                    # 已存在的会话跳过，重复导入不会产生重复消息
+                    skipping = self._session_exists(record["session_id"])
+                    if skipping:
+                        continue
+                    current = record["session_id"]
+                    _save_checkpoint(
+                        checkpoint_file, {"line": line_no - 1, "in_progress": current}
+                    )
+                    self._insert_session(record)
+                elif skipping:
+                    continue
+                elif kind == "message":
+                    messages.append(record)
+                    if len(messages) >= self.batch_size:
+                        self._flush_messages(current, messages)
+                elif kind == "artifact":
+                    self._flush_messages(current, messages)
+                    self._insert_artifact(record)
+
+        if current is not None:
+            self._flush_messages(current, messages)
+            imported += 1
+        checkpoint_file.unlink(missing_ok=True)
+        return imported
+
+    def _session_exists(self, session_id: str) -> bool:
+        with self.storage.catalog.get_connection() as conn:
+            return (
+                conn.execute(
+                    "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                is not None
+            )
+
+    def _insert_session(self, record: Dict[str, Any]):
+        columns = [c for c in SESSION_COLUMNS if c in record]
+        with self.storage.catalog.get_connection() as conn:
+            conn.execute(
+                f"INSERT INTO sessions ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [record[c] for c in columns],
+            )
+
+    def _flush_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        if not messages:
+            return
+        contents = encryptor.encrypt_many([m["content"] for m in messages], session_id)
+        metadata = encryptor.encrypt_many(
+            [json.dumps(m["metadata"]) if m.get("metadata") else "" for m in messages],
+            session_id,
+        )
+        digests = encryptor.encrypt_many(
+            [m.get("digest") or "" for m in messages], session_id
+        )
+        tokens = [search_index.prepare(m["content"]) for m in messages]
+        with self.storage.shard_for(session_id).get_connection() as conn:
+            # 逐行插入以取得消息 id，同一事务内建立检索索引
+            for m, content, meta, digest, message_tokens in zip(
+                messages, contents, metadata, digests, tokens
+            ):
+                cursor = conn.execute(
+                    "INSERT INTO messages (session_id, role, content, metadata, digest, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        session_id,
+                        m["role"],
+                        content,
+                        meta or None,
+                        digest or None,
+                        m["created_at"],
+                    ),
+                )
+                search_index.write(conn, session_id, cursor.lastrowid, message_tokens)
+        messages.clear()
+
+    def _insert_artifact(self, record: Dict[str, Any]):
+        artifact_store.save(
+            record["session_id"],
+            title=record["title"],
+            language=record["language"],
+            code=record["content"],
+            explanation=record.get("explanation") or "",
+            dependencies=record.get("dependencies"),
+            artifact_type=record["artifact_type"],
+            created_at=record.get("created_at"),
+        )
+
+    def _purge(self, session_id: str):
+        """删除未导入完成的会话，之后从该会话的 session 行重新导入"""
+        with self.storage.shard_for(session_id).get_connection() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM artifacts WHERE session_id = ?", (session_id,))
+            artifact_store.purge(conn, [session_id])
+            search_index.purge(conn, [session_id])
+            memory_store.purge(conn, [session_id])
+        vector_memory.delete([session_id])
+        with self.storage.catalog.get_connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+def _is_gzip(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(2) == b"\x1f\x8b"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话数据 NDJSON 导出 / 导入")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = sub.add_parser("export")
+    export_cmd.add_argument("path", type=Path)
+    export_cmd.add_argument(
+        "--status", default="active", help="按状态过滤，all 表示全部"
+    )
+    export_cmd.add_argument(
+        "--compress", action="store_true", help="gzip 压缩（路径以 .gz 结尾时默认开启）"
+    )
+    export_cmd.add_argument("--resume", action="store_true")
+
+    import_cmd = sub.add_parser("import")
+    import_cmd.add_argument("path", type=Path)
+    import_cmd.add_argument("--resume", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        count = SessionExporter(None if args.status == "all" else args.status).export(
+            args.path,
+            compress=args.compress or args.path.suffix == ".gz",
+            resume=args.resume,
+        )
+        print(f"✓ 已导出 {count} 个会话: {args.path}")
+    else:
+        count = SessionImporter().import_file(args.path, resume=args.resume)
+        print(f"✓ 已导入 {count} 个会话: {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""长期向量记忆：按会话召回与当前问题相关的更早对话
+
+消息按段落切分为不超过 VECTOR_CHUNK_CHARS 的分块，嵌入向量归一化后以 float16 追加写入
+数据库文件旁的 <db>.vectors/<session_id>.f16，对应的 (消息 id, 分块序号) 写入同名 .ids 文件。
+召回时以 memmap 只读打开，一次矩阵乘法完成打分，不解密任何未命中的消息。
+
+写入时只入队，后台线程攒批后一次请求嵌入接口；进程退出时尚未写入的分块、以及开启该功能
+之前的历史消息，由 rebuild 命令补齐。
+
+用法:
+    python -m database.vector_memory rebuild [--session SESSION_ID]
+"""
+
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.settings import (
+    VECTOR_BATCH_DELAY,
+    VECTOR_BATCH_SIZE,
+    VECTOR_CHUNK_CHARS,
+    VECTOR_DIM,
+    VECTOR_MEMORY_ENABLED,
+    VECTOR_MIN_SCORE,
+    VECTOR_TOP_K,
+    azure_config,
+)
+from utils.crypto import encryptor
+from utils.text import chunk_paragraphs
+
+from database.storage import storage
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DTYPE = np.float16
+# 每行 (message_id, chunk_no)
+ID_DTYPE = np.int64
+
+
+def chunk_text(text: str, max_chars: int = VECTOR_CHUNK_CHARS) -> List[str]:
+    return chunk_paragraphs(text, max_chars)
+
+
+class VectorMemory:
+    def __init__(self, enabled: bool = VECTOR_MEMORY_ENABLED, dim: int = VECTOR_DIM):
+        self.enabled = enabled
+        self.dim = dim
+        self._embedder = None
+        self._queue: "queue.Queue[Tuple[str, int, str]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _paths(self, session_id: str) -> Tuple[Path, Path]:
+        db_path = storage.shard_for(session_id).db_path
+        root = db_path.with_name(db_path.name + ".vectors")
+        root.mkdir(exist_ok=True)
+        return root / f"{session_id}.f16", root / f"{session_id}.ids"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """批量嵌入，返回 L2 归一化的 (n, dim) float32 矩阵"""
+        if self._embedder is None:
+            from langchain_openai import AzureOpenAIEmbeddings
+
+            self._embedder = AzureOpenAIEmbeddings(
+                azure_endpoint=azure_config.endpoint,
+                api_key=azure_config.api_key,
+                api_version=azure_config.api_version,
+                azure_deployment=azure_config.embed_model,
+                dimensions=self.dim,
+                chunk_size=VECTOR_BATCH_SIZE,
+            )
+        vectors = np.asarray(self._embedder.embed_documents(list(texts)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    # ---- 写入 ----
+
+    def enqueue(self, session_id: str, message_id: int, content: str):
+        """消息写入后调用：只入队，不等待嵌入"""
+        if not self.enabled or not content:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="vector-memory", daemon=True
+                )
+                self._worker.start()
+        self._queue.put((session_id, message_id, content))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            chunks = len(chunk_text(batch[0][2]))
+            deadline = time.monotonic() + VECTOR_BATCH_DELAY
+            while chunks < VECTOR_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                chunks += len(chunk_text(item[2]))
+            try:
+                self.index(batch)
+            except Exception as e:
+                logger.error(f"Vector memory indexing failed: {e}", exc_info=True)
+
+    def index(self, items: Sequence[Tuple[str, int, str]]):
+        """嵌入并追加一批消息（可跨会话，只发送一次嵌入请求）"""
+        rows: List[Tuple[str, int, int]] = []
+        texts: List[str] = []
+        for session_id, message_id, content in items:
+            for chunk_no, chunk in enumerate(chunk_text(content)):
+                rows.append((session_id, message_id, chunk_no))
+                texts.append(chunk)
+        if not texts:
+            return
+        vectors = self.embed(texts)
+
+        by_session: Dict[str, List[int]] = defaultdict(list)
+        for i, (session_id, _, _) in enumerate(rows):
+            by_session[session_id].append(i)
+        for session_id, indexes in by_session.items():
+            ids = np.array([rows[i][1:] for i in indexes], dtype=ID_DTYPE)
+            self._append(session_id, vectors[indexes], ids)
+
+    def _append(self, session_id: str, vectors: np.ndarray, ids: np.ndarray):
+        vec_path, ids_path = self._paths(session_id)
+        # 先写向量再写 id：中途失败时以两者中较少的行数为准
+        with open(vec_path, "ab") as f:
+            f.write(vectors.astype(VECTOR_DTYPE).tobytes())
+        with open(ids_path, "ab") as f:
+            f.write(ids.tobytes())
+
+    # ---- 召回 ----
+
+    def _load(self, session_id: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        vec_path, ids_path = self._paths(session_id)
+        if not vec_path.exists() or not ids_path.exists():
+            return None
+        row_bytes = self.dim * np.dtype(VECTOR_DTYPE).itemsize
+        rows = min(
+            vec_path.stat().st_size // row_bytes,
+            ids_path.stat().st_size // (2 * np.dtype(ID_DTYPE).itemsize),
+        )
+        if rows == 0:
+            return None
+        vectors = np.memmap(vec_path, dtype=VECTOR_DTYPE, mode="r", shape=(rows, self.dim))
+        ids = np.fromfile(ids_path, dtype=ID_DTYPE, count=rows * 2).reshape(rows, 2)
+        return vectors, ids
+
+    def recall(
+        self, session_id: str, query: str, k: int = VECTOR_TOP_K
+    ) -> List[Tuple[int, float]]:
+        """与 query 最相关的 k 条消息 [(message_id, score)]，按得分降序"""
+        if not self.enabled or not query or k <= 0:
+            return []
+        loaded = self._load(session_id)
+        if loaded is None:
+            return []
+        vectors, ids = loaded
+        scores = np.asarray(vectors, dtype=np.float32) @ self.embed([query])[0]
+
+        # 同一消息的多个分块只取最高分；先多取一些候选再去重
+        candidates = min(len(scores), k * 4)
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        best: Dict[int, float] = {}
+        for i in top[np.argsort(-scores[top])]:
+            score = float(scores[i])
+            if score < VECTOR_MIN_SCORE:
+                break
+            best.setdefault(int(ids[i, 0]), score)
+            if len(best) >= k:
+                break
+        return list(best.items())
+
+    # ---- 维护 ----
+
+    def delete(self, session_ids: Sequence[str]):
+        """删除会话的向量文件（向量由消息派生，归档时不保留）"""
+        for session_id in session_ids:
+            for path in self._paths(session_id):
+                path.unlink(missing_ok=True)
+
+    def rebuild(self, session_id: str, batch_size: int = 200) -> int:
+        """从数据库重建一个会话的向量文件，完成后原子替换，返回嵌入的分块数"""
+        vec_path, ids_path = self._paths(session_id)
+        vec_tmp, ids_tmp = (p.with_suffix(p.suffix + ".tmp") for p in (vec_path, ids_path))
+        total, last_id = 0, 0
+        with open(vec_tmp, "wb") as vec_file, open(ids_tmp, "wb") as ids_file:
+            while True:
+                with storage.shard_for(session_id).get_connection() as conn:
+                    rows = conn.execute(
+                        "SELECT id, content FROM messages WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+                        (session_id, last_id, batch_size),
+                    ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1]["id"]
+                contents = encryptor.decrypt_many([row["content"] for row in rows], session_id)
+                ids, texts = [], []
+                for row, content in zip(rows, contents):
+                    for chunk_no, chunk in enumerate(chunk_text(content)):
+                        ids.append((row["id"], chunk_no))
+                        texts.append(chunk)
+                if texts:
+                    vec_file.write(self.embed(texts).astype(VECTOR_DTYPE).tobytes())
+                    ids_file.write(np.array(ids, dtype=ID_DTYPE).tobytes())
+                    total += len(texts)
+        os.replace(vec_tmp, vec_path)
+        os.replace(ids_tmp, ids_path)
+        return total
+
+
+vector_memory = VectorMemory()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长期向量记忆")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = sub.add_parser("rebuild", help="为已有历史重建向量文件")
+    rebuild_cmd.add_argument("--session", help="只重建指定会话（默认全部活跃会话）")
+    args = parser.parse_args()
+
+    if args.session:
+        session_ids = [args.session]
+    else:
+        with storage.catalog.get_connection() as conn:
+            session_ids = [
+                row["session_id"]
+                for row in conn.execute(
+                    "SELECT session_id FROM sessions WHERE status = 'active'"
+                ).fetchall()
+            ]
+    chunks = 0
+    for session_id in session_ids:
+        chunks += vector_memory.rebuild(session_id)
+    print(f"✓ 已重建 {len(session_ids)} 个会话，共 {chunks} 个分块")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+import sys
+from pathlib import Path
+
+# 配置在导入时校验必填项；测试不访问 Azure，只需占位值
+for key in (
+    "AZURE_OPENAI_API_KEY",
+    "AZURE_OPENAI_ENDPOINT",
+    "AZURE_OPENAI_DEPLOYMENT",
+    "AZURE_OPENAI_O4_MINI_DEPLOYMENT",
+):
+    os.environ.setdefault(key, "test")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
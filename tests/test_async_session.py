@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from database.async_session import AsyncSessionManager, DeferredWriteError
+
+
+def _fail():
+    raise OSError("disk full")
+
+
+def test_flush_raises_deferred_failure_once():
+    async def run():
+        mgr = AsyncSessionManager(manager=None, max_workers=2)
+        done = []
+        mgr.defer("s", done.append, 1)
+        mgr.defer("s", _fail)
+        mgr.defer("s", done.append, 2)
+        with pytest.raises(DeferredWriteError) as info:
+            await mgr.flush("s")
+        assert isinstance(info.value.__cause__, OSError)
+        # 失败不阻断后续任务，且只报告一次
+        assert done == [1, 2]
+        await mgr.flush("s")
+
+    asyncio.run(run())
+
+
+def test_flush_is_per_session():
+    async def run():
+        mgr = AsyncSessionManager(manager=None, max_workers=2)
+        mgr.defer("a", _fail)
+        mgr.defer("b", lambda: None)
+        await mgr.flush("b")
+        with pytest.raises(DeferredWriteError):
+            await mgr.flush("a")
+
+    asyncio.run(run())
+
+
+def test_facade_has_the_session_manager_api():
+    from database.session import SessionManager
+
+    public = {name for name in vars(SessionManager) if not name.startswith("_")}
+    missing = {name for name in public if not hasattr(AsyncSessionManager, name)}
+    assert not missing
+
+
+def test_add_message_passes_digest():
+    class Recorder:
+        def add_message(self, *args):
+            self.args = args
+
+    async def run():
+        manager = Recorder()
+        mgr = AsyncSessionManager(manager, max_workers=1)
+        await mgr.add_message("s", "assistant", "answer", {"k": 1}, "digest")
+        return manager.args
+
+    assert asyncio.run(run()) == ("s", "assistant", "answer", {"k": 1}, "digest")
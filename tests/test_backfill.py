@@ -0,0 +1,20 @@
+from database.backfill import _rewrite_shard, is_done
+from database.manager import DatabaseManager
+
+
+def test_legacy_scan_is_skipped_once_done(tmp_path):
+    manager = DatabaseManager(tmp_path / "shard.db", foreign_keys=False)
+    assert not is_done(manager)
+    assert _rewrite_shard(manager, pause=0, force=False) == 0
+    assert is_done(manager)
+
+    # 完成后不再扫描：即使出现未标记的行也不会改写
+    with manager.get_connection() as conn:
+        conn.execute(
+            "INSERT INTO messages (session_id, role, content, created_at) "
+            "VALUES ('s1', 'user', 'hello', 0)"
+        )
+    assert _rewrite_shard(manager, pause=0, force=False) == 0
+    with manager.get_connection() as conn:
+        kind = conn.execute("SELECT typeof(content) FROM messages").fetchone()[0]
+    assert kind == "text"
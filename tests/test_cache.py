@@ -0,0 +1,12 @@
+from database.cache import SessionCache
+
+
+def test_cached_metadata_is_not_shared_with_callers():
+    cache = SessionCache(capacity=4)
+    message = {"role": "assistant", "content": "hi", "metadata": {"tags": ["a"]}}
+    cache.put_messages("s1", [message], complete=True)
+    message["metadata"]["tags"].append("from-writer")
+
+    first = cache.get_messages("s1", 10)
+    first[0]["metadata"]["tags"].append("from-reader")
+    assert cache.get_messages("s1", 10)[0]["metadata"] == {"tags": ["a"]}
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from utils.corpus import CorpusIndex, build_index
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_build_and_search_without_database():
+    # 段落选取与文档库构建只依赖 utils.text，不打开、不迁移会话数据库
+    code = (
+        "import sys, core.passages, utils.corpus; "
+        "assert 'database.storage' not in sys.modules, sorted(sys.modules)"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=os.environ, check=True)
+
+
+def test_search_picks_up_rebuilt_index(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "rust.md").write_text("# Rust\n\nRust ownership and borrowing.", encoding="utf-8")
+    index = CorpusIndex(tmp_path / "index")
+    build_index(docs, index.index_dir)
+    assert [r["title"] for r in index.search("ownership")] == ["Rust"]
+
+    (docs / "go.md").write_text("# Go\n\nGo channels and goroutines.", encoding="utf-8")
+    build_index(docs, index.index_dir)
+    meta = index.index_dir / "meta.json"
+    # 同一时间粒度内重建时也要能区分
+    stat = meta.stat()
+    os.utime(meta, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert [r["title"] for r in index.search("goroutines")] == ["Go"]
+
+
+def test_unknown_search_provider_is_rejected(monkeypatch):
+    import utils.search_providers as providers
+
+    monkeypatch.setattr(providers, "SEARCH_PROVIDER", "bing")
+    with pytest.raises(ValueError, match="bing"):
+        providers._create_provider()
@@ -0,0 +1,101 @@
+import os
+import zlib
+
+import pytest
+
+from utils.crypto import FLAG_ZLIB, FLAG_ZSTD, iter_decompress, zstd
+
+# 高度可压缩：单个 64 KiB 的压缩块可展开为数 MiB
+PAYLOAD = b"a" * (4 * 1024 * 1024) + os.urandom(1024)
+
+
+def _chunks(flags, packed, chunk_size=64 * 1024):
+    chunks = list(iter_decompress(flags, packed, chunk_size))
+    assert all(len(c) <= chunk_size for c in chunks)
+    return b"".join(chunks)
+
+
+def test_iter_decompress_zlib_bounded():
+    assert _chunks(FLAG_ZLIB, zlib.compress(PAYLOAD, 6)) == PAYLOAD
+
+
+@pytest.mark.skipif(zstd is None, reason="zstandard not installed")
+def test_iter_decompress_zstd_bounded():
+    packed = zstd.ZstdCompressor(level=3).compress(PAYLOAD)
+    assert _chunks(FLAG_ZSTD, packed) == PAYLOAD
+
+
+def test_iter_decompress_uncompressed():
+    assert _chunks(0, PAYLOAD[:200000], 4096) == PAYLOAD[:200000]
+
+
+def test_iter_decompress_truncated_zlib_stops():
+    packed = zlib.compress(PAYLOAD, 6)
+    data = _chunks(FLAG_ZLIB, packed[: len(packed) // 2])
+    assert PAYLOAD.startswith(data)
+
+
+class MemoryKeyStore:
+    def __init__(self):
+        self.keys = {}
+
+    def load(self, session_id):
+        return self.keys.get(session_id)
+
+    def save(self, session_id, wrapped_key):
+        return self.keys.setdefault(session_id, wrapped_key)
+
+
+def _encryptor(store):
+    from utils.crypto import ContentEncryptor
+
+    enc = ContentEncryptor()
+    enc.set_key_store(store)
+    return enc
+
+
+def test_keyring_decrypt_does_not_create_key():
+    from utils.crypto import DataKeyNotFound, KeyRing
+
+    ring = KeyRing(os.urandom(32))
+    ring.store = MemoryKeyStore()
+    with pytest.raises(DataKeyNotFound):
+        ring.cipher("s1", 0x01)
+    assert ring.store.keys == {}
+    ring.cipher("s1", 0x01, create=True)
+    assert "s1" in ring.store.keys
+
+
+def test_v3_blob_with_missing_key_is_not_rekeyed():
+    store = MemoryKeyStore()
+    enc = _encryptor(store)
+    blob = enc.encrypt_bytes("secret", "s1")
+    assert enc.decrypt_value(blob, "s1") == "secret"
+
+    store.keys.clear()
+    enc.keyring.forget("s1")
+    assert enc.decrypt_value(blob, "s1") == ""
+    assert store.keys == {}
+
+
+class LockedKeyStore(MemoryKeyStore):
+    def save(self, session_id, wrapped_key):
+        import sqlite3
+
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_v3_key_store_failure_is_not_stored_as_plaintext():
+    import sqlite3
+
+    enc = _encryptor(LockedKeyStore())
+    with pytest.raises(sqlite3.OperationalError):
+        enc.encrypt_bytes("secret", "s1")
+
+
+def test_v3_blob_with_unknown_cipher_id_fails_cleanly():
+    enc = _encryptor(MemoryKeyStore())
+    blob = bytearray(enc.encrypt_bytes("secret", "s1"))
+    blob[2] = 0x7F
+    with pytest.raises(ValueError, match="0x7F|127"):
+        enc.decrypt_value(bytes(blob), "s1")
@@ -0,0 +1,11 @@
+import sqlite3
+
+from database.migrations import MIGRATIONS, _column_names
+from database.runs import RUN_COLUMNS
+
+
+def test_runs_table_has_every_run_column():
+    conn = sqlite3.connect(":memory:")
+    for _, migrate in MIGRATIONS:
+        migrate(conn)
+    assert set(RUN_COLUMNS) <= set(_column_names(conn, "runs"))
@@ -0,0 +1,98 @@
+import core.pipeline  # noqa: F401  与应用相同的导入顺序：core.pipeline 会导入 agents
+
+from agents.search import _url_key, derive_queries, fuse_results
+
+LONG = "Rust ownership rules make memory safety possible without a garbage collector. " * 2
+
+
+def _r(url, content="", title="t"):
+    return {"title": title, "url": url, "content": content}
+
+
+def test_url_key_ignores_scheme_www_slash_fragment_and_tracking():
+    assert _url_key("https://www.Example.com/a/?utm_source=x&b=2&a=1#top") == _url_key(
+        "http://example.com/a?a=1&b=2"
+    )
+
+
+def test_url_key_keeps_meaningful_differences():
+    assert _url_key("https://example.com/a?id=1") != _url_key("https://example.com/a?id=2")
+    assert _url_key("https://example.com/a") != _url_key("https://example.com/b")
+    assert _url_key("https://docs.example.com/a") != _url_key("https://example.com/a")
+
+
+def test_fuse_keeps_distinct_urls_with_empty_content():
+    fused = fuse_results([[_r("https://a.com"), _r("https://b.com", None), _r("https://c.com")]])
+    assert [r["url"] for r in fused] == ["https://a.com", "https://b.com", "https://c.com"]
+
+
+def test_fuse_keeps_results_without_url_or_content():
+    assert len(fuse_results([[_r(""), _r(""), _r("", "short")]])) == 3
+
+
+def test_fuse_short_identical_snippets_are_not_merged():
+    fused = fuse_results([[_r("https://a.com", "Click here"), _r("https://b.com", "Click here")]])
+    assert len(fused) == 2
+
+
+def test_fuse_merges_same_url_across_lists_and_accumulates_score():
+    fused = fuse_results(
+        [
+            [_r("https://a.com/x", LONG), _r("https://b.com", LONG + "b")],
+            [_r("https://www.a.com/x/", LONG), _r("https://c.com", "c")],
+        ]
+    )
+    assert [r["url"] for r in fused][0] == "https://a.com/x"
+    assert fused[0]["rrf_score"] > fused[1]["rrf_score"]
+    assert len(fused) == 3
+
+
+def test_fuse_merges_mirrored_content_with_different_urls():
+    fused = fuse_results([[_r("https://a.com", LONG)], [_r("https://mirror.com", LONG)]])
+    assert len(fused) == 1
+    assert fused[0]["rrf_score"] == round(2 / 61, 6)
+
+
+def test_fuse_respects_limit():
+    results = [_r(f"https://{i}.com") for i in range(20)]
+    assert len(fuse_results([results], limit=5)) == 5
+
+
+def test_derive_queries_pairs_concepts_and_dedupes():
+    queries = derive_queries("Rust memory", ["ownership", "borrowing", "Rust", "memory"])
+    assert queries == ["Rust memory", "ownership borrowing"]
+
+
+def test_derive_queries_caps_fanout_and_skips_blanks():
+    queries = derive_queries("q", ["a", "b", " ", "c", "d", "e", "f", "g", "h", "i"])
+    assert queries[0] == "q"
+    assert queries[1:] == ["a b", "c d", "e f"]
+
+
+def test_derive_queries_without_concepts():
+    assert derive_queries("q", []) == ["q"]
+
+
+def _useful(n_results):
+    from agents.search import WebSearchAgent
+
+    # 每个结果一段、都与问题相关；结果多于预算容量时只有一部分能放入上下文
+    text = "Rust ownership moves values and borrowing checks references at compile time. " * 5
+    results = [_r(f"https://example.com/{i}", f"{text} ({i})") for i in range(n_results)]
+    state = {}
+    WebSearchAgent()._apply(state, "rust ownership borrowing", results)
+    return state["web_search_results"].useful
+
+
+def test_usefulness_does_not_fall_as_max_results_grows():
+    assert _useful(3) == 1.0
+    assert _useful(30) >= 0.9
+
+
+def test_usefulness_counts_irrelevant_results():
+    from agents.search import WebSearchAgent
+
+    results = [_r("https://a.com", LONG), _r("https://b.com", "Cooking pasta at home. " * 5)]
+    state = {}
+    WebSearchAgent()._apply(state, "rust ownership", results)
+    assert state["web_search_results"].useful == 0.5
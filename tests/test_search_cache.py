@@ -0,0 +1,85 @@
+import pytest
+
+from database.search_cache import cache_class, normalize_query, search_cache
+
+PARAMS = {"max_results": 5}
+
+
+def _key(query):
+    return search_cache._key(query, PARAMS)
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("Python Tutorial", "python tutorial"),
+        ("  python   tutorial ", "python tutorial"),
+        ("python tutorial?", "python tutorial"),
+        ("量子计算是什么？", "量子计算是什么"),
+        ("ＡＢＣ　ｔｅｓｔ", "abc test"),
+        ("“what is rust”", "what is rust"),
+    ],
+)
+def test_equivalent_queries_share_key(a, b):
+    assert _key(a) == _key(b)
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ("C++ tutorial", "C tutorial"),
+        ("C# tutorial", "C tutorial"),
+        ("C++ tutorial", "C# tutorial"),
+        ("tutorial C#", "tutorial C"),
+        ("python to java", "java to python"),
+        ("is 3.10 > 3.9", "is 3.9 > 3.10"),
+        ("node.js", "node js"),
+        ("rust rust", "rust"),
+    ],
+)
+def test_different_queries_do_not_share_key(a, b):
+    assert _key(a) != _key(b)
+
+
+def test_key_depends_on_params():
+    assert search_cache._key("q", {"max_results": 5}) != search_cache._key(
+        "q", {"max_results": 3}
+    )
+
+
+def test_normalize_keeps_inner_symbols_and_order():
+    assert normalize_query("  What is C++?  ") == "what is c++"
+
+
+def test_cache_class():
+    assert cache_class("今天的新闻", "medical") == "news"
+    assert cache_class("Latest Rust release", None) == "news"
+    assert cache_class("2024年的法规", "legal") == "news"
+    assert cache_class("blood pressure", "medical") == "medical"
+    assert cache_class("anything", "unknown") == "general"
+
+
+class _Storage:
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+
+def test_hits_are_counted_in_memory_and_written_in_batches(tmp_path):
+    from database.manager import DatabaseManager
+    from database.search_cache import SearchCache
+
+    catalog = DatabaseManager(tmp_path / "catalog.db")
+    cache = SearchCache(enabled=True)
+    cache.storage = _Storage(catalog)
+    cache.store("rust ownership", PARAMS, "general", {"results": []})
+    for _ in range(3):
+        assert cache.lookup("rust ownership", PARAMS) is not None
+
+    def hits():
+        with catalog.get_connection() as conn:
+            return conn.execute("SELECT hits FROM search_cache").fetchone()[0]
+
+    # 读缓存不写表
+    assert hits() == 0
+    assert cache.flush_hits() == 1
+    assert hits() == 3
@@ -0,0 +1,76 @@
+from config.settings import SEARCH_DEADLINE
+from core.models import ProcessingMode
+from core.search_policy import DEADLINE_MARGIN, DEFAULT_LATENCY, SearchPolicy
+
+
+def _policy(stats=None):
+    policy = SearchPolicy()
+    policy._history = lambda: stats or {}
+    return policy
+
+
+def test_exhausted_budget_still_allows_one_basic_call():
+    # 理解阶段的 LLM 调用已经用完预算：降级为 basic，但不在调用完成前截止
+    plan = _policy().choose("medical", ProcessingMode.WEB_SEARCH, remaining=-3.0)
+    assert plan.depth == "basic"
+    assert "budget" in plan.reason
+    assert plan.deadline == DEADLINE_MARGIN * DEFAULT_LATENCY["basic"]
+
+
+def test_deadline_floor_uses_measured_latency():
+    stats = {("general", "basic"): {"n": 50, "useful": 0.6, "miss_ms": 4000.0}}
+    plan = _policy(stats).choose("general", ProcessingMode.WEB_SEARCH, remaining=0.5)
+    assert plan.deadline == min(SEARCH_DEADLINE, DEADLINE_MARGIN * 4.0)
+
+
+def test_ample_budget_keeps_advanced_and_caps_deadline():
+    plan = _policy().choose("medical", ProcessingMode.WEB_SEARCH, remaining=100.0)
+    assert plan.depth == "advanced"
+    assert plan.deadline == SEARCH_DEADLINE
+
+
+NO_GAIN = {
+    ("medical", "advanced"): {"n": 50, "useful": 0.6, "miss_ms": 3000.0},
+    ("medical", "basic"): {"n": 50, "useful": 0.6, "miss_ms": 1000.0},
+}
+
+
+def test_no_gain_falls_back_to_basic(monkeypatch):
+    monkeypatch.setattr("core.search_policy.SEARCH_POLICY_EXPLORE", 0.0)
+    plan = _policy(NO_GAIN).choose("medical", ProcessingMode.WEB_SEARCH, remaining=100.0)
+    assert plan.depth == "basic"
+    assert "no-gain" in plan.reason
+
+
+def test_no_gain_still_explores_advanced(monkeypatch):
+    monkeypatch.setattr("core.search_policy.SEARCH_POLICY_EXPLORE", 1.0)
+    plan = _policy(NO_GAIN).choose("medical", ProcessingMode.WEB_SEARCH, remaining=100.0)
+    assert plan.depth == "advanced"
+    assert "explore" in plan.reason
+
+
+def test_unknown_domain_is_recorded_as_policy_domain():
+    from core.search_policy import policy_domain
+
+    assert policy_domain("finance") == "general"
+    assert policy_domain("legal") == "legal"
+    assert policy_domain(None) is None
+
+
+def test_refresh_reads_history_off_the_event_loop(monkeypatch):
+    import asyncio
+    import threading
+
+    from database.runs import run_store
+
+    threads = []
+
+    def search_stats(since):
+        threads.append(threading.current_thread().name)
+        return [{"domain": "general", "search_depth": "basic", "n": 50, "useful": 0.9, "miss_ms": 1.0}]
+
+    monkeypatch.setattr(run_store, "search_stats", search_stats)
+    policy = SearchPolicy()
+    asyncio.run(policy.refresh())
+    assert threads and threads[0] != threading.main_thread().name
+    assert ("general", "basic") in policy._history()
@@ -0,0 +1,11 @@
+from database.session import _load_metadata
+
+
+def test_load_metadata_undecodable_legacy_value_is_none():
+    # 匹配旧格式前缀但无法解密时，decrypt 按原样返回密文
+    assert _load_metadata("Z0FBQUFBbm90LWpzb24=") is None
+
+
+def test_load_metadata():
+    assert _load_metadata('{"trace_id": "t"}') == {"trace_id": "t"}
+    assert _load_metadata("") is None
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from aiohttp import web
+
+from utils import tavily
+from utils.tavily import TavilyClient, TavilyError
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(tavily, "BACKOFF_BASE", 0.01)
+
+
+async def _serve(responses):
+    """依次返回 responses 中的 (状态码, 头)，用完后返回 200；记录每次请求"""
+    requests = []
+
+    async def search(request):
+        requests.append((await request.json(), request.headers.get("Authorization")))
+        if len(requests) <= len(responses):
+            status, headers = responses[len(requests) - 1]
+            return web.Response(status=status, headers=headers, text="stub error")
+        return web.json_response({"results": [{"title": "t", "url": "u", "content": "c"}]})
+
+    app = web.Application()
+    app.router.add_post("/search", search)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}", requests
+
+
+def _run(responses, max_retries=2, **params):
+    async def main():
+        runner, url, requests = await _serve(responses)
+        client = TavilyClient("key", base_url=url, max_retries=max_retries, timeout=5)
+        start = time.monotonic()
+        try:
+            result = await client.search("q", **params)
+            error = None
+        except TavilyError as e:
+            result, error = None, e
+        finally:
+            await asyncio.to_thread(client.close)
+            await runner.cleanup()
+        return result, error, requests, time.monotonic() - start
+
+    return asyncio.run(main())
+
+
+def test_search_sends_payload_and_auth():
+    result, error, requests, _ = _run([], max_results=3, search_depth="basic")
+    assert error is None and result["results"][0]["title"] == "t"
+    payload, auth = requests[0]
+    assert payload == {"query": "q", "search_depth": "basic", "max_results": 3}
+    assert auth == "Bearer key"
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retries_rate_limit_and_server_errors(status):
+    result, error, requests, _ = _run([(status, {}), (status, {})])
+    assert error is None and result["results"]
+    assert len(requests) == 3
+
+
+def test_gives_up_after_max_retries():
+    _, error, requests, _ = _run([(503, {})] * 5, max_retries=2)
+    assert error is not None and error.status == 503
+    assert len(requests) == 3
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404])
+def test_no_retry_on_client_errors(status):
+    _, error, requests, _ = _run([(status, {})])
+    assert error is not None and error.status == status
+    assert len(requests) == 1
+
+
+def test_honours_retry_after():
+    result, error, requests, elapsed = _run([(429, {"Retry-After": "1"})])
+    assert error is None and len(requests) == 2
+    assert elapsed >= 1.0
+
+
+def test_search_sync_from_plain_thread():
+    async def start():
+        return await _serve([])
+
+    loop = asyncio.new_event_loop()
+    runner, url, requests = loop.run_until_complete(start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    client = TavilyClient("key", base_url=url, timeout=5)
+    try:
+        assert client.search_sync("q")["results"]
+        assert len(requests) == 1
+    finally:
+        client.close()
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def test_configured_key_without_client_is_logged(monkeypatch, caplog):
+    import sys
+
+    from utils import search_providers
+
+    monkeypatch.setitem(sys.modules, "utils.tavily", None)
+    monkeypatch.setattr(search_providers.tavily_config, "api_key", "key")
+    monkeypatch.setattr(search_providers, "SEARCH_PROVIDER", "tavily")
+    with caplog.at_level("ERROR"):
+        assert search_providers._create_provider() is None
+    assert "TAVILY_API_KEY is set" in caplog.text
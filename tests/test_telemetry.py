@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+
+from core import telemetry
+from core.telemetry import RunTrace, _usage_callback
+
+pytestmark = pytest.mark.skipif(
+    telemetry.UsageMetadataCallbackHandler is None,
+    reason="langchain-core without usage_metadata callback",
+)
+
+
+def test_detach_clears_callback_before_finish_on_other_thread(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(telemetry.run_store, "record", recorded.append)
+
+    trace = RunTrace("t-detach", "s", "basic")
+    assert _usage_callback.get() is trace._usage
+
+    trace.detach()
+    assert _usage_callback.get() is None
+
+    worker = threading.Thread(target=trace.finish)
+    worker.start()
+    worker.join()
+    assert _usage_callback.get() is None
+    assert recorded[0]["trace_id"] == "t-detach"
+
+
+def test_finish_restores_outer_trace_callback(monkeypatch):
+    monkeypatch.setattr(telemetry.run_store, "record", lambda run: None)
+    outer = RunTrace("t-outer", "s", "basic")
+    inner = RunTrace("t-inner", "s", "basic")
+    inner.finish()
+    assert _usage_callback.get() is outer._usage
+    outer.finish()
+    assert _usage_callback.get() is None
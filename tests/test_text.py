@@ -0,0 +1,18 @@
+from utils.text import tokenize
+
+
+def test_cjk_text_indexes_unigrams_and_bigrams():
+    assert tokenize("药品") == {"药": 1, "品": 1, "药品": 1}
+
+
+def test_single_char_query_matches_indexed_text():
+    indexed = tokenize("这种药品的副作用")
+    assert all(t in indexed for t in tokenize("药", query=True))
+
+
+def test_multi_char_query_uses_bigrams_only():
+    assert tokenize("药品价格", query=True) == {"药品": 1, "品价": 1, "价格": 1}
+
+
+def test_words_lowercased_and_single_letters_dropped():
+    assert tokenize("Python a 3 Rust") == {"python": 1, "3": 1, "rust": 1}
@@ -0,0 +1,43 @@
+import json
+import sqlite3
+from contextlib import contextmanager
+
+from database.migrations import MIGRATIONS
+from database.transfer import SessionExporter
+
+
+class MemoryShard:
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        for _, migrate in MIGRATIONS:
+            migrate(self.conn)
+
+    @contextmanager
+    def get_connection(self):
+        yield self.conn
+
+
+class MemoryStorage:
+    def __init__(self, shard):
+        self.shard = shard
+
+    def shard_for(self, session_id):
+        return self.shard
+
+
+def test_export_keeps_going_past_undecodable_metadata():
+    shard = MemoryShard()
+    # 旧格式 TEXT 值：无法解密时按原样返回，不是 JSON
+    shard.conn.executemany(
+        "INSERT INTO messages (session_id, role, content, metadata, created_at) "
+        "VALUES (?, ?, ?, ?, 0)",
+        [
+            ("s1", "user", "hello", "Z0FBQUFBbm90LWpzb24="),
+            ("s1", "assistant", "hi", '{"trace_id": "t"}'),
+        ],
+    )
+    exporter = SessionExporter()
+    exporter.storage = MemoryStorage(shard)
+    lines = [json.loads(line) for line in exporter.iter_session_lines("s1")]
+    assert [line["metadata"] for line in lines] == [None, {"trace_id": "t"}]
@@ -61,9 +61,9 @@ def render_sidebar():
                 # 获取摘要
                 summary = s.get("summary", "").strip()
                 if not summary:
-                    messages = session_mgr.get_messages(session_id, limit=1)
-                    if messages and messages[0]["role"] == "user":
-                        first_msg = messages[0]["content"]
+                    first = session_mgr.get_first_message(session_id)
+                    if first and first["role"] == "user":
+                        first_msg = first["content"]
                         summary = (
                             first_msg[:50] + "..." if len(first_msg) > 50 else first_msg
                         )
@@ -0,0 +1,248 @@
+"""本地文档库检索：由一个目录下的文档（内部文档、法规等）构建倒排索引，离线环境中替代网络搜索
+
+文档按段落切分为不超过 LOCAL_CORPUS_CHUNK_CHARS 的分块，每个分块是一个检索单元。
+索引是一个目录，除词表与文件列表（JSON）外都是定长数组，加载时以 memmap 只读打开，
+打分只读取查询词对应的倒排片段，分块正文在返回结果时才从 text.bin 中读取：
+
+    meta.json       版本、分块数、平均长度、构建时间与来源目录
+    terms.json      token -> [倒排起始位置, 文档频率]
+    postings.i32    按 token 连续存放的分块编号
+    tf.u16          与 postings 对应的词频
+    doclen.u32      每个分块的 token 数
+    chunk_file.i32  每个分块所属的文件
+    offsets.i64     分块正文在 text.bin 中的字节偏移（n + 1 个）
+    text.bin        UTF-8 正文
+    files.json      [标题, URL]
+
+用法:
+    python -m utils.corpus build DOCS_DIR [--index INDEX_DIR]
+    python -m utils.corpus search "关键词" [--index INDEX_DIR]
+
+构建与检索都不访问会话数据库。运行中的进程按 meta.json 的修改时间发现重建后的索引，
+下次检索时自动重新映射，无需重启。
+"""
+
+import argparse
+import json
+import logging
+import re
+import shutil
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config.settings import LOCAL_CORPUS_CHUNK_CHARS, LOCAL_CORPUS_INDEX
+from utils.text import chunk_paragraphs, tokenize
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DOC_SUFFIXES = {".md", ".markdown", ".txt", ".rst"}
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+
+_HEADING_RE = re.compile(r"^\s*#+\s*(.+?)\s*#*\s*$", re.M)
+
+
+def _title(path: Path, text: str) -> str:
+    """第一个 Markdown 标题，没有时用文件名"""
+    match = _HEADING_RE.search(text[:2000])
+    return match.group(1) if match else path.stem.replace("_", " ")
+
+
+def build_index(
+    docs_dir: Path,
+    index_dir: Path = LOCAL_CORPUS_INDEX,
+    chunk_chars: int = LOCAL_CORPUS_CHUNK_CHARS,
+) -> Dict[str, Any]:
+    """扫描 docs_dir 构建索引；先写入临时目录，完成后整体替换旧索引"""
+    docs_dir = Path(docs_dir).resolve()
+    index_dir = Path(index_dir)
+    files: List[List[str]] = []
+    chunk_file: List[int] = []
+    doclen: List[int] = []
+    texts: List[bytes] = []
+    postings: Dict[str, List[tuple]] = defaultdict(list)
+
+    for path in sorted(p for p in docs_dir.rglob("*") if p.suffix.lower() in DOC_SUFFIXES):
+        text = path.read_text(encoding="utf-8", errors="replace")
+        chunks = chunk_paragraphs(text, chunk_chars)
+        if not chunks:
+            continue
+        file_no = len(files)
+        files.append([_title(path, text), path.as_uri()])
+        for chunk in chunks:
+            chunk_no = len(texts)
+            counts = tokenize(chunk)
+            for term, count in counts.items():
+                postings[term].append((chunk_no, min(count, 0xFFFF)))
+            chunk_file.append(file_no)
+            doclen.append(sum(counts.values()))
+            texts.append(chunk.encode("utf-8"))
+
+    terms: Dict[str, List[int]] = {}
+    ids = np.empty(sum(len(p) for p in postings.values()), dtype=np.int32)
+    tf = np.empty(len(ids), dtype=np.uint16)
+    start = 0
+    for term in sorted(postings):
+        entries = postings[term]
+        ids[start : start + len(entries)] = [chunk_no for chunk_no, _ in entries]
+        tf[start : start + len(entries)] = [count for _, count in entries]
+        terms[term] = [start, len(entries)]
+        start += len(entries)
+
+    meta = {
+        "version": INDEX_VERSION,
+        "chunks": len(texts),
+        "files": len(files),
+        "avgdl": float(np.mean(doclen)) if doclen else 0.0,
+        "built_at": time.time(),
+        "source": str(docs_dir),
+    }
+
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    (tmp_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    (tmp_dir / "terms.json").write_text(json.dumps(terms, ensure_ascii=False), encoding="utf-8")
+    (tmp_dir / "files.json").write_text(json.dumps(files, ensure_ascii=False), encoding="utf-8")
+    ids.tofile(tmp_dir / "postings.i32")
+    tf.tofile(tmp_dir / "tf.u16")
+    np.asarray(doclen, dtype=np.uint32).tofile(tmp_dir / "doclen.u32")
+    np.asarray(chunk_file, dtype=np.int32).tofile(tmp_dir / "chunk_file.i32")
+    np.cumsum([0] + [len(t) for t in texts], dtype=np.int64).tofile(tmp_dir / "offsets.i64")
+    (tmp_dir / "text.bin").write_bytes(b"".join(texts))
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    tmp_dir.rename(index_dir)
+    logger.info(f"Corpus index built: {meta['files']} files, {meta['chunks']} chunks")
+    return meta
+
+
+def _memmap(path: Path, dtype) -> np.ndarray:
+    # 空文件无法 memmap
+    if path.stat().st_size == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class CorpusIndex:
+    def __init__(self, index_dir: Path = LOCAL_CORPUS_INDEX):
+        self.index_dir = Path(index_dir)
+        self._lock = threading.Lock()
+        self._loaded: Optional[Dict[str, Any]] = None
+        # 已加载索引的 meta.json 修改时间；重建后会变化
+        self._stamp: Optional[int] = None
+
+    def exists(self) -> bool:
+        return (self.index_dir / "meta.json").exists()
+
+    def _load(self) -> Dict[str, Any]:
+        # 重建时整个目录被替换：旧映射在关闭前仍然有效，新检索改用新索引
+        stamp = (self.index_dir / "meta.json").stat().st_mtime_ns
+        with self._lock:
+            if self._loaded is None or self._stamp != stamp:
+                root = self.index_dir
+                meta = json.loads((root / "meta.json").read_text(encoding="utf-8"))
+                if meta.get("version") != INDEX_VERSION:
+                    raise RuntimeError(
+                        f"Corpus index version {meta.get('version')} is not supported; rebuild it"
+                    )
+                self._loaded = {
+                    "meta": meta,
+                    "terms": json.loads((root / "terms.json").read_text(encoding="utf-8")),
+                    "files": json.loads((root / "files.json").read_text(encoding="utf-8")),
+                    "postings": _memmap(root / "postings.i32", np.int32),
+                    "tf": _memmap(root / "tf.u16", np.uint16),
+                    "doclen": _memmap(root / "doclen.u32", np.uint32),
+                    "chunk_file": _memmap(root / "chunk_file.i32", np.int32),
+                    "offsets": _memmap(root / "offsets.i64", np.int64),
+                    "text": _memmap(root / "text.bin", np.uint8),
+                }
+                self._stamp = stamp
+            return self._loaded
+
+    def reload(self):
+        """强制下次检索时重新映射（索引被原地修改、修改时间未变时使用）"""
+        with self._lock:
+            self._loaded = None
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        """BM25 检索，每个文件只返回得分最高的分块；结果形如 Tavily（title / url / content / score）"""
+        index = self._load()
+        n = index["meta"]["chunks"]
+        terms = [t for t in tokenize(query, query=True) if t in index["terms"]]
+        if not n or not terms:
+            return []
+
+        avgdl = max(index["meta"]["avgdl"], 1.0)
+        scores = np.zeros(n, dtype=np.float32)
+        for term in terms:
+            start, df = index["terms"][term]
+            ids = index["postings"][start : start + df]
+            tf = index["tf"][start : start + df].astype(np.float32)
+            idf = np.log1p((n - df + 0.5) / (df + 0.5))
+            norm = K1 * (1 - B + B * index["doclen"][ids] / avgdl)
+            # 同一 token 的倒排中分块编号不重复，可以直接按下标累加
+            scores[ids] += idf * tf * (K1 + 1) / (tf + norm)
+
+        # 各文件的最高分分块
+        matched = np.flatnonzero(scores)
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        best: List[int] = []
+        seen_files = set()
+        for chunk_no in matched:
+            file_no = int(index["chunk_file"][chunk_no])
+            if file_no in seen_files:
+                continue
+            seen_files.add(file_no)
+            best.append(int(chunk_no))
+            if len(best) >= max_results:
+                break
+
+        results = []
+        for chunk_no in best:
+            title, url = index["files"][int(index["chunk_file"][chunk_no])]
+            begin, end = index["offsets"][chunk_no], index["offsets"][chunk_no + 1]
+            results.append(
+                {
+                    "title": title,
+                    "url": url,
+                    "content": bytes(index["text"][begin:end]).decode("utf-8"),
+                    "score": round(float(scores[chunk_no]), 4),
+                }
+            )
+        return results
+
+
+corpus_index = CorpusIndex()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地文档库检索")
+    parser.add_argument("--index", type=Path, default=LOCAL_CORPUS_INDEX, help="索引目录")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("docs_dir", type=Path)
+    search = sub.add_parser("search")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        meta = build_index(args.docs_dir, args.index)
+        print(f"✓ 已索引 {meta['files']} 个文件、{meta['chunks']} 个分块 -> {args.index}")
+        return
+    for result in CorpusIndex(args.index).search(args.query, args.limit):
+        print(f"[{result['score']:.2f}] {result['title']}  {result['url']}")
+        print(f"    {result['content'][:120]}")
+
+
+if __name__ == "__main__":
+    main()
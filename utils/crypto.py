@@ -1,7 +1,233 @@
 import base64
+import binascii
+import codecs
+import hmac
+import io
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-from cryptography.fernet import Fernet
+from config.settings import (
+    DATA_KEY_CACHE_SIZE,
+    DECRYPT_BATCH_SIZE,
+    DECRYPT_WORKERS,
+    STORAGE_CIPHER,
+    STORAGE_COMPRESSION_THRESHOLD,
+)
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+logger = logging.getLogger(__name__)
+
+# 存储格式版本（BLOB 首字节）。TEXT 类型的值均为未标记的旧格式：
+# base64(Fernet token) 或未加密的明文，由 database.backfill 一次性标记
+FORMAT_PLAIN = 0x00  # [版本] + UTF-8 明文（加密失败时的降级存储）
+FORMAT_V2 = 0x02  # [版本][标志位] + 原始 Fernet 二进制（不再做 base64）
+FORMAT_V3 = 0x03  # [版本][标志位][算法] + nonce + AEAD 密文（会话数据密钥）
+
+HEADER_SIZE = 2
+V3_HEADER_SIZE = 3
+NONCE_SIZE = 12
+
+# 盲化检索 token 的长度（HMAC-SHA256 截断）；碰撞只会带来少量误命中
+BLIND_TOKEN_SIZE = 8
+
+# 旧格式 base64(Fernet token) 的固定前缀：token 以版本字节 0x80 和时间戳高位零字节开头，
+# 即 "gAAAAA"，再做一次 base64 得到该前缀。据此区分明文，无需尝试解密
+LEGACY_PREFIX = "Z0FBQUFB"
+
+# 标志位：明文在加密前的压缩算法
+FLAG_ZLIB = 0x01
+FLAG_ZSTD = 0x02
+COMPRESSION_FLAGS = FLAG_ZLIB | FLAG_ZSTD
+
+
+# AEAD 算法注册表: 算法 ID -> (名称, 构造函数)，ID 写入 V3 格式头，已分配的 ID 不得复用
+CIPHERS: Dict[int, Tuple[str, Callable[[bytes], object]]] = {
+    0x01: ("aes-gcm", AESGCM),
+    0x02: ("chacha20-poly1305", ChaCha20Poly1305),
+}
+
+
+def register_cipher(cipher_id: int, name: str, factory: Callable[[bytes], object]):
+    """注册 AEAD 实现（需提供 encrypt/decrypt(nonce, data, aad)，接受 32 字节密钥）"""
+    if cipher_id in CIPHERS:
+        raise ValueError(f"算法 ID 已被占用: {cipher_id}")
+    CIPHERS[cipher_id] = (name, factory)
+
+
+def cipher_id_for(name: str) -> int:
+    for cipher_id, (cipher_name, _) in CIPHERS.items():
+        if cipher_name == name:
+            return cipher_id
+    raise ValueError(f"未知的加密算法: {name}")
+
+
+def compress(data: bytes) -> Tuple[int, bytes]:
+    """超过阈值时压缩（优先 zstd），返回 (标志位, 数据)；压缩无收益则保持原样"""
+    if len(data) < STORAGE_COMPRESSION_THRESHOLD:
+        return 0, data
+    if zstd is not None:
+        flag, packed = FLAG_ZSTD, zstd.ZstdCompressor(level=3).compress(data)
+    else:
+        flag, packed = FLAG_ZLIB, zlib.compress(data, 6)
+    if len(packed) >= len(data):
+        return 0, data
+    return flag, packed
+
+
+def decompress(flags: int, data: bytes) -> bytes:
+    algo = flags & COMPRESSION_FLAGS
+    if algo == FLAG_ZLIB:
+        return zlib.decompress(data)
+    if algo == FLAG_ZSTD:
+        if zstd is None:
+            raise RuntimeError("数据使用 zstd 压缩，但未安装 zstandard")
+        return zstd.ZstdDecompressor().decompress(data)
+    return data
+
+
+def iter_decompress(
+    flags: int, data: bytes, chunk_size: int = 64 * 1024
+) -> Iterator[bytes]:
+    """分块解压，每次产出不超过 chunk_size 字节，避免一次性展开大对象"""
+    algo = flags & COMPRESSION_FLAGS
+    if algo == FLAG_ZLIB:
+        decompressor = zlib.decompressobj()
+        pending = data
+        while not decompressor.eof:
+            # max_length 限制单次输出；未处理的输入留在 unconsumed_tail 中
+            chunk = decompressor.decompress(pending, chunk_size)
+            pending = decompressor.unconsumed_tail
+            if chunk:
+                yield chunk
+            elif not pending:
+                break  # 输入已耗尽（数据被截断）
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+    elif algo == FLAG_ZSTD:
+        if zstd is None:
+            raise RuntimeError("数据使用 zstd 压缩，但未安装 zstandard")
+        with zstd.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+            while True:
+                chunk = reader.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    else:
+        for i in range(0, len(data), chunk_size):
+            yield data[i : i + chunk_size]
+
+
+def derive_key(master_key: bytes, info: bytes) -> bytes:
+    """由主密钥派生用途独立的子密钥"""
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(
+        master_key
+    )
+
+
+class DataKeyNotFound(LookupError):
+    """解密时会话数据密钥不存在（密钥记录丢失或数据来自其他库）"""
+
+
+class DataKeyStore(Protocol):
+    """会话数据密钥（已包装）的持久化接口"""
+
+    def load(self, session_id: str) -> Optional[bytes]: ...
+
+    def save(self, session_id: str, wrapped_key: bytes) -> bytes:
+        """保存包装后的密钥并返回最终生效的值（并发创建时以先写入者为准）"""
+        ...
+
+
+class KeyRing:
+    """信封加密: 每个会话一个数据密钥，由主密钥派生的 KEK 包装后持久化，
+    解包后的密钥及其 AEAD 实例缓存在 LRU 中"""
+
+    def __init__(self, master_key: bytes, capacity: int = DATA_KEY_CACHE_SIZE):
+        self._kek = AESGCM(derive_key(master_key, b"agenticai/session-data-key-wrap"))
+        self._capacity = capacity
+        self._cache: "OrderedDict[str, Dict[int, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.store: Optional[DataKeyStore] = None
+
+    def cipher(self, session_id: str, cipher_id: int, create: bool = False):
+        """返回该会话数据密钥对应算法的 AEAD 实例
+
+        只有加密路径传 create=True：密钥不存在时生成并持久化。解密路径不会创建密钥，
+        缺失时抛出 DataKeyNotFound（新生成的密钥必然无法通过认证，还会留下无效记录）。
+        """
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None:
+                self._cache.move_to_end(session_id)
+                aead = entry.get(cipher_id)
+                if aead is not None:
+                    return aead
+
+        if entry is None:
+            key = self._load_or_create(session_id) if create else self._load(session_id)
+            entry = {0: key}
+        aead = CIPHERS[cipher_id][1](entry[0])
+        entry[cipher_id] = aead
+
+        with self._lock:
+            self._cache[session_id] = entry
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self._capacity:
+                self._cache.popitem(last=False)
+        return aead
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def _load(self, session_id: str) -> bytes:
+        wrapped = self.store.load(session_id)
+        if wrapped is None:
+            raise DataKeyNotFound(f"会话数据密钥不存在: {session_id}")
+        return self._unwrap(session_id, wrapped)
+
+    def _load_or_create(self, session_id: str) -> bytes:
+        wrapped = self.store.load(session_id)
+        if wrapped is None:
+            key = AESGCM.generate_key(bit_length=256)
+            wrapped = self.store.save(session_id, self._wrap(session_id, key))
+        return self._unwrap(session_id, wrapped)
+
+    def _wrap(self, session_id: str, key: bytes) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._kek.encrypt(nonce, key, session_id.encode("utf-8"))
+
+    def _unwrap(self, session_id: str, wrapped: bytes) -> bytes:
+        wrapped = bytes(wrapped)
+        return self._kek.decrypt(
+            wrapped[:NONCE_SIZE], wrapped[NONCE_SIZE:], session_id.encode("utf-8")
+        )
 
 
 class ContentEncryptor:
@@ -10,6 +236,17 @@ class ContentEncryptor:
     def __init__(self):
         self.key = self._get_or_create_key()
         self.cipher = Fernet(self.key)
+        master_key = base64.urlsafe_b64decode(self.key)
+        self.keyring = KeyRing(master_key)
+        self._blind_key = derive_key(master_key, b"agenticai/search-blind-index")
+        self._digest_key = derive_key(master_key, b"agenticai/artifact-content-address")
+        self.cipher_id = cipher_id_for(STORAGE_CIPHER)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def set_key_store(self, store: DataKeyStore):
+        """启用信封加密：之后带 session_id 的写入使用会话数据密钥 + AEAD"""
+        self.keyring.store = store
 
     def _get_or_create_key(self) -> bytes:
         """获取或创建加密密钥"""
@@ -33,28 +270,202 @@ class ContentEncryptor:
             return key
 
     def encrypt(self, text: str) -> str:
-        """加密文本"""
+        """加密文本（旧格式，仅用于兼容）"""
         if not text:
             return ""
         try:
             encrypted = self.cipher.encrypt(text.encode("utf-8"))
             return base64.b64encode(encrypted).decode("utf-8")
         except Exception as e:
-            print(f"加密失败: {e}")
+            logger.error(f"Encryption failed, storing plaintext: {e}")
             return text
 
     def decrypt(self, encrypted_text: str) -> str:
-        """解密文本"""
+        """解密文本（旧格式）：按前缀区分加密数据与明文（向后兼容）"""
         if not encrypted_text:
             return ""
+        if not encrypted_text.startswith(LEGACY_PREFIX):
+            return encrypted_text
         try:
             encrypted = base64.b64decode(encrypted_text.encode("utf-8"))
-            decrypted = self.cipher.decrypt(encrypted)
-            return decrypted.decode("utf-8")
-        except Exception:
-            # 如果解密失败，可能是明文数据（向后兼容）
+            return self.cipher.decrypt(encrypted).decode("utf-8")
+        except (binascii.Error, InvalidToken):
+            # 前缀相同的明文或损坏的密文，按原样返回
             return encrypted_text
 
+    def tag_legacy(self, text: str, session_id: Optional[str] = None) -> bytes:
+        """将未标记的旧格式 TEXT 值转换为带格式头的 BLOB
+
+        旧 Fernet 密文校验后直接加上 V2 格式头（不重新加密），明文则正常加密。
+        """
+        if not text:
+            return b""
+        if text.startswith(LEGACY_PREFIX):
+            try:
+                token = base64.b64decode(text.encode("utf-8"))
+                self.cipher.decrypt(token)  # 校验 HMAC，避免把明文误判为密文
+                return bytes((FORMAT_V2, 0)) + base64.urlsafe_b64decode(token)
+            except (binascii.Error, InvalidToken):
+                pass
+        return self.encrypt_bytes(text, session_id)
+
+    def blind_token(self, token: str) -> bytes:
+        """检索 token 的带密钥 HMAC：不泄露明文，相同 token 总是得到相同值"""
+        return hmac.digest(self._blind_key, token.encode("utf-8"), "sha256")[
+            :BLIND_TOKEN_SIZE
+        ]
+
+    def content_digest(self, text: str) -> bytes:
+        """内容寻址用的带密钥摘要：相同内容得到相同地址，无主密钥时无法按内容比对"""
+        return hmac.digest(self._digest_key, text.encode("utf-8"), "sha256")
+
+    def encrypt_bytes(self, text: str, session_id: Optional[str] = None) -> bytes:
+        """加密文本为 BLOB 存储格式（大文本先压缩）
+
+        提供 session_id 且已配置密钥存储时使用 V3（会话数据密钥 + AEAD），
+        否则使用 V2（主密钥 Fernet）。V3 的密钥读取、创建与持久化失败（如数据库锁超时）
+        直接抛给调用方：降级为明文写入后，回填任务不会再加密 BLOB 值。
+        """
+        if not text:
+            return b""
+        flags, data = compress(text.encode("utf-8"))
+        if session_id and self.keyring.store is not None:
+            header = bytes((FORMAT_V3, flags, self.cipher_id))
+            nonce = os.urandom(NONCE_SIZE)
+            aead = self.keyring.cipher(session_id, self.cipher_id, create=True)
+            return (
+                header
+                + nonce
+                + aead.encrypt(nonce, data, header + session_id.encode("utf-8"))
+            )
+        try:
+            token = self.cipher.encrypt(data)
+        except Exception as e:
+            # 与旧版 encrypt 相同：主密钥加密失败时按明文存储
+            logger.error(f"Encryption failed, storing plaintext: {e}")
+            return bytes((FORMAT_PLAIN,)) + text.encode("utf-8")
+        return bytes((FORMAT_V2, flags)) + base64.urlsafe_b64decode(token)
+
+    def decrypt_value(
+        self,
+        value: Union[bytes, memoryview, str, None],
+        session_id: Optional[str] = None,
+    ) -> str:
+        """解密数据库中读取的值，按格式头分派，正常数据不经过异常路径（TEXT 为旧格式）"""
+        if not value:
+            return ""
+        if isinstance(value, str):
+            return self.decrypt(value)
+
+        flags, data = self._open(value, session_id)
+        return decompress(flags, data).decode("utf-8")
+
+    def decrypt_many(
+        self,
+        values: Sequence[Union[bytes, memoryview, str, None]],
+        session_id: Union[str, Sequence[Optional[str]], None] = None,
+        batch_size: int = DECRYPT_BATCH_SIZE,
+    ) -> List[str]:
+        """批量解密，超过一个批次时按批分发到线程池（cryptography 在加解密时释放 GIL）
+
+        session_id 可以是单个会话 ID，也可以是与 values 一一对应的序列。
+        """
+        return self._map_batched(self.decrypt_value, values, session_id, batch_size)
+
+    def encrypt_many(
+        self,
+        texts: Sequence[str],
+        session_id: Union[str, Sequence[Optional[str]], None] = None,
+        batch_size: int = DECRYPT_BATCH_SIZE,
+    ) -> List[bytes]:
+        """批量加密（导入等批量写入场景），参数同 decrypt_many"""
+        return self._map_batched(self.encrypt_bytes, texts, session_id, batch_size)
+
+    def _map_batched(self, fn, values, session_id, batch_size: int) -> list:
+        if session_id is None or isinstance(session_id, str):
+            session_ids: Sequence[Optional[str]] = [session_id] * len(values)
+        else:
+            session_ids = session_id
+
+        if len(values) <= batch_size or DECRYPT_WORKERS <= 1:
+            return [fn(v, sid) for v, sid in zip(values, session_ids)]
+
+        def _run(start: int) -> list:
+            return [
+                fn(values[i], session_ids[i])
+                for i in range(start, min(start + batch_size, len(values)))
+            ]
+
+        results = []
+        for part in self._executor().map(_run, range(0, len(values), batch_size)):
+            results.extend(part)
+        return results
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=DECRYPT_WORKERS, thread_name_prefix="crypto"
+                )
+            return self._pool
+
+    def iter_decrypt_value(
+        self,
+        value: Union[bytes, memoryview, str, None],
+        session_id: Optional[str] = None,
+        chunk_size: int = 64 * 1024,
+    ) -> Iterator[str]:
+        """流式解密：分块解压并增量解码，用于导出等大对象场景"""
+        if not value:
+            return
+        if isinstance(value, str):
+            yield self.decrypt(value)
+            return
+
+        flags, data = self._open(value, session_id)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for chunk in iter_decompress(flags, data, chunk_size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def _open(
+        self, value: Union[bytes, memoryview], session_id: Optional[str]
+    ) -> Tuple[int, bytes]:
+        """校验格式头并解密，返回 (标志位, 可能已压缩的明文)"""
+        data = bytes(value)
+        version = data[0]
+        if version == FORMAT_PLAIN:
+            return 0, data[1:]
+        try:
+            if version == FORMAT_V3:
+                if not session_id:
+                    raise ValueError("V3 格式解密需要 session_id")
+                if data[2] not in CIPHERS:
+                    raise ValueError(f"未知的加密算法 ID: {data[2]}")
+                header = data[:V3_HEADER_SIZE]
+                nonce = data[V3_HEADER_SIZE : V3_HEADER_SIZE + NONCE_SIZE]
+                aead = self.keyring.cipher(session_id, data[2])
+                plain = aead.decrypt(
+                    nonce,
+                    data[V3_HEADER_SIZE + NONCE_SIZE :],
+                    header + session_id.encode("utf-8"),
+                )
+                return data[1], plain
+            if version == FORMAT_V2:
+                token = base64.urlsafe_b64encode(data[HEADER_SIZE:])
+                return data[1], self.cipher.decrypt(token)
+        except (InvalidToken, InvalidTag):
+            logger.warning("Decryption failed: ciphertext corrupted or key mismatch")
+            return 0, b""
+        except DataKeyNotFound as e:
+            logger.warning(f"Decryption failed: {e}")
+            return 0, b""
+        raise ValueError(f"未知的存储格式版本: {version}")
+
 
 # 全局加密器实例
 encryptor = ContentEncryptor()
@@ -0,0 +1,91 @@
+"""网络搜索后端
+
+WebSearchAgent 只依赖 SearchProvider 接口，返回与 Tavily 相同的结构：
+{"query": ..., "results": [{"title", "url", "content", "score"}, ...]}。
+SEARCH_PROVIDER 选择后端：tavily（默认）或 local（本地文档库，离线环境与基准测试使用）。
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Protocol
+
+from config.settings import SEARCH_PROVIDER, tavily_config
+
+from utils.corpus import CorpusIndex, corpus_index
+
+logger = logging.getLogger(__name__)
+
+
+class SearchProvider(Protocol):
+    # 后端名称（写入缓存键，不同后端的结果互不混用）
+    name: str
+    # 结果是否写入搜索缓存（本地检索比查缓存还快，不需要缓存）
+    cacheable: bool
+
+    async def search(self, query: str, **params) -> Dict[str, Any]:
+        """异步搜索（可在任意事件循环中 await）"""
+        ...
+
+    def search_sync(self, query: str, **params) -> Dict[str, Any]:
+        """同步搜索（后台刷新缓存等同步调用方）"""
+        ...
+
+
+class TavilyProvider:
+    name = "tavily"
+    cacheable = True
+
+    def __init__(self, client):
+        self.client = client
+
+    async def search(self, query: str, **params) -> Dict[str, Any]:
+        return await self.client.search(query, **params)
+
+    def search_sync(self, query: str, **params) -> Dict[str, Any]:
+        return self.client.search_sync(query, **params)
+
+
+class LocalCorpusProvider:
+    """本地文档库（python -m utils.corpus build 生成的索引）；只使用 max_results 参数"""
+
+    name = "local"
+    cacheable = False
+
+    def __init__(self, index: CorpusIndex):
+        self.index = index
+
+    async def search(self, query: str, **params) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.search_sync, query, **params)
+
+    def search_sync(self, query: str, **params) -> Dict[str, Any]:
+        return {
+            "query": query,
+            "results": self.index.search(query, params.get("max_results", 5)),
+        }
+
+
+SEARCH_PROVIDERS = ("tavily", "local")
+
+
+def _create_provider() -> Optional[SearchProvider]:
+    if SEARCH_PROVIDER not in SEARCH_PROVIDERS:
+        raise ValueError(
+            f"Unknown SEARCH_PROVIDER: {SEARCH_PROVIDER!r} (expected one of {SEARCH_PROVIDERS})"
+        )
+    if SEARCH_PROVIDER == "local":
+        if not corpus_index.exists():
+            logger.warning(f"Local corpus index not found: {corpus_index.index_dir}")
+            return None
+        return LocalCorpusProvider(corpus_index)
+
+    try:
+        from utils.tavily import tavily_client
+    except ImportError as e:
+        # 配置了密钥却无法使用时必须显式报错，否则网络搜索会静默变成"未配置"
+        if tavily_config.is_configured:
+            logger.error(f"TAVILY_API_KEY is set but the Tavily client cannot be loaded: {e}")
+        return None
+    return TavilyProvider(tavily_client) if tavily_client else None
+
+
+search_provider = _create_provider()
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import random
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from config.settings import (
+    TAVILY_BASE_URL,
+    TAVILY_CONNECT_TIMEOUT,
+    TAVILY_MAX_CONCURRENCY,
+    TAVILY_MAX_RETRIES,
+    TAVILY_SEARCH_DEPTH,
+    TAVILY_TIMEOUT,
+    tavily_config,
+)
+
+logger = logging.getLogger(__name__)
+
+# 限流与服务端错误可以重试，其他 4xx（如密钥无效）直接失败
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+
+class TavilyError(RuntimeError):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class TavilyClient:
+    """Tavily 搜索的异步客户端
+
+    HTTP 会话、连接池与并发信号量都属于客户端自己的后台事件循环（"tavily" 线程）：
+    aiohttp 会话不能跨事件循环使用，而调用方既有 LangGraph 的同步节点，也有每轮一次
+    asyncio.run 的流式管线，循环随时可能被关闭。调用通过 run_coroutine_threadsafe
+    提交到后台循环，async 调用方不会阻塞自己的事件循环，同步调用方阻塞等待结果。
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = TAVILY_BASE_URL,
+        timeout: float = TAVILY_TIMEOUT,
+        connect_timeout: float = TAVILY_CONNECT_TIMEOUT,
+        max_retries: int = TAVILY_MAX_RETRIES,
+        max_concurrency: int = TAVILY_MAX_CONCURRENCY,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = aiohttp.ClientTimeout(
+            total=timeout, sock_connect=connect_timeout
+        )
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="tavily", daemon=True
+                ).start()
+                self._loop = loop
+            return self._loop
+
+    def _submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # 只在后台循环中调用，无需加锁
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_concurrency, keepalive_timeout=60
+                ),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def search(self, query: str, **params) -> Dict[str, Any]:
+        """异步搜索（可在任意事件循环中 await）"""
+        return await asyncio.wrap_future(self._submit(self._search(query, params)))
+
+    def search_sync(self, query: str, **params) -> Dict[str, Any]:
+        """同步搜索（LangGraph 节点等同步调用方）"""
+        return self._submit(self._search(query, params)).result()
+
+    async def _search(self, query: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        payload = {"query": query, "search_depth": TAVILY_SEARCH_DEPTH, **params}
+        session = await self._get_session()
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    async with session.post(
+                        f"{self.base_url}/search", json=payload
+                    ) as response:
+                        if response.status == 200:
+                            return await response.json()
+                        body = await response.text()
+                        error = TavilyError(
+                            f"Tavily search failed: HTTP {response.status}: {body[:200]}",
+                            response.status,
+                        )
+                        retry_after = response.headers.get("Retry-After")
+                if response.status not in RETRY_STATUS:
+                    raise error
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = TavilyError(f"Tavily search failed: {type(e).__name__}: {e}")
+                retry_after = None
+
+            if attempt >= self.max_retries:
+                raise error
+            # 指数退避加随机抖动；服务端给出 Retry-After 时以其为准
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt) * random.uniform(0.5, 1.5)
+            if retry_after and retry_after.isdigit():
+                delay = min(BACKOFF_MAX, float(retry_after))
+            attempt += 1
+            logger.warning(f"{error}; retry {attempt}/{self.max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._session is not None:
+            self._submit(self._session.close()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+        self._session = None
+
+
+tavily_client = (
+    TavilyClient(tavily_config.api_key) if tavily_config.is_configured else None
+)
@@ -0,0 +1,51 @@
+"""文本切分与分词（只依赖标准库，可在不加载数据库与配置的情况下使用）"""
+
+import re
+import unicodedata
+from collections import Counter
+from typing import List
+
+# 平假名 / 片假名、CJK 统一表意文字（含扩展 A、兼容区）、韩文音节
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(f"([{_CJK}]+)|([^\\W_{_CJK}]+)")
+
+
+def tokenize(text: str, query: bool = False) -> Counter:
+    """NFKC 归一化后分词：CJK 连续片段取单字与二元组，其他取小写单词
+
+    查询（query=True）中的多字 CJK 片段只取二元组，单字片段取单字：
+    被索引文本同时含有单字，单字查询（如"药"）也能命中多字文本。
+    """
+    counts: Counter = Counter()
+    for cjk, word in _TOKEN_RE.findall(unicodedata.normalize("NFKC", text).lower()):
+        if cjk:
+            if len(cjk) == 1 or not query:
+                counts.update(cjk)
+            if len(cjk) > 1:
+                counts.update(cjk[i : i + 2] for i in range(len(cjk) - 1))
+        elif len(word) > 1 or word.isdigit():
+            counts[word] += 1
+    return counts
+
+
+def chunk_paragraphs(text: str, max_chars: int) -> List[str]:
+    """按段落合并为不超过 max_chars 的分块；超长段落按长度硬切"""
+    chunks: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks